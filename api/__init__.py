@@ -4,7 +4,10 @@
 API模块初始化文件
 """
 
-from flask import Blueprint
+import os
+import re
+
+from flask import Blueprint, current_app, g, request
 
 # 创建API蓝图
 api_bp = Blueprint('api', __name__, url_prefix='/api')
@@ -16,6 +19,9 @@ from . import fortune
 from . import constellation
 from . import message
 from . import info
+from . import scheduler
+
+from deadline import activate, deactivate
 
 # 注册子蓝图
 api_bp.register_blueprint(health.health_bp)
@@ -23,4 +29,68 @@ api_bp.register_blueprint(weather.weather_bp)
 api_bp.register_blueprint(fortune.fortune_bp)
 api_bp.register_blueprint(constellation.constellation_bp)
 api_bp.register_blueprint(message.message_bp)
-api_bp.register_blueprint(info.info_bp)
\ No newline at end of file
+api_bp.register_blueprint(info.info_bp)
+api_bp.register_blueprint(scheduler.scheduler_bp)
+
+# 请求时间预算（秒）：未单独配置的接口使用 REQUEST_DEADLINE_SECONDS，
+# 调用方可通过 X-Request-Timeout 请求头（秒）指定，不超过 REQUEST_DEADLINE_MAX_SECONDS
+DEFAULT_REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE_SECONDS', '30'))
+MAX_REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE_MAX_SECONDS', '120'))
+DEADLINE_HEADER = 'X-Request-Timeout'
+ENDPOINT_DEADLINES = {
+    'api.message.send_daily_message': 45,
+    'api.message.broadcast_message': 45,
+    'api.message.regenerate_daily_message': 45,
+    'api.message.preview_daily_message': 30,
+    'api.message.send_weather_message': 15,
+    'api.message.send_fortune_message': 15,
+    'api.message.send_lunch_message': 15
+}
+
+
+@api_bp.before_request
+def start_request_deadline():
+    """为本次请求设置时间预算"""
+    budget = ENDPOINT_DEADLINES.get(request.endpoint, DEFAULT_REQUEST_DEADLINE)
+    header = request.headers.get(DEADLINE_HEADER)
+    if header:
+        try:
+            budget = min(max(float(header), 0.1), MAX_REQUEST_DEADLINE)
+        except ValueError:
+            pass
+    g.request_deadline, g.request_deadline_token = activate(budget)
+
+
+@api_bp.after_request
+def report_request_deadline(response):
+    """在响应中报告时间预算使用情况：Server-Timing 响应头，JSON响应另附 timing 字段"""
+    deadline = g.get('request_deadline')
+    if deadline is None:
+        return response
+    report = deadline.report()
+
+    totals = {}
+    for span in report['spans']:
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', span['name'])
+        totals[name] = totals.get(name, 0) + span['elapsed_ms']
+    metrics = [f"{name};dur={round(elapsed, 1)}" for name, elapsed in totals.items()]
+    metrics.append(f"total;dur={report['elapsed_ms']}")
+    response.headers['Server-Timing'] = ', '.join(metrics)
+
+    if response.is_json and not response.is_streamed:
+        data = response.get_json(silent=True)
+        if isinstance(data, dict):
+            data['timing'] = report
+            response.set_data(current_app.json.dumps(data))
+    return response
+
+
+@api_bp.teardown_request
+def end_request_deadline(error=None):
+    """清除本次请求的时间预算"""
+    token = g.pop('request_deadline_token', None)
+    if token is not None:
+        try:
+            deactivate(token)
+        except ValueError:
+            pass  # 不在设置预算的上下文中（如响应在其他上下文中结束），无需恢复
@@ -14,43 +14,19 @@ sys.path.insert(0, project_root)
 
 constellation_bp = Blueprint('constellation', __name__, url_prefix='/constellation')
 
-# 星座列表
-CONSTELLATIONS = [
-    '白羊座', '金牛座', '双子座', '巨蟹座', '狮子座', '处女座',
-    '天秤座', '天蝎座', '射手座', '摩羯座', '水瓶座', '双鱼座'
-]
+# 星座列表与英文到中文星座名称映射（统一来自星座表）
+from constellations import CONSTELLATIONS, CONSTELLATION_MAP, normalize_sign_id, sign_name
 
-# 英文到中文星座名称映射
-CONSTELLATION_MAP = {
-    'aries': '白羊座',
-    'taurus': '金牛座', 
-    'gemini': '双子座',
-    'cancer': '巨蟹座',
-    'leo': '狮子座',
-    'virgo': '处女座',
-    'libra': '天秤座',
-    'scorpio': '天蝎座',
-    'sagittarius': '射手座',
-    'capricorn': '摩羯座',
-    'aquarius': '水瓶座',
-    'pisces': '双鱼座'
-}
+# 批量获取的默认等待时间和最大等待时间（秒）
+BATCH_TIMEOUT = 8
+BATCH_MAX_TIMEOUT = 30
 
 def normalize_constellation_name(sign):
-    """标准化星座名称，支持中英文"""
-    if not sign:
+    """标准化星座名称，支持中英文，返回中文名称"""
+    sign_id = normalize_sign_id(sign)
+    if not sign_id:
         return None
-    
-    # 如果是中文名称，直接返回
-    if sign in CONSTELLATIONS:
-        return sign
-    
-    # 如果是英文名称，转换为中文
-    sign_lower = sign.lower()
-    if sign_lower in CONSTELLATION_MAP:
-        return CONSTELLATION_MAP[sign_lower]
-    
-    return None
+    return sign_name(sign_id)
 
 @constellation_bp.route('/', methods=['GET'])
 def get_constellation():
@@ -156,7 +132,12 @@ def get_today_constellation():
 
 @constellation_bp.route('/batch', methods=['POST'])
 def get_batch_constellation():
-    """批量获取多个星座运势"""
+    """批量获取多个星座运势
+    
+    请求体：
+    - signs: 星座列表（支持中英文），或 "all" 表示全部星座并触发当天全量后台预热
+    - timeout: 等待时间（秒，可选），超时未完成的星座在 pending 中返回，后台继续获取
+    """
     try:
         from wework_bot import bot
         
@@ -169,14 +150,17 @@ def get_batch_constellation():
             }), 400
         
         signs = data['signs']
-        if not isinstance(signs, list):
+        prewarm_all = signs == 'all'
+        if prewarm_all:
+            signs = CONSTELLATIONS
+        elif not isinstance(signs, list):
             return jsonify({
                 'success': False,
                 'error': '星座列表必须是数组格式'
             }), 400
         
         # 验证星座名称
-        invalid_signs = [sign for sign in signs if sign not in CONSTELLATIONS]
+        invalid_signs = [sign for sign in signs if not normalize_sign_id(sign)]
         if invalid_signs:
             return jsonify({
                 'success': False,
@@ -184,24 +168,30 @@ def get_batch_constellation():
                 'available_signs': CONSTELLATIONS
             }), 400
         
-        # 批量获取星座运势
-        results = {}
-        errors = {}
+        try:
+            timeout = min(float(data.get('timeout', BATCH_TIMEOUT)), BATCH_MAX_TIMEOUT)
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'timeout 必须是数字'
+            }), 400
         
-        for sign in signs:
-            try:
-                constellation_data = bot.get_constellation_fortune_structured(sign)
-                results[sign] = constellation_data
-            except Exception as e:
-                errors[sign] = str(e)
+        if prewarm_all:
+            bot.prewarm_constellations()
+        
+        # 并发获取星座运势
+        results, errors, pending = bot.fetch_constellations(signs, timeout=max(timeout, 0))
         
         response_data = {
             'success': True,
-            'data': results
+            'data': {sign_name(sign_id): record for sign_id, record in results.items()}
         }
         
         if errors:
-            response_data['errors'] = errors
+            response_data['errors'] = {sign_name(sign_id): error for sign_id, error in errors.items()}
+        if pending:
+            response_data['pending'] = [sign_name(sign_id) for sign_id in pending]
+        if errors or pending:
             response_data['partial_success'] = True
         
         return jsonify(response_data)
@@ -210,4 +200,4 @@ def get_batch_constellation():
         return jsonify({
             'success': False,
             'error': f'批量获取星座运势失败: {str(e)}'
-        }), 500
\ No newline at end of file
+        }), 500
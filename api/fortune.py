@@ -26,20 +26,22 @@ def get_fortune():
         format_type = request.args.get('format', 'structured')  # structured 或 text
         
         if format_type == 'structured':
-            fortune_data = bot.get_today_fortune_structured()
+            fortune_data, freshness = bot.get_almanac_view('structured', with_freshness=True)
             return jsonify({
                 'success': True,
                 'data': fortune_data,
-                'format': 'structured'
+                'format': 'structured',
+                'freshness': freshness
             })
         else:
-            fortune_text = bot.get_today_fortune()
+            fortune_text, freshness = bot.get_almanac_view('text', with_freshness=True)
             return jsonify({
                 'success': True,
                 'data': {
                     'fortune_text': fortune_text
                 },
-                'format': 'text'
+                'format': 'text',
+                'freshness': freshness
             })
             
     except Exception as e:
@@ -54,11 +56,12 @@ def get_today_fortune():
     try:
         from wework_bot import bot
         
-        fortune_data = bot.get_today_fortune_structured()
+        fortune_data, freshness = bot.get_almanac_view('structured', with_freshness=True)
         return jsonify({
             'success': True,
             'data': fortune_data,
-            'date': datetime.now().strftime('%Y-%m-%d')
+            'date': datetime.now().strftime('%Y-%m-%d'),
+            'freshness': freshness
         })
         
     except Exception as e:
@@ -73,21 +76,14 @@ def get_almanac_info():
     try:
         from wework_bot import bot
         
-        # 获取结构化的老黄历数据
-        fortune_data = bot.get_today_fortune_structured()
-        
-        # 提取详细信息
-        almanac_info = {
-            'date_info': fortune_data.get('date_info', {}),
-            'fortune_info': fortune_data.get('fortune_info', {}),
-            'wuxing_info': fortune_data.get('wuxing_info', {}),
-            'festival_info': fortune_data.get('festival_info', {})
-        }
+        # 详细信息视图（由当日老黄历记录派生）
+        almanac_info, freshness = bot.get_almanac_view('almanac', with_freshness=True)
         
         return jsonify({
             'success': True,
             'data': almanac_info,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now().isoformat(),
+            'freshness': freshness
         })
         
     except Exception as e:
@@ -102,20 +98,14 @@ def get_simple_fortune():
     try:
         from wework_bot import bot
         
-        fortune_data = bot.get_today_fortune_structured()
-        
-        # 提取简化信息
-        simple_info = {
-            'lunar_date': fortune_data.get('date_info', {}).get('lunar_formatted', ''),
-            'fitness': fortune_data.get('fortune_info', {}).get('fitness', ''),
-            'taboo': fortune_data.get('fortune_info', {}).get('taboo', ''),
-            'festival': fortune_data.get('festival_info', {}).get('festival', '')
-        }
+        # 简化信息视图（由当日老黄历记录派生）
+        simple_info, freshness = bot.get_almanac_view('simple', with_freshness=True)
         
         return jsonify({
             'success': True,
             'data': simple_info,
-            'date': datetime.now().strftime('%Y-%m-%d')
+            'date': datetime.now().strftime('%Y-%m-%d'),
+            'freshness': freshness
         })
         
     except Exception as e:
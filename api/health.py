@@ -15,7 +15,7 @@ def health_check():
     """健康检查接口"""
     try:
         # 检查环境变量配置
-        webhook_configured = bool(os.getenv('WEBHOOK_URL'))
+        webhook_configured = bool(os.getenv('WEBHOOK_URL') or os.getenv('WEBHOOK_URLS'))
         weather_api_configured = bool(os.getenv('WEATHER_API_KEY'))
         ark_api_configured = bool(os.getenv('ARK_API_KEY'))
         
@@ -34,6 +34,30 @@ def health_check():
             'version': '2.1.0'
         }
         
+        # 缓存命中统计（按键族）和容量统计
+        from wework_bot import bot
+        if bot is not None:
+            health_status['cache'] = {
+                'families': bot.cache_stats.snapshot(),
+                'storage': bot.cache.stats()
+            }
+            # 各上游主机熔断器状态及状态转换次数
+            health_status['circuit_breakers'] = bot.http.breaker_stats()
+            # webhook发送队列长度、送达/失败次数和各机器人限流状态
+            health_status['webhook_outbox'] = dict(bot.outbox.stats(), targets=len(bot.webhook_targets))
+            # 各群的城市、推送时间和消息分段
+            health_status['tenants'] = bot.tenants.to_dict()
+            # 各上游接口最近的耗时分位数、自适应超时和对冲次数
+            health_status['upstream_latency'] = bot.http.latency_stats()
+            # 大模型文案内容池各分组的可用数量
+            health_status['content_pool'] = bot.content_pool.stats()
+            # 大模型调用耗时、token用量及合并生成的节省估算
+            health_status['ark_generation'] = bot.generation_stats.snapshot()
+            # ARK并发、速率限制、重试次数和各模型token用量
+            health_status['ark_client'] = bot.ark.stats()
+            # 各候选模型最近的耗时分位数、错误率和健康状态
+            health_status['ark_routing'] = bot.ark_router.stats()
+        
         return jsonify(health_status)
         
     except Exception as e:
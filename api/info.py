@@ -56,10 +56,17 @@ def get_api_info():
                 'POST /api/message/send': '发送自定义消息',
                 'POST /api/message/send-daily': '发送每日消息',
                 'GET /api/message/preview-daily': '预览每日消息内容',
+                'POST /api/message/regenerate-daily': '重新生成今日每日消息快照',
+                'POST /api/message/invalidate-daily': '删除每日消息快照',
                 'POST /api/message/send-weather': '发送天气消息',
                 'POST /api/message/send-fortune': '发送老黄历消息',
                 'POST /api/message/send-lunch': '发送午餐推荐消息',
+                'POST /api/message/broadcast': '广播消息到所有群机器人（NDJSON流式返回各群结果）',
+                'GET /api/message/jobs/<job_id>': '查询发送任务状态',
                 'GET /api/message/templates': '获取消息模板列表'
+            },
+            'scheduler': {
+                'GET /api/scheduler': '获取定时任务状态（下次触发时间、最近一次运行情况）'
             }
         },
         'status': 'running',
@@ -4,9 +4,11 @@
 消息发送API模块
 """
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+import json
 import sys
 import os
+import time
 
 # 添加项目根目录到Python路径
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -14,6 +16,60 @@ sys.path.insert(0, project_root)
 
 message_bp = Blueprint('message', __name__, url_prefix='/message')
 
+def _message_id():
+    """请求头 Idempotency-Key 指定的消息ID（用于去重），未指定时返回 None"""
+    message_id = request.headers.get('Idempotency-Key', '').strip()
+    return message_id[:128] or None
+
+def _job_summary(job):
+    """任务ID、状态和状态查询地址"""
+    return {
+        'job_id': job['job_id'],
+        'state': job['state'],
+        'duplicate': job['duplicate'],
+        'status_url': f"/api/message/jobs/{job['job_id']}"
+    }
+
+def _queued_response(job, message, data):
+    """消息已加入发送队列：返回202和任务ID，发送结果通过任务状态接口查询"""
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Webhook URL 未配置'
+        }), 500
+    if job['duplicate']:
+        message = '相同消息ID的任务已存在，未重复发送'
+    return jsonify({
+        'success': True,
+        'message': message,
+        'data': {
+            **data,
+            **_job_summary(job)
+        }
+    }), 202
+
+def _tenant_names():
+    """请求指定的群名称列表（查询参数或请求体中的 tenant，可为列表），未指定时返回 None 表示全部群"""
+    data = request.get_json(silent=True) or {}
+    tenant = request.args.get('tenant') or data.get('tenant')
+    if not tenant:
+        return None
+    return [tenant] if isinstance(tenant, str) else list(tenant)
+
+def _tenant_not_found(bot, names):
+    """请求指定了不存在的群时返回404响应，否则返回 None"""
+    missing = [name for name in names or [] if bot.tenants.get(name) is None]
+    if not missing:
+        return None
+    return jsonify({
+        'success': False,
+        'error': f"群不存在: {', '.join(map(str, missing))}"
+    }), 404
+
+def _ndjson(record):
+    """NDJSON的一行"""
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
 @message_bp.route('/send', methods=['POST'])
 def send_message():
     """发送自定义消息"""
@@ -34,22 +90,9 @@ def send_message():
                 'error': '消息内容不能为空'
             }), 400
         
-        # 发送消息
-        result = bot.send_message(message)
-        
-        if result:
-            return jsonify({
-                'success': True,
-                'message': '消息发送成功',
-                'data': {
-                    'sent_message': message
-                }
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': '消息发送失败'
-            }), 500
+        # 加入发送队列
+        job = bot.enqueue_message(message, message_id=_message_id())
+        return _queued_response(job, '消息已加入发送队列', {'sent_message': message})
             
     except Exception as e:
         return jsonify({
@@ -59,44 +102,131 @@ def send_message():
 
 @message_bp.route('/send-daily', methods=['POST'])
 def send_daily_message():
-    """发送每日消息"""
+    """发送每日消息（可用 tenant 指定群，默认所有群）"""
     try:
         from wework_bot import bot
         
-        # 生成并发送每日消息
-        result = bot.send_daily_message()
+        tenants = _tenant_names()
+        not_found = _tenant_not_found(bot, tenants)
+        if not_found:
+            return not_found
+        
+        # 生成每日消息并加入发送队列
+        result = bot.send_daily_message(wait=False, message_id=_message_id(), tenants=tenants)
         
-        if result:
+        if result['skipped']:
             return jsonify({
                 'success': True,
-                'message': '每日消息发送成功'
+                'message': '今天是周末，跳过消息推送',
+                'data': {
+                    'prerendered': result['prerendered'],
+                    'timings': result['timings']
+                }
             })
+        jobs = result['jobs']
+        return _queued_response(jobs[0] if jobs else None, '每日消息已加入发送队列', {
+            'prerendered': result['prerendered'],
+            'timings': result['timings'],
+            'jobs': [dict(_job_summary(job), tenant=job['tenant']) for job in jobs]
+        })
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'发送每日消息失败: {str(e)}'
+        }), 500
+
+@message_bp.route('/broadcast', methods=['POST'])
+def broadcast_message():
+    """广播消息到所有群机器人
+    
+    请求体可选 message（自定义消息，发送到所有群机器人），不提供时发送今日每日消息（可用 tenant 指定群）；
+    内容只生成一次，各群并发发送。响应为NDJSON流：queued（内容已生成、已入队）、
+    每个群机器人一行 result（按送达先后）、最后一行 summary
+    """
+    try:
+        from wework_bot import bot
+        
+        started = time.monotonic()
+        data = request.get_json(silent=True) or {}
+        message = data.get('message')
+        message_id = _message_id()
+        if message is None:
+            tenants = _tenant_names()
+            not_found = _tenant_not_found(bot, tenants)
+            if not_found:
+                return not_found
+            result = bot.send_daily_message(wait=False, message_id=message_id, tenants=tenants)
+            if result['skipped']:
+                return jsonify({
+                    'success': True,
+                    'message': '今天是周末，跳过消息推送',
+                    'data': {'targets': len(bot.webhook_targets)}
+                })
+            jobs, message_id = result['jobs'], result['message_id']
+        elif not isinstance(message, str) or not message.strip():
+            return jsonify({
+                'success': False,
+                'error': '消息内容不能为空'
+            }), 400
         else:
+            jobs = bot.broadcast_message(message, message_id=message_id)
+        if not jobs:
             return jsonify({
                 'success': False,
-                'error': '每日消息发送失败'
+                'error': 'Webhook URL 未配置'
             }), 500
-            
+        render_ms = round((time.monotonic() - started) * 1000, 1)
+        
+        def stream():
+            yield _ndjson({'event': 'queued', 'targets': len(jobs), 'message_id': message_id, 'render_ms': render_ms,
+                           'jobs': [_job_summary(job) for job in jobs]})
+            states = {}
+            duplicates = {job['job_id'] for job in jobs if job['duplicate']}
+            tenant_of = {job['job_id']: job.get('tenant') for job in jobs}
+            for job in bot.outbox.as_completed(list(tenant_of), timeout=bot.webhook_send_timeout):
+                states[job['state']] = states.get(job['state'], 0) + 1
+                yield _ndjson({'event': 'result', **job, 'duplicate': job['job_id'] in duplicates,
+                               'tenant': tenant_of[job['job_id']]})
+            yield _ndjson({'event': 'summary', 'targets': len(jobs), 'states': states,
+                           'success': states.get('delivered', 0) == len(jobs),
+                           'elapsed_ms': round((time.monotonic() - started) * 1000, 1)})
+        
+        return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+        
     except Exception as e:
         return jsonify({
             'success': False,
-            'error': f'发送每日消息失败: {str(e)}'
+            'error': f'广播消息失败: {str(e)}'
         }), 500
 
 @message_bp.route('/preview-daily', methods=['GET'])
 def preview_daily_message():
-    """预览每日消息内容"""
+    """预览每日消息内容（读取今日快照，与实际发送内容一致）
+    
+    message_content 为主群（或 tenant 指定的第一个群）的消息，messages 为各群的消息
+    """
     try:
         from wework_bot import bot
         
-        # 生成每日消息内容但不发送
-        message_content = bot.generate_daily_message()
+        tenants = _tenant_names()
+        not_found = _tenant_not_found(bot, tenants)
+        if not_found:
+            return not_found
+        
+        # 读取今日快照，不存在时生成但不发送
+        messages, snapshot, freshness = bot.get_daily_messages(tenants, with_freshness=True)
         
         return jsonify({
             'success': True,
             'data': {
-                'message_content': message_content,
-                'preview_mode': True
+                'message_content': next(iter(messages.values())),
+                'messages': messages,
+                'preview_mode': True,
+                'date': snapshot['date'],
+                'generated_at': snapshot['generated_at'],
+                'timings': snapshot['timings'],
+                'freshness': freshness
             }
         })
         
@@ -106,29 +236,65 @@ def preview_daily_message():
             'error': f'预览每日消息失败: {str(e)}'
         }), 500
 
+@message_bp.route('/regenerate-daily', methods=['POST'])
+def regenerate_daily_message():
+    """重新生成今日每日消息快照"""
+    try:
+        from wework_bot import bot
+        
+        snapshot = bot.regenerate_daily_snapshot()
+        
+        return jsonify({
+            'success': True,
+            'message': '每日消息已重新生成',
+            'data': {
+                'message_content': snapshot['message'],
+                'date': snapshot['date'],
+                'generated_at': snapshot['generated_at'],
+                'timings': snapshot['timings']
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'重新生成每日消息失败: {str(e)}'
+        }), 500
+
+@message_bp.route('/invalidate-daily', methods=['POST'])
+def invalidate_daily_message():
+    """删除每日消息快照，下次预览或发送时重新生成"""
+    try:
+        from wework_bot import bot
+        
+        data = request.get_json(silent=True) or {}
+        date = data.get('date')
+        bot.invalidate_daily_snapshot(date)
+        
+        return jsonify({
+            'success': True,
+            'message': '每日消息快照已删除',
+            'data': {
+                'date': date or bot._today()
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'删除每日消息快照失败: {str(e)}'
+        }), 500
+
 @message_bp.route('/send-weather', methods=['POST'])
 def send_weather_message():
     """发送天气消息"""
     try:
         from wework_bot import bot
         
-        # 获取天气信息并发送
+        # 获取天气信息并加入发送队列
         weather_info = bot.get_weather_info()
-        result = bot.send_message(f"🌤️ 天气播报\n\n{weather_info}")
-        
-        if result:
-            return jsonify({
-                'success': True,
-                'message': '天气消息发送成功',
-                'data': {
-                    'weather_info': weather_info
-                }
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': '天气消息发送失败'
-            }), 500
+        job = bot.enqueue_message(f"🌤️ 天气播报\n\n{weather_info}", message_id=_message_id())
+        return _queued_response(job, '天气消息已加入发送队列', {'weather_info': weather_info})
             
     except Exception as e:
         return jsonify({
@@ -142,23 +308,10 @@ def send_fortune_message():
     try:
         from wework_bot import bot
         
-        # 获取老黄历信息并发送
+        # 获取老黄历信息并加入发送队列
         fortune_info = bot.get_today_fortune()
-        result = bot.send_message(f"📅 今日运势\n\n{fortune_info}")
-        
-        if result:
-            return jsonify({
-                'success': True,
-                'message': '老黄历消息发送成功',
-                'data': {
-                    'fortune_info': fortune_info
-                }
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': '老黄历消息发送失败'
-            }), 500
+        job = bot.enqueue_message(f"📅 今日运势\n\n{fortune_info}", message_id=_message_id())
+        return _queued_response(job, '老黄历消息已加入发送队列', {'fortune_info': fortune_info})
             
     except Exception as e:
         return jsonify({
@@ -172,29 +325,40 @@ def send_lunch_message():
     try:
         from wework_bot import bot
         
-        # 获取天气信息和午餐推荐并发送
+        # 获取天气信息和午餐推荐并加入发送队列
         weather_info = bot.get_weather_info()
         lunch_recommendation = bot.get_lunch_recommendation(weather_info)
-        result = bot.send_message(f"🍽️ 午餐推荐\n\n{lunch_recommendation}")
+        job = bot.enqueue_message(f"🍽️ 午餐推荐\n\n{lunch_recommendation}", message_id=_message_id())
+        return _queued_response(job, '午餐推荐消息已加入发送队列', {'lunch_recommendation': lunch_recommendation})
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'发送午餐推荐消息失败: {str(e)}'
+        }), 500
+
+@message_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_message_job(job_id):
+    """查询发送任务状态：queued/sending/retrying/delivered/failed，以及每次尝试的耗时和结果"""
+    try:
+        from wework_bot import bot
         
-        if result:
-            return jsonify({
-                'success': True,
-                'message': '午餐推荐消息发送成功',
-                'data': {
-                    'lunch_recommendation': lunch_recommendation
-                }
-            })
-        else:
+        job = bot.outbox.get(job_id)
+        if job is None:
             return jsonify({
                 'success': False,
-                'error': '午餐推荐消息发送失败'
-            }), 500
-            
+                'error': '发送任务不存在或已过期'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': job
+        })
+        
     except Exception as e:
         return jsonify({
             'success': False,
-            'error': f'发送午餐推荐消息失败: {str(e)}'
+            'error': f'查询发送任务失败: {str(e)}'
         }), 500
 
 @message_bp.route('/templates', methods=['GET'])
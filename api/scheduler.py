@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+定时任务API模块
+"""
+
+from flask import Blueprint, jsonify
+import os
+
+scheduler_bp = Blueprint('scheduler', __name__, url_prefix='/scheduler')
+
+@scheduler_bp.route('/', methods=['GET'])
+@scheduler_bp.route('/status', methods=['GET'])
+def scheduler_status():
+    """获取定时任务状态（下次触发时间、最近一次运行耗时等）
+    
+    顶层为主群的定时任务，schedules 为每个推送时间的定时任务及其负责的群
+    """
+    try:
+        from wework_bot import bot
+        
+        if bot is None or bot.scheduler is None:
+            return jsonify({
+                'success': False,
+                'error': '定时任务不可用，请检查 CRON_SCHEDULE 配置'
+            }), 503
+        
+        status = bot.scheduler.status()
+        status['enabled'] = os.getenv('SCHEDULER_ENABLED', 'false').lower() == 'true'
+        groups = bot.tenants.by_schedule()
+        status['schedules'] = [
+            dict(scheduler.status(), tenants=groups.get(expression, []))
+            for expression, scheduler in bot.schedulers.items()
+        ]
+        
+        return jsonify({
+            'success': True,
+            'data': status
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'获取定时任务状态失败: {str(e)}'
+        }), 500
@@ -22,21 +22,15 @@ def get_weather():
         
         # 获取查询参数
         city = request.args.get('city')
-        if city:
-            # 临时设置城市
-            original_city = bot.city
-            bot.city = city
-            weather_info = bot.get_weather_info()
-            bot.city = original_city
-        else:
-            weather_info = bot.get_weather_info()
+        weather_info, freshness = bot.get_weather_info(city=city, with_freshness=True)
         
         return jsonify({
             'success': True,
             'data': {
                 'weather': weather_info,
                 'city': city or bot.city
-            }
+            },
+            'freshness': freshness
         })
         
     except Exception as e:
@@ -55,7 +49,7 @@ def get_current_weather():
         
         # 如果有高德API密钥，获取详细天气信息
         if bot.weather_api_key:
-            current_weather = bot.get_amap_current_weather()
+            current_weather = bot.get_amap_current_weather(city)
             if current_weather:
                 return jsonify({
                     'success': True,
@@ -67,7 +61,7 @@ def get_current_weather():
                 })
         
         # 降级到基础天气信息
-        weather_info = bot.get_weather_info()
+        weather_info = bot.get_weather_info(city=city)
         return jsonify({
             'success': True,
             'data': {
@@ -93,7 +87,7 @@ def get_weather_forecast():
         
         # 如果有高德API密钥，获取预报信息
         if bot.weather_api_key:
-            forecast_weather = bot.get_amap_forecast_weather()
+            forecast_weather = bot.get_amap_forecast_weather(city)
             if forecast_weather:
                 return jsonify({
                     'success': True,
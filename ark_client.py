@@ -0,0 +1,689 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARK大模型客户端
+支持流式（SSE）输出和单次调用时间预算，限制并发数和每个模型的请求/token速率，
+遇到429和5xx时按 Retry-After 或带抖动的指数退避重试；固定的提示词前缀通过上下文缓存只上传一次；
+并提供合并生成结果的严格解析、按生成模式统计调用耗时和token用量
+"""
+
+import hashlib
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from deadline import bound_timeout, current_deadline
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+_CODE_FENCE = re.compile(r'^```(?:json)?\s*(.*?)\s*```$', re.S)
+
+# 句子结束符，超出时间预算时在最后一个句子结束处截断
+_SENTENCE_ENDINGS = '。！？!?；;…~\n'
+
+# 超出时间预算时的处理方式：partial 保留已生成内容，sentence 截断到句子结尾，fallback 放弃（使用备用文案）
+DEADLINE_POLICIES = ('partial', 'sentence', 'fallback')
+
+
+# 可重试的HTTP状态码：限流和服务端临时错误
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+class ArkRetryableError(Exception):
+    """可重试的调用失败（429/5xx、连接失败或超时）"""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class ArkContextExpiredError(Exception):
+    """上下文缓存已过期或不存在，需要重新创建"""
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 响应头（秒数或HTTP日期），返回秒数，无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, moment.timestamp() - time.time())
+
+
+def cut_at_sentence(text):
+    """截断到最后一个完整句子，没有完整句子时返回空字符串"""
+    index = max(text.rfind(ending) for ending in _SENTENCE_ENDINGS)
+    return text[:index + 1].strip() if index >= 0 else ''
+
+
+class ArkResult:
+    """一次大模型调用的结果"""
+
+    __slots__ = ('content', 'usage', 'ttft_ms', 'elapsed_ms', 'truncated', 'streamed', 'model')
+
+    def __init__(self, content=None, usage=None, ttft_ms=None, elapsed_ms=0.0, truncated=False, streamed=False,
+                 model=None):
+        self.content = content
+        self.usage = usage or {}
+        self.ttft_ms = ttft_ms  # 首个token耗时（毫秒），非流式调用为 None
+        self.elapsed_ms = elapsed_ms
+        self.truncated = truncated  # 是否因超出时间预算而截断
+        self.streamed = streamed
+        self.model = model
+
+
+class ArkClient:
+    """Volces Engine ARK 对话补全客户端
+
+    - 流式模式：请求 stream=true，逐条解析SSE数据块；读取在后台线程进行，
+      主线程按截止时间等待，到时立即关闭连接，不会超出时间预算
+    - 时间预算：deadline 为单次调用的最长秒数，超出后按 on_deadline 处理已生成的内容
+    - 非流式模式：读取超时取 min(deadline, 主机读取超时)
+    - 并发限制：同时进行的调用不超过 max_concurrency 个，等待槽位同样计入时间预算
+    - 速率限制：每个模型一个请求令牌桶（rpm）和一个token令牌桶（tpm）；
+      调用前按 提示词长度 + max_tokens 预扣token，完成后按响应中的 usage 多退少补
+    - 重试：429、5xx、连接失败和超时最多重试 max_retries 次；有 Retry-After 时按其等待
+      （并暂停该模型的请求令牌桶，其他调用一起顺延），否则按带抖动的指数退避等待；
+      等待时间超出剩余预算时直接放弃，由调用方使用备用文案
+    - 前缀缓存：调用时传入 prefix 且启用 context_cache 时，前缀通过 ContextCache 注册一次，
+      之后的请求只发送变化的部分，服务端复用已计算的前缀
+    """
+
+    _END = object()
+
+    def __init__(self, http, base_url, api_key, model, stream=True, deadline=20, on_deadline='sentence',
+                 max_concurrency=4, rpm=60, tpm=100000, max_retries=3, retry_base_delay=0.5, retry_max_delay=8,
+                 context_cache=True, context_ttl=3600):
+        if on_deadline not in DEADLINE_POLICIES:
+            raise ValueError(f"不支持的超时处理方式: {on_deadline}")
+        self.http = http
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.stream = stream
+        self.deadline = deadline
+        self.on_deadline = on_deadline
+        self.max_concurrency = max_concurrency
+        self.rpm = rpm  # 0 表示不限制
+        self.tpm = tpm  # 0 表示不限制
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._buckets = {}  # 模型 -> (请求令牌桶, token令牌桶)
+        self._usage = defaultdict(lambda: {
+            'requests': 0, 'retries': 0, 'throttled': 0, 'server_errors': 0, 'network_errors': 0,
+            'gave_up': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0
+        })
+        self._recent_tokens = defaultdict(deque)  # 模型 -> deque[(时间, token数)]，用于统计最近一分钟用量
+        self.contexts = ContextCache(self, ttl=context_ttl) if context_cache else None
+
+    @property
+    def configured(self):
+        return bool(self.api_key and self.base_url)
+
+    def complete(self, prompt, max_tokens=200, temperature=0.9, top_p=0.95, deadline=None, on_deadline=None,
+                 stream=None, model=None, prefix=None):
+        """发送单轮对话补全，返回 ArkResult（失败时 content 为 None）
+
+        prefix 为固定不变的指令前缀：启用上下文缓存时只在创建缓存时上传一次，之后按缓存ID引用；
+        未启用或缓存不可用时作为 system 消息随请求发送。
+        在API请求中调用时，时间预算不超过请求剩余的时间预算
+        """
+        deadline = bound_timeout(deadline or self.deadline)
+        on_deadline = on_deadline or self.on_deadline
+        stream = self.stream if stream is None else stream
+        model = model or self.model
+        if not self.configured:
+            return ArkResult()
+        if deadline <= 0:
+            logger.warning("请求时间预算已耗尽，跳过ARK调用")
+            return ArkResult(model=model)
+
+        started = time.monotonic()
+        estimate = len(prompt) + len(prefix or '') + max_tokens  # 中文约1字1token，按上限预扣
+        options = {'max_tokens': max_tokens, 'temperature': temperature, 'top_p': top_p}
+        try:
+            use_context = bool(prefix) and self.contexts is not None
+            recreated = False
+            while True:
+                context_id = None
+                if use_context:
+                    context_id = self.contexts.context_id(model, prefix, deadline - (time.monotonic() - started))
+                path, payload = self._build_request(model, prompt, prefix, context_id, options)
+                try:
+                    result = self._complete_with_retry(path, payload, model, estimate, started, deadline,
+                                                       on_deadline, stream)
+                    break
+                except ArkContextExpiredError:
+                    # 缓存在服务端已失效：重新创建一次，仍失效则改为随请求发送前缀
+                    self.contexts.invalidate(model, prefix)
+                    use_context = not recreated
+                    recreated = True
+        except Exception as e:
+            logger.error(f"ARK API 调用异常: {str(e)}")
+            result = ArkResult(streamed=stream)
+        self._record_usage(model, result.usage)
+        self._settle_tokens(model, estimate, result.usage)
+        result.model = model
+        result.elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+        request_deadline = current_deadline()
+        if request_deadline is not None:
+            request_deadline.record(f"ark {model}", started, success=bool(result.content),
+                                    truncated=result.truncated)
+        logger.info(
+            f"ARK调用完成({model}): 首token {result.ttft_ms}ms，总耗时 {result.elapsed_ms}ms，"
+            f"{'已截断' if result.truncated else '完整'}，{'成功' if result.content else '失败'}"
+        )
+        return result
+
+    @staticmethod
+    def _build_request(model, prompt, prefix, context_id, options):
+        """构造请求路径和请求体，有上下文缓存ID时走上下文对话接口"""
+        messages = [{'role': 'user', 'content': prompt}]
+        if context_id:
+            return '/context/chat/completions', {'model': model, 'context_id': context_id, 'messages': messages,
+                                                 **options}
+        if prefix:
+            messages.insert(0, {'role': 'system', 'content': prefix})
+        return '/chat/completions', {'model': model, 'messages': messages, **options}
+
+    def _buckets_for(self, model):
+        """获取（必要时创建）模型的请求令牌桶和token令牌桶，不限制时为 None"""
+        buckets = self._buckets.get(model)
+        if buckets is None:
+            with self._lock:
+                buckets = self._buckets.get(model)
+                if buckets is None:
+                    buckets = (
+                        TokenBucket.per_minute(self.rpm) if self.rpm else None,
+                        TokenBucket.per_minute(self.tpm) if self.tpm else None
+                    )
+                    self._buckets[model] = buckets
+        return buckets
+
+    def _complete_with_retry(self, path, payload, model, estimate, started, deadline, on_deadline, stream):
+        """在并发和速率限制下发起调用，可重试的失败按退避重试，整体不超出时间预算"""
+        request_bucket, token_bucket = self._buckets_for(model)
+        usage = self._usage[model]
+
+        def remaining():
+            return deadline - (time.monotonic() - started)
+
+        if token_bucket is not None and not token_bucket.acquire(estimate, timeout=remaining()):
+            logger.warning(f"ARK模型 {model} token速率已达上限，时间预算内无法发起调用")
+            with self._lock:
+                usage['gave_up'] += 1
+            return ArkResult(streamed=stream)
+
+        attempt = 0
+        while True:
+            if request_bucket is not None and not request_bucket.acquire(1, timeout=remaining()):
+                logger.warning(f"ARK模型 {model} 请求速率已达上限，时间预算内无法发起调用")
+                break
+            if not self._slots.acquire(timeout=max(0.0, remaining())):
+                logger.warning(f"ARK并发已满（{self.max_concurrency}），时间预算内未等到空闲槽位")
+                break
+
+            with self._lock:
+                self._in_flight += 1
+                usage['requests'] += 1
+            try:
+                if stream:
+                    return self._complete_streaming(path, payload, started, deadline, on_deadline)
+                return self._complete_blocking(path, payload, remaining())
+            except ArkRetryableError as e:
+                error = e
+            except requests.exceptions.RequestException as e:
+                if not isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+                    raise  # 熔断中等其他请求异常不重试
+                error = ArkRetryableError(str(e))
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                self._slots.release()
+
+            with self._lock:
+                if error.status == 429:
+                    usage['throttled'] += 1
+                elif error.status:
+                    usage['server_errors'] += 1
+                else:
+                    usage['network_errors'] += 1
+            delay = self._backoff_delay(attempt, error.retry_after)
+            if attempt >= self.max_retries or delay >= remaining():
+                logger.error(f"ARK API 调用失败，放弃重试（第{attempt + 1}次）: {str(error)}")
+                break
+            if error.status == 429 and error.retry_after and request_bucket is not None:
+                request_bucket.pause(error.retry_after)
+            logger.warning(f"ARK API 调用失败，{delay:.2f}秒后第{attempt + 1}次重试: {str(error)}")
+            with self._lock:
+                usage['retries'] += 1
+            time.sleep(delay)
+            attempt += 1
+
+        with self._lock:
+            usage['gave_up'] += 1
+        return ArkResult(streamed=stream)
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        """重试等待时间：有 Retry-After 时按其等待（加少量抖动），否则为全抖动指数退避"""
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.retry_base_delay)
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def _check_status(response, payload=None):
+        """检查响应状态码，可重试的错误抛出 ArkRetryableError，其他错误返回 False
+
+        引用上下文缓存的请求返回 400/404 且错误信息涉及上下文时，抛出 ArkContextExpiredError
+        """
+        if response.status_code == 200:
+            return True
+        message = f"ARK API 调用失败: {response.status_code} - {response.text[:200]}"
+        if payload and payload.get('context_id') and response.status_code in (400, 404) \
+                and 'context' in response.text.lower():
+            response.close()
+            logger.warning(f"ARK上下文缓存已失效: {payload['context_id']}")
+            raise ArkContextExpiredError(message)
+        if response.status_code in RETRYABLE_STATUS:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            response.close()
+            raise ArkRetryableError(message, status=response.status_code, retry_after=retry_after)
+        logger.error(message)
+        response.close()
+        return False
+
+    def _settle_tokens(self, model, estimate, usage):
+        """按实际用量结算预扣的token：多退少补，失败且无用量时全部退还"""
+        token_bucket = self._buckets_for(model)[1]
+        if token_bucket is None:
+            return
+        actual = (usage or {}).get('total_tokens')
+        token_bucket.charge((actual or 0) - estimate)
+
+    def _record_usage(self, model, usage):
+        """累计模型的token用量"""
+        if not usage:
+            return
+        now = time.monotonic()
+        with self._lock:
+            stats = self._usage[model]
+            for field in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+                stats[field] += usage.get(field, 0) or 0
+            # 命中上下文缓存的输入token（按缓存价格计费）
+            stats['cached_tokens'] += (usage.get('prompt_tokens_details') or {}).get('cached_tokens', 0) or 0
+            self._recent_tokens[model].append((now, usage.get('total_tokens', 0) or 0))
+
+    def stats(self):
+        """获取并发、速率限制和各模型的请求与token用量"""
+        now = time.monotonic()
+        with self._lock:
+            models = {}
+            for model, usage in self._usage.items():
+                recent = self._recent_tokens[model]
+                while recent and now - recent[0][0] > 60:
+                    recent.popleft()
+                models[model] = {**usage, 'tokens_last_minute': sum(tokens for _, tokens in recent)}
+            in_flight = self._in_flight
+            buckets = dict(self._buckets)
+        for model, (request_bucket, token_bucket) in buckets.items():
+            entry = models.setdefault(model, {})
+            entry['request_limit'] = request_bucket.stats() if request_bucket else None
+            entry['token_limit'] = token_bucket.stats() if token_bucket else None
+        return {
+            'max_concurrency': self.max_concurrency,
+            'in_flight': in_flight,
+            'max_retries': self.max_retries,
+            'context_cache': self.contexts.stats() if self.contexts is not None else None,
+            'models': models
+        }
+
+    def _headers(self):
+        return {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
+
+    def _complete_blocking(self, path, payload, deadline):
+        """非流式调用，deadline 为剩余时间预算"""
+        read_timeout = min(max(0.1, deadline), self.http.host_config(self.base_url)['read_timeout'])
+        response = self.http.post(f'{self.base_url}{path}', headers=self._headers(), json=payload,
+                                  timeout=read_timeout)
+        if not self._check_status(response, payload):
+            return ArkResult()
+        result = response.json()
+        if 'choices' in result and len(result['choices']) > 0:
+            content = result['choices'][0]['message']['content'].strip()
+            return ArkResult(content, result.get('usage'))
+        return ArkResult()
+
+    def _complete_streaming(self, path, payload, started, deadline, on_deadline):
+        """流式调用，按截止时间收集增量内容"""
+        payload = dict(payload, stream=True, stream_options={'include_usage': True})
+        response = self.http.post(f'{self.base_url}{path}', headers=self._headers(), json=payload,
+                                  timeout=max(0.1, deadline - (time.monotonic() - started)), stream=True)
+        if not self._check_status(response, payload):
+            return ArkResult(streamed=True)
+
+        lines = queue.Queue()
+        reader = threading.Thread(target=self._read_lines, args=(response, lines), name='ark-stream', daemon=True)
+        reader.start()
+
+        pieces, usage, ttft_ms = [], {}, None
+        finished = False
+        try:
+            while True:
+                remaining = deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                try:
+                    line = lines.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if line is self._END:
+                    finished = True
+                    break
+                chunk = self._parse_event(line)
+                if chunk is None:
+                    continue
+                if chunk == '[DONE]':
+                    finished = True
+                    break
+                usage = chunk.get('usage') or usage
+                for choice in chunk.get('choices') or []:
+                    delta = (choice.get('delta') or {}).get('content')
+                    if delta:
+                        if ttft_ms is None:
+                            ttft_ms = round((time.monotonic() - started) * 1000, 1)
+                        pieces.append(delta)
+        finally:
+            if finished:
+                response.close()
+            else:
+                # 读取线程可能阻塞在socket上，关闭连接放到后台进行，避免占用时间预算
+                threading.Thread(target=response.close, name='ark-stream-close', daemon=True).start()
+
+        text = ''.join(pieces).strip()
+        if finished:
+            return ArkResult(text or None, usage, ttft_ms, streamed=True)
+
+        logger.warning(f"ARK流式输出超出时间预算 {deadline}s，已生成 {len(text)} 字，处理方式: {on_deadline}")
+        if on_deadline == 'partial':
+            content = text
+        elif on_deadline == 'sentence':
+            content = cut_at_sentence(text)
+        else:
+            content = ''
+        return ArkResult(content or None, usage, ttft_ms, truncated=True, streamed=True)
+
+    def _read_lines(self, response, lines):
+        """后台读取SSE行，连接关闭或出错时结束
+
+        chunk_size=None 时按服务端分块（chunked）到达即返回，不等待缓冲区填满
+        """
+        try:
+            for line in response.iter_lines(chunk_size=None):
+                lines.put(line)
+        except (requests.exceptions.RequestException, AttributeError, ValueError) as e:
+            # 截止时间到达后主线程关闭连接，读取随之中断
+            logger.debug(f"ARK流式读取结束: {str(e)}")
+        finally:
+            lines.put(self._END)
+
+    @staticmethod
+    def _parse_event(line):
+        """解析一行SSE数据，返回数据块字典、'[DONE]' 或 None（非数据行）"""
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        line = line.strip()
+        if not line.startswith('data:'):
+            return None
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return data
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            logger.warning(f"ARK流式数据无法解析: {data[:100]}")
+            return None
+        if 'error' in chunk:
+            logger.error(f"ARK流式输出错误: {chunk['error']}")
+            return None
+        return chunk
+
+
+class ContextCache:
+    """ARK上下文缓存（common_prefix 模式）
+
+    - 注册：同一 (模型, 前缀) 首次使用时调用 /context/create 创建缓存，之后按缓存ID引用
+    - 过期：本地按 ttl 提前 refresh_margin 秒视为过期并重新创建；服务端提前失效时由调用方
+      调用 invalidate 后重新创建
+    - 不可用：创建失败（模型未开通缓存、网络异常等）时该模型在 retry_after 秒内不再尝试，
+      期间前缀作为 system 消息随请求发送
+    """
+
+    def __init__(self, client, ttl=3600, refresh_margin=60, retry_after=600, clock=time.monotonic):
+        self.client = client
+        self.ttl = int(ttl)
+        self.refresh_margin = refresh_margin
+        self.retry_after = retry_after
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._contexts = {}  # (模型, 前缀摘要) -> (缓存ID, 过期时间)
+        self._key_locks = defaultdict(threading.Lock)
+        self._unavailable_until = {}  # 模型 -> 时间
+        self._counters = defaultdict(int)
+
+    @staticmethod
+    def _key(model, prefix):
+        return model, hashlib.sha1(prefix.encode('utf-8')).hexdigest()[:16]
+
+    def context_id(self, model, prefix, timeout):
+        """获取前缀对应的缓存ID，必要时创建；不可用时返回 None"""
+        key = self._key(model, prefix)
+        now = self._clock()
+        with self._lock:
+            cached = self._contexts.get(key)
+            if cached and cached[1] > now:
+                self._counters['reused'] += 1
+                return cached[0]
+            if self._unavailable_until.get(model, 0) > now:
+                self._counters['bypassed'] += 1
+                return None
+            key_lock = self._key_locks[key]
+
+        # 同一前缀并发未命中时只创建一次
+        if not key_lock.acquire(timeout=max(0.0, timeout)):
+            return None
+        try:
+            with self._lock:
+                cached = self._contexts.get(key)
+                if cached and cached[1] > self._clock():
+                    self._counters['reused'] += 1
+                    return cached[0]
+            return self._create(key, model, prefix, timeout)
+        finally:
+            key_lock.release()
+
+    def _create(self, key, model, prefix, timeout):
+        """调用 /context/create 创建缓存"""
+        client = self.client
+        payload = {
+            'model': model,
+            'mode': 'common_prefix',
+            'messages': [{'role': 'system', 'content': prefix}],
+            'ttl': self.ttl
+        }
+        started = self._clock()
+        try:
+            response = client.http.post(f'{client.base_url}/context/create', headers=client._headers(),
+                                        json=payload, timeout=max(0.1, min(timeout, 10)))
+            if response.status_code != 200:
+                raise ValueError(f"{response.status_code} - {response.text[:200]}")
+            context_id = response.json()['id']
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            logger.warning(f"ARK上下文缓存创建失败，{self.retry_after}秒内改为随请求发送前缀: {str(e)}")
+            with self._lock:
+                self._unavailable_until[model] = self._clock() + self.retry_after
+                self._counters['create_failures'] += 1
+            return None
+
+        expires_at = started + max(self.ttl - self.refresh_margin, self.ttl / 2)
+        with self._lock:
+            self._contexts[key] = (context_id, expires_at)
+            self._counters['created'] += 1
+        logger.info(f"ARK上下文缓存已创建: {context_id}（{model}，前缀 {len(prefix)} 字，有效期 {self.ttl} 秒）")
+        return context_id
+
+    def invalidate(self, model, prefix):
+        """移除在服务端已失效的缓存ID，下次使用时重新创建"""
+        with self._lock:
+            if self._contexts.pop(self._key(model, prefix), None) is not None:
+                self._counters['expired'] += 1
+
+    def stats(self):
+        """获取缓存数量和创建、复用、失效次数"""
+        now = self._clock()
+        with self._lock:
+            return {
+                'ttl_seconds': self.ttl,
+                'active': sum(1 for _, expires_at in self._contexts.values() if expires_at > now),
+                'unavailable_models': sorted(model for model, until in self._unavailable_until.items() if until > now),
+                **self._counters
+            }
+
+
+def parse_json_sections(text, limits, min_length=4):
+    """严格解析合并生成返回的JSON对象
+
+    limits 为 {字段: 最大长度}。只接受整段为JSON对象（允许包裹在```代码块中）的输出，
+    不从夹杂的说明文字中截取。字段缺失、不是字符串或长度不在 [min_length, 最大长度] 内时该字段为 None。
+    返回 {字段: 文本或 None}
+    """
+    sections = dict.fromkeys(limits)
+    if not text:
+        return sections
+
+    body = text.strip()
+    fence = _CODE_FENCE.match(body)
+    if fence:
+        body = fence.group(1)
+    try:
+        data = json.loads(body)
+    except ValueError:
+        logger.warning(f"合并生成结果不是合法JSON: {text[:100]}")
+        return sections
+    if not isinstance(data, dict):
+        logger.warning("合并生成结果不是JSON对象")
+        return sections
+
+    for field, max_length in limits.items():
+        value = data.get(field)
+        if not isinstance(value, str):
+            logger.warning(f"合并生成结果缺少字段 {field}")
+            continue
+        value = value.strip()
+        if not min_length <= len(value) <= max_length:
+            logger.warning(f"合并生成字段 {field} 长度 {len(value)} 超出限制 {min_length}-{max_length}")
+            continue
+        sections[field] = value
+    return sections
+
+
+class GenerationStats:
+    """按生成模式统计大模型调用次数、失败次数、耗时和token用量
+
+    耗时和token只累计成功的调用，平均值按成功次数计算。
+    combined_parts 为 {合并模式: (被合并的单项模式, ...)}，用于估算合并生成相对逐项生成
+    每次调用节省的耗时和token。
+    """
+
+    def __init__(self, combined_parts=None):
+        self.combined_parts = combined_parts or {}
+        self._lock = threading.Lock()
+        self._modes = defaultdict(lambda: {
+            'calls': 0, 'failures': 0, 'truncated': 0, 'latency_ms': 0.0, 'ttft_ms': 0.0, 'ttft_samples': 0,
+            'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0
+        })
+
+    def record(self, mode, elapsed_ms, usage=None, success=True, ttft_ms=None, truncated=False):
+        """记录一次调用"""
+        usage = usage or {}
+        with self._lock:
+            stats = self._modes[mode]
+            stats['calls'] += 1
+            if truncated:
+                stats['truncated'] += 1
+            if not success:
+                stats['failures'] += 1
+                return
+            stats['latency_ms'] += elapsed_ms
+            if ttft_ms is not None:
+                stats['ttft_ms'] += ttft_ms
+                stats['ttft_samples'] += 1
+            for field in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+                stats[field] += usage.get(field, 0) or 0
+
+    @staticmethod
+    def _averages(stats):
+        calls = stats['calls'] - stats['failures']
+        return {
+            'latency_ms': round(stats['latency_ms'] / calls, 1),
+            'total_tokens': round(stats['total_tokens'] / calls, 1)
+        }
+
+    def snapshot(self):
+        """获取统计快照，包含各模式平均值和合并生成的节省估算"""
+        with self._lock:
+            modes = {mode: dict(stats) for mode, stats in self._modes.items()}
+
+        result = {}
+        for mode, stats in modes.items():
+            averages = self._averages(stats) if stats['calls'] > stats['failures'] else {}
+            ttft_samples = stats.pop('ttft_samples')
+            ttft_total = stats.pop('ttft_ms')
+            result[mode] = {
+                **stats,
+                'latency_ms': round(stats['latency_ms'], 1),
+                'avg_ttft_ms': round(ttft_total / ttft_samples, 1) if ttft_samples else None,
+                'avg_latency_ms': averages.get('latency_ms'),
+                'avg_total_tokens': averages.get('total_tokens')
+            }
+
+        savings = {}
+        for combined, parts in self.combined_parts.items():
+            samples = [modes.get(mode) for mode in (combined,) + tuple(parts)]
+            if not all(stats and stats['calls'] > stats['failures'] for stats in samples):
+                continue  # 两种模式都有成功样本后才能估算
+            successes = modes[combined]['calls'] - modes[combined]['failures']
+            combined_avg = self._averages(modes[combined])
+            part_avgs = [self._averages(modes[mode]) for mode in parts]
+            per_call_ms = sum(avg['latency_ms'] for avg in part_avgs) - combined_avg['latency_ms']
+            per_call_tokens = sum(avg['total_tokens'] for avg in part_avgs) - combined_avg['total_tokens']
+            savings[combined] = {
+                'round_trips_saved': (len(parts) - 1) * successes,
+                'latency_ms_saved_per_call': round(per_call_ms, 1),
+                'tokens_saved_per_call': round(per_call_tokens, 1),
+                'latency_ms_saved_total': round(per_call_ms * successes, 1),
+                'tokens_saved_total': round(per_call_tokens * successes, 1)
+            }
+        return {'modes': result, 'savings': savings}
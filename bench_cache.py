@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缓存读取热路径微基准
+测量 WeWorkBot._get_cache 在命中、未命中和并发读写下的单次耗时
+用法：python bench_cache.py [迭代次数]
+"""
+
+import logging
+import sys
+import threading
+import time
+
+from wework_bot import WeWorkBot
+
+
+def bench(label, func, iterations):
+    """执行并打印单次平均耗时"""
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28}{elapsed / iterations * 1e9:>10.0f} ns/op")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    logging.disable(logging.WARNING)
+    bot = WeWorkBot()
+
+    for i in range(512):
+        bot.cache.set(f"constellation_structured_{i}_2024-01-01", {'sign': i, 'summary': '运势平稳'}, 'fortune')
+    bot.cache.set("weather_上海", "今日上海天气：晴 25°C", 'weather')
+
+    print("=" * 50)
+    print(f"缓存热路径微基准（{iterations} 次）")
+    print("=" * 50)
+    bench("命中 weather_上海", lambda i: bot._get_cache("weather_上海"), iterations)
+    bench("命中 512 个键轮询", lambda i: bot._get_cache(f"constellation_structured_{i % 512}_2024-01-01"), iterations)
+    bench("未命中", lambda i: bot._get_cache("missing"), iterations)
+    bench("写入（触发LRU淘汰）", lambda i: bot.cache.set(f"k{i}", i, 'weather'), iterations)
+
+    # 并发读取：4个线程同时读取热点键
+    threads = []
+    per_thread = iterations // 4
+    start = time.perf_counter()
+    for _ in range(4):
+        thread = threading.Thread(target=lambda: [bot._get_cache("weather_上海") for _ in range(per_thread)])
+        threads.append(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    print(f"{'4线程并发命中':<28}{elapsed / (per_thread * 4) * 1e9:>10.0f} ns/op")
+    print("=" * 50)
+    print(bot.cache.stats())
+
+
+if __name__ == '__main__':
+    main()
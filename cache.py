@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缓存模块
+提供线程安全的TTL+LRU缓存（区分权威数据与降级数据）、本地持久化缓存层、请求合并（single-flight）、按键族统计的缓存计数器和派生视图记忆化
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class Degraded:
+    """降级结果标记
+
+    回源失败时返回的备用数据用此包装，缓存层据此使用短有效期并安排后台重新获取
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+class CacheEntry:
+    """缓存条目"""
+
+    __slots__ = ('data', 'cache_type', 'stored_at', 'expires_at', 'stale_until', 'size', 'degraded')
+
+    def __init__(self, data, cache_type, stored_at, expires_at, stale_until, size, degraded=False):
+        self.data = data
+        self.cache_type = cache_type
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+        self.stale_until = stale_until  # 过期后仍可作为陈旧数据返回的截止时间
+        self.size = size
+        self.degraded = degraded  # 是否为回源失败时的降级数据
+
+
+def estimate_size(data):
+    """估算缓存数据占用的字节数"""
+    try:
+        return len(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+    except (TypeError, ValueError):
+        return sys.getsizeof(data)
+
+
+class DiskCacheStore:
+    """基于SQLite的本地持久化缓存层
+
+    - 多进程安全：使用WAL模式，多个worker进程可同时读写同一个文件
+    - 写入延迟落盘：写入先进入队列，由后台线程批量提交，不阻塞请求线程
+    - 过期时间使用墙上时钟（epoch秒），以便跨进程、跨重启判断有效性
+    """
+
+    def __init__(self, directory, filename='wework_bot_cache.sqlite3', batch_size=64):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, filename)
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._closed = False
+
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries ('
+            ' key TEXT PRIMARY KEY,'
+            ' data TEXT NOT NULL,'
+            ' cache_type TEXT NOT NULL,'
+            ' stored_at REAL NOT NULL,'
+            ' expires_at REAL NOT NULL)'
+        )
+        conn.commit()
+
+        self._writer = threading.Thread(target=self._write_loop, name='cache-disk-writer', daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA busy_timeout=5000')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def load(self, key):
+        """读取未过期的条目，返回 (数据, 缓存类型, 过期时间) 或 None"""
+        try:
+            row = self._connect().execute(
+                'SELECT data, cache_type, expires_at FROM cache_entries WHERE key = ? AND expires_at > ?',
+                (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"读取本地缓存失败: {str(e)}")
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def load_valid(self, limit):
+        """读取所有未过期条目（最近写入的优先），用于启动预热"""
+        try:
+            rows = self._connect().execute(
+                'SELECT key, data, cache_type, expires_at FROM cache_entries'
+                ' WHERE expires_at > ? ORDER BY stored_at DESC LIMIT ?',
+                (time.time(), limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"预热本地缓存失败: {str(e)}")
+            return []
+        return [(key, json.loads(data), cache_type, expires_at) for key, data, cache_type, expires_at in rows]
+
+    def save(self, key, data, cache_type, expires_at):
+        """异步写入条目"""
+        try:
+            payload = json.dumps(data, ensure_ascii=False)
+        except (TypeError, ValueError):
+            logger.warning(f"缓存数据无法序列化，跳过持久化: {key}")
+            return
+        self._queue.put(('save', (key, payload, cache_type, time.time(), expires_at)))
+
+    def delete(self, key):
+        """异步删除条目"""
+        self._queue.put(('delete', (key,)))
+
+    def purge_expired(self):
+        """异步清理已过期的条目"""
+        self._queue.put(('purge', ()))
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # 合并积压的写入，一次事务提交
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self._apply(batch)
+
+    def _apply(self, batch):
+        """在一个事务中执行一批写入"""
+        conn = self._connect()
+        try:
+            with conn:
+                for op, args in batch:
+                    if op == 'save':
+                        conn.execute(
+                            'INSERT OR REPLACE INTO cache_entries (key, data, cache_type, stored_at, expires_at)'
+                            ' VALUES (?, ?, ?, ?, ?)', args
+                        )
+                    elif op == 'delete':
+                        conn.execute('DELETE FROM cache_entries WHERE key = ?', args)
+                    elif op == 'purge':
+                        conn.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (time.time(),))
+        except sqlite3.Error as e:
+            logger.error(f"写入本地缓存失败: {str(e)}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self):
+        """等待所有排队的写入落盘"""
+        self._queue.join()
+
+    def close(self):
+        """落盘并停止后台写入线程"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+
+
+class BotCache:
+    """有界、线程安全的TTL+LRU缓存
+
+    - 过期策略：policy 为 {缓存类型: timedelta}，与 WeWorkBot.cache_duration 共用
+    - 容量限制：超过最大条目数或字节预算时按最近最少使用淘汰
+    - 过期清理：读取时惰性清理，另有后台线程定期清扫
+    - 时间基准：使用单调时钟，不受系统时间调整影响
+    - 持久化：可选挂载 DiskCacheStore 作为第二层，内存未命中时读穿透，写入延迟落盘
+    - 陈旧数据：stale_policy 为 {缓存类型: timedelta}，条目过期后在该时长内保留，
+      可通过 lookup 以 stale 状态读取（stale-while-revalidate）
+    - 降级数据：以 degraded=True 写入的条目只保存在内存中，不落盘、不保留陈旧期，
+      过期后即重新回源，避免一次上游故障的备用内容占用整个有效期
+    """
+
+    def __init__(self, policy, max_entries=1024, max_bytes=None, sweep_interval=60, clock=time.monotonic,
+                 store=None, stale_policy=None):
+        self.policy = policy
+        self.stale_policy = stale_policy if stale_policy is not None else {}
+        self.store = store
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._evictions = 0
+        self._expirations = 0
+        self._store_hits = 0
+        self._sweeper = None
+        self._stop_event = threading.Event()
+
+    def _ttl_seconds(self, cache_type):
+        """获取缓存类型对应的有效期（秒）"""
+        duration = self.policy.get(cache_type)
+        if duration is None:
+            return None
+        return duration.total_seconds()
+
+    def _remove(self, key):
+        """移除条目（调用方需持有锁）"""
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        return entry
+
+    def get(self, key):
+        """获取有效的缓存数据，不存在或已过期时返回 None"""
+        data, state, _, _ = self.lookup(key)
+        return data if state == 'fresh' else None
+
+    def lookup(self, key):
+        """查询缓存条目及其新鲜度
+
+        返回 (数据, 状态, 已缓存秒数, 是否降级)：状态为 fresh（有效）或 stale（已过期但在陈旧容忍期内），
+        未命中或超出陈旧容忍期时返回 (None, None, None, False)
+        """
+        stale = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                now = self._clock()
+                if now < entry.expires_at:
+                    self._entries.move_to_end(key)
+                    return entry.data, 'fresh', now - entry.stored_at, entry.degraded
+                if now < entry.stale_until:
+                    stale = (entry.data, 'stale', now - entry.stored_at, entry.degraded)
+                else:
+                    self._remove(key)
+                    self._expirations += 1
+
+        # 内存中没有有效条目时读穿透到持久化层（其他进程可能已刷新）
+        if self.store is not None:
+            data = self._load_from_store(key)
+            if data is not None:
+                return data, 'fresh', 0.0, False
+        if stale is not None:
+            return stale
+        return None, None, None, False
+
+    def _load_from_store(self, key):
+        """从持久化层读取并回填内存"""
+        row = self.store.load(key)
+        if row is None:
+            return None
+        data, cache_type, expires_at = row
+        self._put(key, data, cache_type, expires_at - time.time())
+        with self._lock:
+            self._store_hits += 1
+        return data
+
+    def warm_from_store(self):
+        """启动时从持久化层加载仍有效的条目，返回加载数量"""
+        if self.store is None:
+            return 0
+        rows = self.store.load_valid(self.max_entries)
+        # 按写入时间从旧到新回填，使最近写入的条目位于LRU尾部
+        for key, data, cache_type, expires_at in reversed(rows):
+            self._put(key, data, cache_type, expires_at - time.time())
+        if rows:
+            logger.info(f"从本地缓存预热 {len(rows)} 个条目")
+        return len(rows)
+
+    def is_valid(self, key):
+        """检查缓存是否存在且未过期"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and self._clock() < entry.expires_at
+
+    def is_degraded(self, key):
+        """检查缓存条目是否为降级数据"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry.degraded
+
+    def set(self, key, data, cache_type, ttl=None, degraded=False):
+        """写入缓存
+
+        ttl 为有效期秒数，未指定时按缓存类型的策略计算；未知类型不缓存。
+        degraded 为 True 时写入降级数据：调用方应传入较短的 ttl，且不写入持久化层。
+        """
+        if ttl is None:
+            ttl = self._ttl_seconds(cache_type)
+        if ttl is None:
+            logger.warning(f"未知的缓存类型 {cache_type}，跳过缓存: {key}")
+            return
+
+        self._put(key, data, cache_type, ttl, degraded)
+        if degraded:
+            # 持久化层中可能还有更早的权威数据，降级数据不应覆盖它
+            return
+        if self.store is not None:
+            self.store.save(key, data, cache_type, time.time() + ttl)
+
+    def _put(self, key, data, cache_type, ttl, degraded=False):
+        """写入内存层"""
+        if ttl <= 0:
+            return
+        now = self._clock()
+        stale = None if degraded else self.stale_policy.get(cache_type)
+        stale_seconds = stale.total_seconds() if stale is not None else 0
+        entry = CacheEntry(data, cache_type, now, now + ttl, now + ttl + stale_seconds, estimate_size(data), degraded)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    def _evict(self):
+        """按LRU淘汰超出容量的条目（调用方需持有锁）"""
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            key, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self._evictions += 1
+            logger.debug(f"缓存容量已满，淘汰: {key}")
+
+    def delete(self, key):
+        """删除缓存条目"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+        if self.store is not None:
+            self.store.delete(key)
+
+    def clear(self):
+        """清空内存缓存（持久化层保留，过期后自动清理）"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def sweep(self):
+        """清理所有已超出陈旧容忍期的条目，返回清理数量"""
+        now = self._clock()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if now >= entry.stale_until]
+            for key in expired:
+                self._remove(key)
+            self._expirations += len(expired)
+        if self.store is not None:
+            self.store.purge_expired()
+        if expired:
+            logger.info(f"缓存清扫完成，移除 {len(expired)} 个过期条目")
+        return len(expired)
+
+    def start_sweeper(self):
+        """启动后台过期清扫线程"""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._stop_event.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name='cache-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def _sweep_loop(self):
+        while not self._stop_event.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"缓存清扫失败: {str(e)}")
+
+    def stop(self):
+        """停止后台清扫线程并落盘持久化层"""
+        self._stop_event.set()
+        if self.store is not None:
+            self.store.close()
+
+    def __contains__(self, key):
+        return self.is_valid(key)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """获取缓存容量统计"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'degraded_entries': sum(1 for entry in self._entries.values() if entry.degraded),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'persistent': self.store.path if self.store is not None else None,
+                'store_hits': self._store_hits
+            }
+
+
+class _Call:
+    """一次进行中的加载调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """同一个键同一时间只执行一次加载，并发调用方等待并共享结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """执行加载函数
+
+        返回 (结果, 是否共享了其他调用方的结果)。
+        领头调用抛出的异常会同样抛给所有等待方。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+        return call.value, False
+
+    def in_flight(self, key):
+        """判断键是否正在加载"""
+        with self._lock:
+            return key in self._calls
+
+
+class CacheStats:
+    """按键族统计缓存命中、未命中、合并、陈旧返回、回源失败和降级结果次数"""
+
+    COUNTERS = ('hits', 'misses', 'coalesced', 'stale', 'errors', 'degraded')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: dict.fromkeys(self.COUNTERS, 0))
+
+    def record(self, family, counter, amount=1):
+        """累加计数"""
+        with self._lock:
+            self._counters[family][counter] = self._counters[family].get(counter, 0) + amount
+
+    def snapshot(self):
+        """获取统计快照"""
+        with self._lock:
+            return {family: dict(counters) for family, counters in self._counters.items()}
+
+
+class ViewMemo:
+    """派生视图的记忆化缓存
+
+    以 (视图名, 日期等) 为键缓存由源记录渲染出的视图，源记录对象变化
+    （如重新回源）时自动重新渲染。容量有限，旧日期的视图按LRU淘汰。
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._views = OrderedDict()
+
+    def get(self, key, source, render):
+        """获取视图，未缓存或源记录已变化时调用 render(source) 重新渲染"""
+        with self._lock:
+            memo = self._views.get(key)
+            if memo is not None and memo[0] is source:
+                self._views.move_to_end(key)
+                return memo[1]
+
+        value = render(source)
+        with self._lock:
+            self._views[key] = (source, value)
+            self._views.move_to_end(key)
+            while len(self._views) > self.max_entries:
+                self._views.popitem(last=False)
+        return value
+
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+星座表
+统一维护十二星座的标准ID（英文）与中文名称，供机器人和API模块共用
+"""
+
+# 标准星座ID（英文）与中文名称，按黄道顺序排列
+SIGN_TABLE = [
+    ('aries', '白羊座'),
+    ('taurus', '金牛座'),
+    ('gemini', '双子座'),
+    ('cancer', '巨蟹座'),
+    ('leo', '狮子座'),
+    ('virgo', '处女座'),
+    ('libra', '天秤座'),
+    ('scorpio', '天蝎座'),
+    ('sagittarius', '射手座'),
+    ('capricorn', '摩羯座'),
+    ('aquarius', '水瓶座'),
+    ('pisces', '双鱼座')
+]
+
+# 星座ID列表
+SIGN_IDS = [sign_id for sign_id, _ in SIGN_TABLE]
+
+# 中文星座列表
+CONSTELLATIONS = [name for _, name in SIGN_TABLE]
+
+# 英文到中文星座名称映射
+CONSTELLATION_MAP = dict(SIGN_TABLE)
+
+# 中文到英文星座ID映射
+_NAME_TO_ID = {name: sign_id for sign_id, name in SIGN_TABLE}
+
+
+def normalize_sign_id(sign):
+    """将中英文星座名称统一为标准星座ID，无法识别时返回 None"""
+    if not sign:
+        return None
+
+    sign = str(sign).strip()
+    if sign in _NAME_TO_ID:
+        return _NAME_TO_ID[sign]
+
+    sign_lower = sign.lower()
+    if sign_lower in CONSTELLATION_MAP:
+        return sign_lower
+
+    return None
+
+
+def sign_name(sign_id):
+    """获取星座ID对应的中文名称"""
+    return CONSTELLATION_MAP.get(sign_id, sign_id)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预生成内容池
+按 (内容类型, 星期, 天气类别) 分组，后台调用大模型批量生成文案，请求时直接取用
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class ContentPool:
+    """后台填充的文案池
+
+    - 取用：draw 只在内存中取出一条，不发起网络请求；池为空时返回 None，由调用方使用固定文案
+    - 补充：剩余数量低于 low_water 时在后台补充到 size 条，同一分组同时只有一个补充任务
+    - 不重复：每条文案只取用一次，新生成的文案与最近取用过的 history 条重复时丢弃
+    - 过期：每条文案单独计算过期时间，过期后不再取用
+    - 回源失败：连续失败 max_failures 次后停止本轮补充，等下次取用时再触发，避免冲击故障上游
+
+    generator(分组键) 返回生成的文案，失败时返回 None。
+    """
+
+    def __init__(self, generator, size=5, low_water=2, ttl=86400, history=20, workers=2,
+                 max_failures=2, clock=time.monotonic):
+        self.generator = generator
+        self.size = size
+        self.low_water = low_water
+        self.ttl = ttl
+        self.history_size = history
+        self.max_failures = max_failures
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)  # 放入文案或补充任务结束时通知
+        self._pools = defaultdict(deque)  # 分组键 -> deque[(文案, 过期时间)]
+        self._history = defaultdict(lambda: deque(maxlen=self.history_size))
+        self._refilling = set()
+        self._counters = defaultdict(lambda: {'served': 0, 'empty': 0, 'generated': 0, 'failed': 0, 'expired': 0})
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='content-pool')
+
+    def _purge_expired(self, key):
+        """移除已过期的文案（调用方需持有锁）"""
+        now = self._clock()
+        pool = self._pools[key]
+        fresh = [item for item in pool if item[1] > now]
+        expired = len(pool) - len(fresh)
+        if expired:
+            pool.clear()
+            pool.extend(fresh)
+            self._counters[key]['expired'] += expired
+        return pool
+
+    def draw(self, key):
+        """取出一条文案，池为空时返回 None；剩余不足时在后台补充"""
+        with self._lock:
+            pool = self._purge_expired(key)
+            text = pool.popleft()[0] if pool else None
+            if text is None:
+                self._counters[key]['empty'] += 1
+            else:
+                self._counters[key]['served'] += 1
+                self._history[key].append(text)
+            remaining = len(pool)
+
+        if remaining < self.low_water:
+            self.refill(key)
+        return text
+
+    def refill(self, key):
+        """在后台补充指定分组，返回是否提交了新的补充任务"""
+        with self._lock:
+            if key in self._refilling:
+                return False
+            self._refilling.add(key)
+        try:
+            self._executor.submit(self._fill, key)
+        except RuntimeError:
+            # 线程池已关闭（进程退出中）
+            with self._lock:
+                self._refilling.discard(key)
+            return False
+        return True
+
+    def offer(self, key, text):
+        """放入一条在外部生成的文案（如合并生成时顺带生成的其他分组），返回是否放入"""
+        if not text:
+            return False
+        with self._lock:
+            pool = self._purge_expired(key)
+            if len(pool) >= self.size or text in self._history[key] or any(item[0] == text for item in pool):
+                return False
+            pool.append((text, self._clock() + self.ttl))
+            self._counters[key]['generated'] += 1
+            self._changed.notify_all()
+        return True
+
+    def warm(self, keys):
+        """预热多个分组"""
+        for key in keys:
+            self.refill(key)
+
+    def wait(self, keys, timeout=None):
+        """等待指定分组都有可用文案或补充结束（最多 timeout 秒），返回是否都有可用文案"""
+        def ready():
+            return all(self._purge_expired(key) or key not in self._refilling for key in keys)
+
+        with self._changed:
+            self._changed.wait_for(ready, timeout=timeout)
+            return all(self._purge_expired(key) for key in keys)
+
+    def _fill(self, key):
+        """补充分组直到达到 size 条"""
+        failures = 0
+        attempts = 0
+        try:
+            while attempts < self.size * 2 and failures < self.max_failures:
+                with self._lock:
+                    if len(self._purge_expired(key)) >= self.size:
+                        break
+                attempts += 1
+                try:
+                    text = self.generator(key)
+                except Exception as e:
+                    logger.error(f"内容池生成失败 {key}: {str(e)}")
+                    text = None
+                if not text:
+                    failures += 1
+                    with self._lock:
+                        self._counters[key]['failed'] += 1
+                    continue
+                self.offer(key, text)
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+                self._changed.notify_all()
+        logger.info(f"内容池补充完成 {key}: 当前 {self.available(key)} 条")
+
+    def available(self, key):
+        """获取分组中可用文案数量"""
+        with self._lock:
+            return len(self._purge_expired(key))
+
+    def stats(self):
+        """获取各分组的可用数量和取用统计"""
+        with self._lock:
+            keys = set(self._pools) | set(self._counters)
+            return {
+                '/'.join(part for part in key if part): {
+                    'available': len(self._purge_expired(key)),
+                    'refilling': key in self._refilling,
+                    **self._counters[key]
+                }
+                for key in sorted(keys)
+            }
+
+    def shutdown(self):
+        """停止后台补充任务"""
+        self._executor.shutdown(wait=False)
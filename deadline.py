@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求级时间预算
+每个API请求设置一个截止时间（通过 contextvars 在调用链中传递），上游调用和重试循环按剩余时间收紧超时，
+预算耗尽时不再发起请求而是直接走降级逻辑；同时记录各上游调用的耗时明细，随响应返回
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+_current = contextvars.ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """请求时间预算已耗尽，上游调用未发出"""
+
+
+class Deadline:
+    """一次请求的时间预算和耗时明细
+
+    耗时明细按调用顺序记录名称、开始偏移和耗时（毫秒），并发执行的调用会有时间重叠
+    """
+
+    def __init__(self, budget, clock=time.monotonic):
+        self.budget = budget
+        self._clock = clock
+        self.started = clock()
+        self.expires_at = self.started + budget
+        self._lock = threading.Lock()
+        self._spans = []
+
+    def remaining(self):
+        """剩余秒数，可能为负"""
+        return self.expires_at - self._clock()
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def record(self, name, started, **detail):
+        """记录一次调用的耗时，started 为调用开始时的 clock 值"""
+        span = {
+            'name': name,
+            'start_offset_ms': round((started - self.started) * 1000, 1),
+            'elapsed_ms': round((self._clock() - started) * 1000, 1),
+            **detail
+        }
+        with self._lock:
+            self._spans.append(span)
+
+    def report(self):
+        """获取预算使用情况和耗时明细"""
+        elapsed = self._clock() - self.started
+        with self._lock:
+            spans = list(self._spans)
+        return {
+            'budget_ms': round(self.budget * 1000, 1),
+            'elapsed_ms': round(elapsed * 1000, 1),
+            'remaining_ms': round(max(0.0, self.budget - elapsed) * 1000, 1),
+            'exhausted': elapsed >= self.budget,
+            'spans': spans
+        }
+
+
+def current_deadline():
+    """获取当前请求的时间预算，不在请求中时返回 None"""
+    return _current.get()
+
+
+def remaining_budget():
+    """当前请求剩余的秒数，没有时间预算时返回 None"""
+    deadline = _current.get()
+    return None if deadline is None else deadline.remaining()
+
+
+def bound_timeout(timeout):
+    """按剩余预算收紧超时：返回 min(timeout, 剩余秒数)，不会小于0
+
+    没有时间预算时原样返回；timeout 为 None 时返回剩余秒数
+    """
+    remaining = remaining_budget()
+    if remaining is None:
+        return timeout
+    remaining = max(0.0, remaining)
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def check_deadline(action):
+    """预算已耗尽时抛出 DeadlineExceeded"""
+    deadline = _current.get()
+    if deadline is not None and deadline.expired:
+        raise DeadlineExceeded(f"请求时间预算 {deadline.budget}s 已耗尽，跳过{action}")
+
+
+def activate(budget):
+    """为当前上下文设置时间预算，返回 (Deadline, 用于 deactivate 的令牌)"""
+    deadline = Deadline(budget)
+    return deadline, _current.set(deadline)
+
+
+def deactivate(token):
+    """恢复设置时间预算之前的上下文"""
+    _current.reset(token)
+
+
+@contextmanager
+def request_deadline(budget):
+    """在代码块内使用时间预算"""
+    deadline, token = activate(budget)
+    try:
+        yield deadline
+    finally:
+        deactivate(token)
+
+
+@contextmanager
+def deadline_span(name, **detail):
+    """记录代码块耗时到当前请求的耗时明细（没有时间预算时不记录）"""
+    deadline = _current.get()
+    if deadline is None:
+        yield
+        return
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        deadline.record(name, started, **detail)
@@ -135,9 +135,9 @@ start_service() {
         docker rm $CONTAINER_NAME || true
     fi
     
-    # 创建日志目录
-    mkdir -p logs
-    chmod 755 logs
+    # 创建日志目录和数据目录（本地持久化缓存）
+    mkdir -p logs data
+    chmod 755 logs data
     
     # 启动新容器
     log_info "启动Docker容器..."
@@ -148,6 +148,7 @@ start_service() {
         -e TZ=Asia/Shanghai \
         --env-file .env \
         -v $(pwd)/logs:/app/logs \
+        -v $(pwd)/data:/app/data \
         $IMAGE_NAME:latest; then
         
         # 等待服务启动
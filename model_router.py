@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型路由
+按配置顺序维护候选模型，记录每个模型最近的耗时和错误率，
+每次调用选择满足内容类型耗时目标的最快健康模型，超时或失败时切换到下一个模型
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from ark_client import ArkResult
+from deadline import bound_timeout
+
+logger = logging.getLogger(__name__)
+
+
+class ModelStats:
+    """单个模型最近 window 次调用的耗时和成功情况"""
+
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)  # 成功调用的耗时（毫秒）
+        self.outcomes = deque(maxlen=window)  # True 成功，False 失败或超时
+        self.last_failure = None
+        self.counters = defaultdict(int)
+
+    def percentile(self, fraction):
+        """最近成功调用耗时的分位数，没有样本时返回 None"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    @property
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+class ModelRouter:
+    """带故障切换的模型路由
+
+    - 排序：健康且最近 p90 耗时不超过目标的模型优先（按耗时从快到慢，没有样本的按配置顺序排在已知模型之后），
+      其次是健康但超出目标的模型，最后是不健康的模型
+    - 健康：最近调用至少 min_samples 次且错误率达到 error_threshold 时视为不健康，
+      最后一次失败经过 cooldown 秒后重新参与排序，成功后错误率随之下降
+    - 切换：候选模型没有返回内容（超时、限流重试耗尽、上游错误）时换下一个模型；
+      非最后一个候选的单次时间预算为 min(剩余预算, 耗时目标 × failover_factor)
+    """
+
+    def __init__(self, client, models, latency_targets=None, default_target_ms=5000, window=50,
+                 error_threshold=0.5, min_samples=5, cooldown=60, failover_factor=2, clock=time.monotonic):
+        if not models:
+            raise ValueError("至少需要配置一个模型")
+        self.client = client
+        self.models = list(dict.fromkeys(models))  # 去重并保持配置顺序
+        self.latency_targets = dict(latency_targets or {})
+        self.default_target_ms = default_target_ms
+        self.error_threshold = error_threshold
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.failover_factor = failover_factor
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stats = {model: ModelStats(window) for model in self.models}
+
+    def target_for(self, content_type):
+        """获取内容类型的耗时目标（毫秒）"""
+        return self.latency_targets.get(content_type, self.default_target_ms)
+
+    def _healthy(self, stats, now):
+        """判断模型是否健康（调用方需持有锁）"""
+        if len(stats.outcomes) < self.min_samples or stats.error_rate < self.error_threshold:
+            return True
+        return stats.last_failure is None or now - stats.last_failure >= self.cooldown
+
+    def candidates(self, content_type=None):
+        """按路由优先级返回候选模型列表"""
+        target = self.target_for(content_type)
+        now = self._clock()
+        with self._lock:
+            ranked = []
+            for index, model in enumerate(self.models):
+                stats = self._stats[model]
+                latency = stats.percentile(0.9)
+                if not self._healthy(stats, now):
+                    tier = 2
+                elif latency is None or latency <= target:
+                    tier = 0
+                else:
+                    tier = 1
+                ranked.append((tier, latency if latency is not None else float('inf'), index, model))
+        return [model for *_, model in sorted(ranked)]
+
+    def record(self, model, elapsed_ms, success, timed_out=False):
+        """记录一次调用结果"""
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                return
+            stats.outcomes.append(success)
+            stats.counters['calls'] += 1
+            if success:
+                stats.latencies.append(elapsed_ms)
+            else:
+                stats.last_failure = self._clock()
+                stats.counters['failures'] += 1
+            if timed_out:
+                stats.counters['timeouts'] += 1
+
+    def complete(self, prompt, content_type=None, deadline=None, **kwargs):
+        """按路由顺序调用模型，返回第一个有内容的 ArkResult；全部失败时返回最后一个结果"""
+        if not self.client.configured:
+            return ArkResult()
+        deadline = bound_timeout(deadline or self.client.deadline)
+        target_seconds = self.target_for(content_type) / 1000
+        started = self._clock()
+        chain = self.candidates(content_type)
+        result = None
+        for position, model in enumerate(chain):
+            remaining = deadline - (self._clock() - started)
+            if remaining <= 0:
+                break
+            is_last = position == len(chain) - 1
+            budget = remaining if is_last else min(remaining, target_seconds * self.failover_factor)
+            result = self.client.complete(prompt, deadline=budget, model=model, **kwargs)
+            self.record(model, result.elapsed_ms, bool(result.content), timed_out=result.truncated)
+            if result.content:
+                with self._lock:
+                    self._stats[model].counters['selected'] += 1
+                if position:
+                    logger.warning(f"ARK模型切换: {chain[0]} 不可用，已由 {model} 生成 {content_type or '内容'}")
+                return result
+            if not is_last:
+                logger.warning(f"ARK模型 {model} 未返回内容（耗时 {result.elapsed_ms}ms），切换到下一个模型")
+        return result if result is not None else ArkResult()
+
+    def stats(self):
+        """获取各模型的耗时分位数、错误率和健康状态"""
+        now = self._clock()
+        with self._lock:
+            models = {
+                model: {
+                    'healthy': self._healthy(stats, now),
+                    'samples': len(stats.outcomes),
+                    'p50_ms': stats.percentile(0.5),
+                    'p90_ms': stats.percentile(0.9),
+                    'error_rate': round(stats.error_rate, 3),
+                    **stats.counters
+                }
+                for model, stats in self._stats.items()
+            }
+        return {
+            'order': self.models,
+            'latency_targets_ms': {**self.latency_targets, 'default': self.default_target_ms},
+            'models': models
+        }
@@ -0,0 +1,610 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+webhook发送队列
+消息先入队并立即返回任务ID，后台线程按每个机器人的频率限制发送，
+遇到限流错误码或网络异常时退避重试，并记录每次尝试的耗时和结果；
+配置本地存储时任务写入SQLite，进程重启后重新发送未完成的任务（至少送达一次），相同消息ID去重；
+多个进程共享同一个存储时，每个任务由持有租约的进程发送
+"""
+
+import hashlib
+import heapq
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# 企业微信机器人错误码：45009 接口调用频率超限，-1 系统繁忙
+RATE_LIMIT_ERRCODES = (45009,)
+TRANSIENT_ERRCODES = (-1,)
+
+
+def webhook_label(url):
+    """webhook的展示名称：只保留key的前4位，避免在接口和日志中暴露完整密钥"""
+    key = parse_qs(urlsplit(url or '').query).get('key', [''])[0]
+    return f"key={key[:4]}…" if key else urlsplit(url or '').netloc
+
+
+def webhook_id(url):
+    """webhook的短标识（地址的哈希），用于按目标区分消息ID"""
+    return hashlib.sha1((url or '').encode('utf-8')).hexdigest()[:8]
+
+
+class OutboxJob:
+    """一条待发送消息"""
+
+    QUEUED = 'queued'
+    SENDING = 'sending'
+    RETRYING = 'retrying'
+    DELIVERED = 'delivered'
+    FAILED = 'failed'
+    FINISHED = (DELIVERED, FAILED)
+
+    def __init__(self, webhook, payload, created_at, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.webhook = webhook
+        self.payload = payload
+        self.state = self.QUEUED
+        self.created_at = created_at
+        self.updated_at = created_at
+        self.next_attempt_at = created_at
+        self.attempts = []
+        self.error = None
+        self.done = threading.Event()
+
+    def snapshot(self):
+        """任务状态（不含消息内容和完整webhook地址）"""
+        def iso(moment):
+            return datetime.fromtimestamp(moment).isoformat() if moment else None
+
+        finished = self.state in self.FINISHED
+        return {
+            'job_id': self.id,
+            'duplicate': False,
+            'state': self.state,
+            'webhook': webhook_label(self.webhook),
+            'webhook_id': webhook_id(self.webhook),
+            'created_at': iso(self.created_at),
+            'updated_at': iso(self.updated_at),
+            'next_attempt_at': None if finished else iso(self.next_attempt_at),
+            'total_ms': round((self.updated_at - self.created_at) * 1000, 1) if finished else None,
+            'attempts': [dict(attempt, started_at=iso(attempt['started_at'])) for attempt in self.attempts],
+            'error': self.error
+        }
+
+
+class OutboxStore:
+    """基于SQLite的发送任务存储
+
+    - 使用WAL模式，入队时同步写入一行（约0.1毫秒），返回前任务已落盘，进程退出不会丢失
+    - 状态变化（每次尝试、送达、失败）由发送线程写回，重启时读取未完成的任务重新发送
+    - 已结束的任务保留到 purge 清理，期间相同消息ID的任务不会重复发送
+    - 租约：每个未结束的任务记录持有者（owner）和租约到期时间（lease_until），
+      写入和认领都是带条件的单条 UPDATE/UPSERT，其他持有者租约未过期的任务不会被覆盖或认领；
+      多个进程（如 Flask 重载器的父子进程）共享同一个存储时同一任务只由一个进程发送
+    """
+
+    COLUMNS = 'id, webhook, payload, state, created_at, updated_at, next_attempt_at, attempts, error'
+    LEASE_COLUMNS = {'owner': 'TEXT', 'lease_until': 'REAL NOT NULL DEFAULT 0'}
+
+    def __init__(self, directory, filename='webhook_outbox.sqlite3'):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, filename)
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS outbox_jobs ('
+            ' id TEXT PRIMARY KEY,'
+            ' webhook TEXT NOT NULL,'
+            ' payload TEXT NOT NULL,'
+            ' state TEXT NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' updated_at REAL NOT NULL,'
+            ' next_attempt_at REAL NOT NULL,'
+            ' attempts TEXT NOT NULL,'
+            ' error TEXT,'
+            ' owner TEXT,'
+            ' lease_until REAL NOT NULL DEFAULT 0)'
+        )
+        # 早期版本创建的表没有租约字段
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(outbox_jobs)')}
+        for column, definition in self.LEASE_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f'ALTER TABLE outbox_jobs ADD COLUMN {column} {definition}')
+        conn.execute('CREATE INDEX IF NOT EXISTS outbox_jobs_state ON outbox_jobs (state, updated_at)')
+        conn.commit()
+
+    def _connect(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA busy_timeout=5000')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def save(self, job, owner, lease_until, now):
+        """以 owner 的身份写入或覆盖任务并设置租约，返回是否写入
+
+        同ID的任务未结束、由其他持有者持有且租约未过期时不覆盖，返回 False
+        """
+        row = (job.id, job.webhook, json.dumps(job.payload, ensure_ascii=False), job.state, job.created_at,
+               job.updated_at, job.next_attempt_at, json.dumps(job.attempts, ensure_ascii=False), job.error,
+               owner, lease_until)
+        conn = self._connect()
+        with conn:
+            return conn.execute(
+                f'INSERT INTO outbox_jobs ({self.COLUMNS}, owner, lease_until)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT (id) DO UPDATE SET webhook = excluded.webhook, payload = excluded.payload,'
+                ' state = excluded.state, created_at = excluded.created_at, updated_at = excluded.updated_at,'
+                ' next_attempt_at = excluded.next_attempt_at, attempts = excluded.attempts, error = excluded.error,'
+                ' owner = excluded.owner, lease_until = excluded.lease_until'
+                ' WHERE outbox_jobs.owner IS excluded.owner OR outbox_jobs.state IN (?, ?)'
+                ' OR outbox_jobs.lease_until < ?',
+                (*row, *OutboxJob.FINISHED, now)
+            ).rowcount == 1
+
+    def claim(self, job_id, owner, lease_until, now):
+        """认领一个未结束的任务并标记为发送中，返回是否认领成功
+
+        任务已结束、或由其他持有者持有且租约未过期时认领失败
+        """
+        conn = self._connect()
+        with conn:
+            return conn.execute(
+                'UPDATE outbox_jobs SET state = ?, owner = ?, lease_until = ?'
+                ' WHERE id = ? AND state NOT IN (?, ?) AND (owner IS ? OR owner IS NULL OR lease_until < ?)',
+                (OutboxJob.SENDING, owner, lease_until, job_id, *OutboxJob.FINISHED, owner, now)
+            ).rowcount == 1
+
+    def claim_pending(self, owner, lease_until, now):
+        """认领所有无人持有或租约已过期的未结束任务，返回 owner 持有的全部未结束任务（按入队顺序）"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'UPDATE outbox_jobs SET owner = ?, lease_until = ?'
+                ' WHERE state NOT IN (?, ?) AND (owner IS NULL OR lease_until < ?)',
+                (owner, lease_until, *OutboxJob.FINISHED, now)
+            )
+            rows = conn.execute(
+                f'SELECT {self.COLUMNS} FROM outbox_jobs WHERE owner = ? AND state NOT IN (?, ?) ORDER BY created_at',
+                (owner, *OutboxJob.FINISHED)
+            ).fetchall()
+        return [self._job_from_row(row) for row in rows]
+
+    def renew(self, owner, lease_until):
+        """续期 owner 持有的所有未结束任务的租约，返回续期条数"""
+        conn = self._connect()
+        with conn:
+            return conn.execute(
+                'UPDATE outbox_jobs SET lease_until = ? WHERE owner = ? AND state NOT IN (?, ?)',
+                (lease_until, owner, *OutboxJob.FINISHED)
+            ).rowcount
+
+    @staticmethod
+    def _job_from_row(row):
+        job_id, webhook, payload, state, created_at, updated_at, next_attempt_at, attempts, error = row
+        job = OutboxJob(webhook, json.loads(payload), created_at, job_id=job_id)
+        job.state = state
+        job.updated_at = updated_at
+        job.next_attempt_at = next_attempt_at
+        job.attempts = json.loads(attempts)
+        job.error = error
+        if state in OutboxJob.FINISHED:
+            job.done.set()
+        return job
+
+    def load(self, job_id):
+        """读取任务，不存在时返回 None"""
+        row = self._connect().execute(
+            f'SELECT {self.COLUMNS} FROM outbox_jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+        return self._job_from_row(row) if row else None
+
+    def purge(self, before):
+        """删除 before 之前结束的任务，返回删除条数"""
+        conn = self._connect()
+        with conn:
+            return conn.execute(
+                'DELETE FROM outbox_jobs WHERE state IN (?, ?) AND updated_at < ?', (*OutboxJob.FINISHED, before)
+            ).rowcount
+
+
+class WebhookOutbox:
+    """按机器人限流的异步发送队列
+
+    - 入队：submit 立即返回任务，由后台线程按 next_attempt_at 顺序发送
+    - 限流：每个webhook一个令牌桶（默认每分钟20条，与企业微信机器人限制一致），
+      某个机器人额度用完时只推迟它的任务，其他机器人的任务照常发送
+    - 并发：workers 个发送线程同时向不同机器人发送，同一机器人同一时间只发送一条，保持入队顺序
+    - 重试：限流错误码（45009）暂停该机器人 rate_limit_pause 秒后重试；网络异常、5xx和系统繁忙
+      按带抖动的指数退避重试；其他错误码直接失败。最多尝试 max_attempts 次
+    - 保留：已结束的任务保留 retention 秒供查询，内存中最多保留 max_jobs 个
+    - 持久化：配置 store 时入队即落盘，start 时重新安排上次未完成的任务；发送成功但未来得及记录时
+      重启后会再发一次（至少送达一次）
+    - 租约：共享同一个 store 的多个实例中，任务由入队或认领它的实例持有，租约 lease 秒，
+      运行期间每 lease/3 秒续期；每次发送前重新认领，只发送本实例认领成功的任务。
+      其他实例退出后租约过期的任务由存活的实例认领并继续发送
+    - 去重：submit 指定 message_id 时，同一ID已有未失败的任务（保留期内，含其他实例入队的任务）
+      则直接返回该任务，不再发送
+
+    deliver(webhook, payload) 发送一次，返回企业微信响应的JSON；网络异常时抛出 requests 异常。
+    """
+
+    def __init__(self, deliver, rate_per_minute=20, max_attempts=5, base_delay=2, max_delay=120,
+                 rate_limit_pause=60, retention=3600, max_jobs=1000, store=None, workers=1, lease=120,
+                 poll_interval=1.0, clock=time.time):
+        self.deliver = deliver
+        self.rate_per_minute = rate_per_minute
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limit_pause = rate_limit_pause
+        self.retention = retention
+        self.max_jobs = max_jobs
+        self.store = store
+        self.workers = max(1, workers)
+        self.lease = lease
+        self.poll_interval = poll_interval  # 等待其他实例持有的任务时，查询存储的间隔（秒）
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"  # 本实例在存储中的持有者标识
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._jobs = OrderedDict()  # 任务ID -> OutboxJob，按入队顺序
+        self._heap = []  # (next_attempt_at, 序号, 任务ID)
+        self._seq = 0
+        self._buckets = {}  # webhook -> TokenBucket
+        self._sending = set()  # 正在发送的webhook
+        self._blocked = {}  # webhook -> 等该机器人当前发送结束后再安排的任务
+        self._counters = {'submitted': 0, 'delivered': 0, 'failed': 0, 'retries': 0, 'rate_limited': 0,
+                          'deduplicated': 0, 'replayed': 0, 'lost_claims': 0, 'store_errors': 0}
+        self._purged_at = 0.0
+        self._maintained_at = 0.0
+        self._threads = []
+        self._running = False
+
+    def start(self):
+        """启动发送线程（有本地存储时先重新安排上次未完成的任务）"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._replay()
+        self._threads = [
+            threading.Thread(target=self._run, name=f'webhook-outbox-{index}', daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=5):
+        """停止发送线程（未发送的任务保留在队列中）"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+    def _replay(self):
+        """认领本地存储中无人持有（或租约已过期）的未完成任务并安排发送（调用方需持有锁）"""
+        if self.store is None:
+            return
+        now = self._clock()
+        try:
+            jobs = self.store.claim_pending(self.owner, now + self.lease, now)
+        except sqlite3.Error as e:
+            logger.error(f"读取待发送任务失败: {str(e)}")
+            return
+        jobs = [job for job in jobs if job.id not in self._jobs]
+        for job in jobs:
+            self._jobs[job.id] = job
+            self._schedule(job, max(now, job.next_attempt_at))
+        if jobs:
+            self._counters['replayed'] += len(jobs)
+            logger.info(f"已恢复 {len(jobs)} 条未发送的webhook消息")
+
+    def _maintain_store(self, now):
+        """续期本实例持有任务的租约，并认领其他实例退出后遗留的任务（调用方需持有锁，最多每 lease/3 秒一次）"""
+        if self.store is None or now - self._maintained_at < self.lease / 3:
+            return
+        self._maintained_at = now
+        try:
+            self.store.renew(self.owner, now + self.lease)
+        except sqlite3.Error as e:
+            self._counters['store_errors'] += 1
+            logger.error(f"续期发送任务租约失败: {str(e)}")
+        self._replay()
+
+    def _persist(self, job):
+        """以本实例的身份把任务状态写入本地存储（调用方需持有锁）
+
+        同ID的任务由其他实例持有时返回 False；写入失败时只记录日志并返回 True（任务仍在内存中发送）
+        """
+        if self.store is None:
+            return True
+        now = self._clock()
+        try:
+            return self.store.save(job, self.owner, max(now, job.next_attempt_at) + self.lease, now)
+        except sqlite3.Error as e:
+            self._counters['store_errors'] += 1
+            logger.error(f"保存发送任务失败 {job.id}: {str(e)}")
+            return True
+
+    def _claim(self, job, now):
+        """发送前认领任务（调用方需持有锁），任务已由其他实例持有或已结束时返回 False"""
+        if self.store is None:
+            return True
+        try:
+            return self.store.claim(job.id, self.owner, now + self.lease, now)
+        except sqlite3.Error as e:
+            self._counters['store_errors'] += 1
+            logger.error(f"认领发送任务失败 {job.id}: {str(e)}")
+            return True
+
+    def _release(self, job):
+        """放弃已由其他实例持有的任务（调用方需持有锁）"""
+        self._counters['lost_claims'] += 1
+        self._jobs.pop(job.id, None)
+        logger.warning(f"webhook发送任务已由其他实例持有，本实例不再发送: {job.id}")
+
+    def _purge_store(self, now):
+        """清理本地存储中超过保留时间的已结束任务（最多每分钟一次）"""
+        if self.store is None or now - self._purged_at < 60:
+            return
+        self._purged_at = now
+        try:
+            self.store.purge(now - self.retention)
+        except sqlite3.Error as e:
+            logger.error(f"清理发送任务失败: {str(e)}")
+
+    def _bucket_for(self, webhook):
+        """获取webhook的令牌桶（调用方需持有锁）"""
+        bucket = self._buckets.get(webhook)
+        if bucket is None:
+            bucket = self._buckets[webhook] = TokenBucket.per_minute(self.rate_per_minute)
+        return bucket
+
+    def _schedule(self, job, when):
+        """安排任务在 when 时刻发送（调用方需持有锁）"""
+        job.next_attempt_at = when
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, job.id))
+        self._cond.notify()
+
+    def _purge(self, now):
+        """清理超过保留时间或数量上限的已结束任务（调用方需持有锁）"""
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs and now - self._jobs[job_id].updated_at < self.retention:
+                break
+            if self._jobs[job_id].state in OutboxJob.FINISHED:
+                del self._jobs[job_id]
+
+    def _lookup(self, job_id):
+        """按ID查找任务：先查内存，再查本地存储（调用方需持有锁）"""
+        job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            try:
+                job = self.store.load(job_id)
+            except sqlite3.Error as e:
+                logger.error(f"读取发送任务失败 {job_id}: {str(e)}")
+        return job
+
+    def submit(self, webhook, payload, message_id=None):
+        """消息入队，返回任务状态
+
+        message_id 用作任务ID：同一ID已有未失败的任务时不再入队，返回该任务（duplicate 为 True）
+        """
+        now = self._clock()
+        with self._cond:
+            if message_id:
+                existing = self._lookup(message_id)
+                if existing is not None and (existing.state not in OutboxJob.FINISHED or (
+                        existing.state == OutboxJob.DELIVERED and now - existing.updated_at < self.retention)):
+                    self._counters['deduplicated'] += 1
+                    return dict(existing.snapshot(), duplicate=True)
+            job = OutboxJob(webhook, payload, now, job_id=message_id)
+            self._purge(now)
+            if not self._persist(job):
+                # 其他实例同时入队了相同ID的消息
+                self._counters['deduplicated'] += 1
+                existing = self._lookup(job.id) or job
+                return dict(existing.snapshot(), duplicate=True)
+            self._jobs[job.id] = job
+            self._jobs.move_to_end(job.id)
+            self._counters['submitted'] += 1
+            self._schedule(job, now)
+            return job.snapshot()
+
+    def get(self, job_id):
+        """查询任务状态，不存在（或已清理）时返回 None"""
+        with self._cond:
+            job = self._lookup(job_id)
+            return job.snapshot() if job else None
+
+    def wait(self, job_id, timeout=None):
+        """等待任务结束（送达或失败），返回任务状态；超时时返回当前状态
+
+        其他实例持有的任务按 poll_interval 查询存储中的状态
+        """
+        for snapshot in self.as_completed([job_id], timeout=timeout):
+            return snapshot
+        return None
+
+    def as_completed(self, job_ids, timeout=None):
+        """按结束顺序逐个返回任务状态；超时后返回其余任务的当前状态，不存在的任务跳过"""
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        pending = list(dict.fromkeys(job_ids))
+        while pending:
+            with self._cond:
+                jobs = [(job_id, self._lookup(job_id)) for job_id in pending]
+                finished = [job.snapshot() for _, job in jobs if job is not None and job.state in OutboxJob.FINISHED]
+                pending = [job_id for job_id, job in jobs if job is not None and job.state not in OutboxJob.FINISHED]
+                remaining = None if expires_at is None else expires_at - time.monotonic()
+                if not finished and pending:
+                    if remaining is not None and remaining <= 0:
+                        finished = [job.snapshot() for _, job in jobs if job is not None]
+                        pending = []
+                    elif all(job_id in self._jobs for job_id in pending):
+                        self._cond.wait(remaining)
+                    else:
+                        # 其他实例持有的任务结束时不会通知本实例，定期查询存储
+                        self._cond.wait(self.poll_interval if remaining is None
+                                        else min(remaining, self.poll_interval))
+            yield from finished
+
+    def _next_job(self):
+        """取出下一个可以发送的任务，停止时返回 None"""
+        # 有本地存储时至少每 lease/3 秒醒来一次，续期租约
+        max_wait = self.lease / 3 if self.store is not None else None
+        with self._cond:
+            while self._running:
+                now = self._clock()
+                self._maintain_store(now)
+                if not self._heap:
+                    self._cond.wait(max_wait)
+                    continue
+                when, _, job_id = self._heap[0]
+                if when > now:
+                    self._cond.wait(when - now if max_wait is None else min(when - now, max_wait))
+                    continue
+                heapq.heappop(self._heap)
+                job = self._jobs.get(job_id)
+                if job is None or job.state in OutboxJob.FINISHED or job.next_attempt_at != when:
+                    continue  # 已清理或已重新安排
+                if job.webhook in self._sending:
+                    self._blocked.setdefault(job.webhook, []).append(job)  # 该机器人正在发送，结束后再安排
+                    continue
+                wait = self._bucket_for(job.webhook).try_acquire()
+                if wait > 0:
+                    self._schedule(job, now + wait)  # 该机器人额度已用完，推迟它的任务
+                    continue
+                if not self._claim(job, now):
+                    self._release(job)
+                    continue
+                job.state = OutboxJob.SENDING
+                job.updated_at = now
+                self._sending.add(job.webhook)
+                return job
+        return None
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self._attempt(job)
+            except Exception as e:
+                logger.error(f"webhook发送任务异常 {job.id}: {str(e)}")
+                self._finish(job, OutboxJob.FAILED, str(e))
+            with self._cond:
+                self._sending.discard(job.webhook)
+                for blocked in self._blocked.pop(job.webhook, []):
+                    self._schedule(blocked, blocked.next_attempt_at)
+                self._purge_store(self._clock())
+
+    def _backoff(self, attempt):
+        """第 attempt 次失败后的重试等待（带抖动的指数退避）"""
+        return random.uniform(0.5, 1) * min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+
+    def _attempt(self, job):
+        """发送一次并根据结果安排重试或结束任务"""
+        started = self._clock()
+        record = {'started_at': started}
+        retry_after, error = None, None
+        try:
+            result = self.deliver(job.webhook, job.payload)
+            errcode = result.get('errcode')
+            record['errcode'] = errcode
+            if errcode == 0:
+                record['outcome'] = 'delivered'
+            elif errcode in RATE_LIMIT_ERRCODES:
+                record['outcome'] = 'rate_limited'
+                retry_after = self.rate_limit_pause
+                error = f"频率超限: {result.get('errmsg')}"
+            elif errcode in TRANSIENT_ERRCODES:
+                record['outcome'] = 'retryable'
+                error = f"系统繁忙: {result.get('errmsg')}"
+            else:
+                record['outcome'] = 'rejected'
+                error = f"errcode {errcode}: {result.get('errmsg')}"
+        except requests.exceptions.RequestException as e:
+            record['outcome'] = 'retryable'
+            error = str(e)
+        record['elapsed_ms'] = round((self._clock() - started) * 1000, 1)
+        if error:
+            record['error'] = error
+
+        with self._cond:
+            job.attempts.append(record)
+        attempt = len(job.attempts)
+        if record['outcome'] == 'delivered':
+            logger.info(f"webhook消息已送达 {job.id}（第{attempt}次尝试）")
+            self._finish(job, OutboxJob.DELIVERED)
+            return
+        if record['outcome'] == 'rejected' or attempt >= self.max_attempts:
+            logger.error(f"webhook消息发送失败 {job.id}（共{attempt}次尝试）: {error}")
+            self._finish(job, OutboxJob.FAILED, error)
+            return
+
+        delay = self._backoff(attempt) if retry_after is None else retry_after
+        logger.warning(f"webhook消息发送失败 {job.id}，{delay:.1f}秒后第{attempt + 1}次尝试: {error}")
+        with self._cond:
+            if retry_after is not None:
+                self._bucket_for(job.webhook).pause(retry_after)
+                self._counters['rate_limited'] += 1
+            self._counters['retries'] += 1
+            job.state = OutboxJob.RETRYING
+            job.error = error
+            job.updated_at = self._clock()
+            job.next_attempt_at = job.updated_at + delay
+            if self._persist(job):
+                self._schedule(job, job.next_attempt_at)
+            else:
+                self._release(job)
+
+    def _finish(self, job, state, error=None):
+        """结束任务"""
+        with self._cond:
+            job.state = state
+            job.error = error
+            job.updated_at = self._clock()
+            self._counters['delivered' if state == OutboxJob.DELIVERED else 'failed'] += 1
+            self._persist(job)
+            self._cond.notify_all()
+        job.done.set()
+
+    def stats(self):
+        """获取队列长度、各状态任务数和各机器人的限流状态"""
+        with self._cond:
+            states = {}
+            for job in self._jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {
+                'running': self._running,
+                'pending': sum(1 for job in self._jobs.values() if job.state not in OutboxJob.FINISHED),
+                'states': states,
+                'rate_per_minute': self.rate_per_minute,
+                'workers': self.workers,
+                'sending': len(self._sending),
+                'persistent': self.store.path if self.store is not None else None,
+                'webhooks': {webhook_label(webhook): bucket.stats() for webhook, bucket in self._buckets.items()},
+                **self._counters
+            }
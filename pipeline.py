@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+消息分段并发流水线
+将每日消息拆分为有依赖关系的分段（DAG），无依赖的分段并发执行
+"""
+
+import contextvars
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from deadline import bound_timeout
+
+logger = logging.getLogger(__name__)
+
+
+class Section:
+    """消息分段
+
+    func 和 fallback 均接收依赖分段的结果字典 {分段名: 结果}。
+    超时或异常时使用 fallback 的返回值。
+    """
+
+    def __init__(self, name, func, depends_on=(), timeout=None, fallback=None):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.timeout = timeout
+        self.fallback = fallback
+
+
+class SectionPipeline:
+    """按依赖关系调度分段的执行器
+
+    分段在线程池中执行时沿用提交时的上下文（包括请求时间预算），
+    分段超时不超过请求剩余的时间预算
+    """
+
+    def __init__(self, executor, default_timeout=30):
+        self.executor = executor
+        self.default_timeout = default_timeout
+
+    def _validate(self, sections):
+        """校验分段名称唯一且依赖存在、无环"""
+        names = [section.name for section in sections]
+        if len(names) != len(set(names)):
+            raise ValueError(f"分段名称重复: {names}")
+
+        by_name = {section.name: section for section in sections}
+        for section in sections:
+            for dep in section.depends_on:
+                if dep not in by_name:
+                    raise ValueError(f"分段 {section.name} 依赖不存在的分段 {dep}")
+
+        # 拓扑检查，防止循环依赖导致永久等待
+        visited, visiting = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"分段存在循环依赖: {name}")
+            visiting.add(name)
+            for dep in by_name[name].depends_on:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in names:
+            visit(name)
+
+    def _use_fallback(self, section, inputs, results, timings, status, error=None):
+        """记录分段降级结果"""
+        value = None
+        if section.fallback:
+            try:
+                value = section.fallback(inputs)
+            except Exception as e:
+                logger.error(f"分段 {section.name} 降级失败: {str(e)}")
+        results[section.name] = value
+        timings[section.name]['status'] = status
+        if error:
+            timings[section.name]['error'] = error
+
+    def run(self, sections):
+        """执行所有分段
+
+        返回 (结果字典, 耗时明细)。耗时明细按分段记录开始偏移、耗时（毫秒）和状态。
+        """
+        self._validate(sections)
+
+        started = time.monotonic()
+        results = {}
+        timings = {}
+        pending = {section.name: section for section in sections}
+        running = {}  # future -> (section, 开始时间, 截止时间, 输入)
+
+        def elapsed_ms(since):
+            return round((time.monotonic() - since) * 1000, 1)
+
+        while pending or running:
+            # 提交依赖已满足的分段
+            for name, section in list(pending.items()):
+                if all(dep in results for dep in section.depends_on):
+                    inputs = {dep: results[dep] for dep in section.depends_on}
+                    section_start = time.monotonic()
+                    timeout = bound_timeout(section.timeout or self.default_timeout)
+                    timings[name] = {
+                        'start_offset_ms': elapsed_ms(started),
+                        'depends_on': list(section.depends_on),
+                        'timeout': timeout
+                    }
+                    future = self.executor.submit(contextvars.copy_context().run, section.func, inputs)
+                    running[future] = (section, section_start, section_start + timeout, inputs)
+                    del pending[name]
+
+            if not running:
+                break
+
+            next_deadline = min(item[2] for item in running.values())
+            done, _ = wait(list(running), timeout=max(0, next_deadline - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+
+            for future in done:
+                section, section_start, _, inputs = running.pop(future)
+                timings[section.name]['elapsed_ms'] = elapsed_ms(section_start)
+                try:
+                    results[section.name] = future.result()
+                    timings[section.name]['status'] = 'ok'
+                except Exception as e:
+                    logger.error(f"分段 {section.name} 执行失败: {str(e)}")
+                    self._use_fallback(section, inputs, results, timings, 'error', str(e))
+
+            # 超出时间预算的分段直接降级，后台任务自行结束
+            now = time.monotonic()
+            for future, (section, section_start, deadline, inputs) in list(running.items()):
+                if now >= deadline:
+                    running.pop(future)
+                    timings[section.name]['elapsed_ms'] = elapsed_ms(section_start)
+                    logger.warning(f"分段 {section.name} 超过时间预算 {timings[section.name]['timeout']}s，使用降级内容")
+                    self._use_fallback(section, inputs, results, timings, 'timeout')
+
+        timings['_total'] = {'elapsed_ms': elapsed_ms(started)}
+        return results, timings
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+令牌桶限流
+按固定速率补充令牌，取用时令牌不足则等待；支持事后按实际用量补扣和按上游要求暂停
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """线程安全的令牌桶
+
+    - rate：每秒补充的令牌数，capacity：桶容量（允许的突发量）
+    - acquire：取用令牌，不足时最多等待 timeout 秒，超时返回 False 且不扣减
+    - charge：事后补扣（正数）或退还（负数）令牌，余额可以为负，之后的取用会等待欠额补齐
+    - pause：上游返回 Retry-After 时暂停放行，所有等待者一起顺延
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("令牌桶速率和容量必须大于0")
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._rejected = 0
+
+    @classmethod
+    def per_minute(cls, limit, **kwargs):
+        """按每分钟上限创建令牌桶，容量为一分钟的额度"""
+        return cls(limit / 60.0, limit, **kwargs)
+
+    def _refill(self, now):
+        """按经过时间补充令牌（调用方需持有锁）"""
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _wait_time(self, amount, now):
+        """获取取用 amount 个令牌还需等待的秒数（调用方需持有锁）"""
+        self._refill(now)
+        wait = max(0.0, self._paused_until - now)
+        if self._tokens < amount:
+            wait = max(wait, (amount - self._tokens) / self.rate)
+        return wait
+
+    def try_acquire(self, amount=1):
+        """不等待地取用令牌，成功返回 0，否则返回还需等待的秒数"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            wait = self._wait_time(amount, self._clock())
+            if wait <= 0:
+                self._tokens -= amount
+        return wait
+
+    def acquire(self, amount=1, timeout=None):
+        """取用令牌，最多等待 timeout 秒（None 表示一直等待），返回是否取得"""
+        amount = min(amount, self.capacity)  # 超过容量的请求按满桶处理，避免永远等待
+        started = self._clock()
+        waited = False
+        while True:
+            with self._lock:
+                now = self._clock()
+                wait = self._wait_time(amount, now)
+                if wait <= 0:
+                    self._tokens -= amount
+                    if waited:
+                        self._waits += 1
+                        self._wait_seconds += now - started
+                    return True
+                if timeout is not None and now - started + wait > timeout:
+                    self._rejected += 1
+                    return False
+            waited = True
+            self._sleep(wait)
+
+    def charge(self, amount):
+        """按实际用量补扣（正数）或退还（负数）令牌"""
+        with self._lock:
+            self._refill(self._clock())
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+    def pause(self, seconds):
+        """暂停放行 seconds 秒"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def stats(self):
+        """获取令牌余额和等待统计"""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            return {
+                'rate_per_minute': round(self.rate * 60, 1),
+                'capacity': self.capacity,
+                'available': round(self._tokens, 1),
+                'paused_seconds': round(max(0.0, self._paused_until - now), 1),
+                'waits': self._waits,
+                'wait_seconds': round(self._wait_seconds, 2),
+                'rejected': self._rejected
+            }
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程内定时任务
+解析 CRON_SCHEDULE，在推送时间前预生成每日消息，到点只执行webhook发送；
+支持重启后补发错过的推送，并记录最近一次运行情况
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # 非Unix平台不支持文件锁，退化为不加锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class CronSchedule:
+    """五字段cron表达式：分 时 日 月 周
+
+    支持 *、数字、范围（1-5）、列表（1,3,5）和步长（*/15、0-30/10）。
+    周字段 0 和 7 均表示周日。日和周同时指定时，任一匹配即触发（与系统cron一致）。
+    时间均为不带时区的本地时间。
+    """
+
+    FIELDS = (
+        ('minute', 0, 59),
+        ('hour', 0, 23),
+        ('day', 1, 31),
+        ('month', 1, 12),
+        ('weekday', 0, 7)
+    )
+
+    def __init__(self, expression):
+        self.expression = expression.strip()
+        parts = self.expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron表达式必须包含5个字段: {expression}")
+
+        values = [self._parse_field(text, name, low, high)
+                  for text, (name, low, high) in zip(parts, self.FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = values
+        self.weekdays = {0 if day == 7 else day for day in weekdays}
+        self._any_day = parts[2] == '*'
+        self._any_weekday = parts[4] == '*'
+
+    @staticmethod
+    def _parse_field(text, name, low, high):
+        """解析单个字段，返回排序后的取值列表"""
+        values = set()
+        for item in text.split(','):
+            step = 1
+            if '/' in item:
+                item, step_text = item.split('/', 1)
+                step = int(step_text)
+                if step <= 0:
+                    raise ValueError(f"cron字段 {name} 步长无效: {text}")
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start, end = (int(part) for part in item.split('-', 1))
+            else:
+                start = int(item)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"cron字段 {name} 超出范围 {low}-{high}: {text}")
+            values.update(range(start, end + 1, step))
+        return sorted(values)
+
+    def _day_matches(self, day):
+        """判断日期是否满足日、月、周字段"""
+        if day.month not in self.months:
+            return False
+        day_ok = day.day in self.days
+        weekday_ok = (day.weekday() + 1) % 7 in self.weekdays  # cron中0为周日
+        if self._any_day and self._any_weekday:
+            return True
+        if self._any_day:
+            return weekday_ok
+        if self._any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment):
+        """获取严格晚于 moment 的下一次触发时间"""
+        start = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(366 * 5):
+            if self._day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"cron表达式没有可触发的时间: {self.expression}")
+
+    def previous_before(self, moment):
+        """获取不晚于 moment 的最近一次触发时间"""
+        end = moment.replace(second=0, microsecond=0)
+        day = end.replace(hour=0, minute=0)
+        for _ in range(366 * 5):
+            if self._day_matches(day):
+                for hour in reversed(self.hours):
+                    for minute in reversed(self.minutes):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate <= end:
+                            return candidate
+            day -= timedelta(days=1)
+        return None
+
+
+class DailyPushScheduler:
+    """每日推送定时器
+
+    每个触发时间分两个阶段：
+    - 预生成：提前 lead_time 秒调用 prepare(触发时间)，生成消息快照
+    - 发送：到点调用 deliver(触发时间)，返回 {'success': bool, ...}
+
+    运行状态（最近一次触发时间、耗时、结果）写入 state_dir 下的状态文件，
+    重启后若最近一次应触发的推送在 catchup_window 秒内且未执行，立即补发。
+    同一台机器上多个进程（多worker、调试重载）通过文件锁保证只有一个进程在调度。
+    同一目录下有多个定时任务时用 name 区分状态文件和锁文件。
+    """
+
+    STATE_FILE = 'scheduler_state.json'
+    LOCK_FILE = 'scheduler.lock'
+
+    def __init__(self, schedule, prepare, deliver, timezone, lead_time=600, catchup_window=7200,
+                 state_dir='data', name=None):
+        self.schedule = schedule
+        self.prepare = prepare
+        self.deliver = deliver
+        self.timezone = timezone
+        self.lead_time = timedelta(seconds=lead_time)
+        self.catchup_window = timedelta(seconds=catchup_window)
+        self.state_dir = state_dir
+        self.name = name
+        suffix = f"_{name}" if name else ''
+        self.state_path = os.path.join(state_dir, self.STATE_FILE.replace('.json', f'{suffix}.json'))
+        self.lock_path = os.path.join(state_dir, self.LOCK_FILE.replace('.lock', f'{suffix}.lock'))
+        self._state_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock_file = None
+        self._next_fire = None
+
+    def _now(self):
+        """调度时区的当前本地时间（不带时区）"""
+        return datetime.now(self.timezone).replace(tzinfo=None)
+
+    def _acquire_lock(self):
+        """获取调度文件锁，获取失败说明其他进程正在调度"""
+        os.makedirs(self.state_dir, exist_ok=True)
+        if fcntl is None:
+            return True
+        lock_file = open(self.lock_path, 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _load_state(self):
+        """读取持久化的运行状态"""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"读取定时任务状态失败: {str(e)}")
+            return {}
+
+    def _update_state(self, **changes):
+        """更新并原子写入运行状态"""
+        with self._state_lock:
+            state = self._load_state()
+            state.update(changes)
+            tmp_path = f"{self.state_path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(state, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.state_path)
+            except OSError as e:
+                logger.error(f"保存定时任务状态失败: {str(e)}")
+
+    @property
+    def active(self):
+        """本进程是否正在调度"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动调度线程，返回本进程是否成为调度者"""
+        if self.active:
+            return True
+        try:
+            if not self._acquire_lock():
+                logger.info("其他进程已在执行定时任务，本进程不参与调度")
+                return False
+        except OSError as e:
+            logger.error(f"定时任务状态目录不可用，定时任务未启动: {str(e)}")
+            return False
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name='daily-scheduler', daemon=True)
+        self._thread.start()
+        logger.info(f"定时任务已启动: {self.schedule.expression}，提前 {self.lead_time.total_seconds():g} 秒预生成")
+        return True
+
+    def stop(self):
+        """停止调度线程并释放文件锁"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _sleep_until(self, target):
+        """等待到指定时间，期间被停止时返回 True
+
+        分段等待，避免系统休眠或时间调整后错过触发时间
+        """
+        while True:
+            remaining = (target - self._now()).total_seconds()
+            if remaining <= 0:
+                return False
+            if self._stop_event.wait(min(remaining, 60)):
+                return True
+
+    def _run_loop(self):
+        try:
+            self._catch_up()
+        except Exception as e:
+            logger.error(f"定时任务补发检查失败: {str(e)}")
+
+        while not self._stop_event.is_set():
+            now = self._now()
+            fire_time = self.schedule.next_after(now)
+            self._next_fire = fire_time
+
+            # 距离触发时间已不足预生成提前量时跳过预生成，发送阶段会自行生成
+            prerender_at = fire_time - self.lead_time
+            if prerender_at > now:
+                if self._sleep_until(prerender_at):
+                    break
+                self._prerender(fire_time)
+
+            if self._sleep_until(fire_time):
+                break
+            self._fire(fire_time)
+
+    def _catch_up(self):
+        """补发重启期间错过的推送"""
+        last_fire = self._load_state().get('last_fire_time')
+        if last_fire is None:
+            return  # 首次启动，没有可比较的历史记录
+        now = self._now()
+        missed = self.schedule.previous_before(now)
+        if missed is None or missed <= datetime.fromisoformat(last_fire):
+            return
+        if now - missed > self.catchup_window:
+            logger.warning(f"错过的推送 {missed.isoformat()} 已超过补发窗口，跳过")
+            return
+        logger.warning(f"检测到错过的推送 {missed.isoformat()}，立即补发")
+        self._fire(missed, catch_up=True)
+
+    def _prerender(self, fire_time):
+        """执行预生成阶段"""
+        started = time.monotonic()
+        record = {'fire_time': fire_time.isoformat(), 'started_at': self._now().isoformat()}
+        try:
+            self.prepare(fire_time)
+            record['success'] = True
+        except Exception as e:
+            logger.error(f"预生成每日消息失败: {str(e)}")
+            record.update({'success': False, 'error': str(e)})
+        record['duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+        self._update_state(last_prerender=record)
+
+    def _fire(self, fire_time, catch_up=False):
+        """执行发送阶段"""
+        started = time.monotonic()
+        record = {'fire_time': fire_time.isoformat(), 'started_at': self._now().isoformat(), 'catch_up': catch_up}
+        try:
+            result = self.deliver(fire_time) or {}
+            record['success'] = bool(result.get('success'))
+            record['skipped'] = bool(result.get('skipped'))
+        except Exception as e:
+            logger.error(f"定时推送失败: {str(e)}")
+            record.update({'success': False, 'error': str(e)})
+        record['duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+        # 无论成功与否都记为已触发，失败不会在重启后重复补发
+        self._update_state(last_fire_time=fire_time.isoformat(), last_run=record)
+        logger.info(f"定时推送完成: {record}")
+
+    def status(self):
+        """获取调度状态：下次触发时间、预生成时间和最近一次运行情况"""
+        next_fire = self._next_fire if self.active and self._next_fire else self.schedule.next_after(self._now())
+        state = self._load_state()
+        return {
+            'active': self.active,
+            'schedule': self.schedule.expression,
+            'timezone': str(self.timezone),
+            'lead_time_seconds': self.lead_time.total_seconds(),
+            'catchup_window_seconds': self.catchup_window.total_seconds(),
+            'next_fire_time': next_fire.isoformat(),
+            'next_prerender_time': (next_fire - self.lead_time).isoformat(),
+            'last_fire_time': state.get('last_fire_time'),
+            'last_run': state.get('last_run'),
+            'last_prerender': state.get('last_prerender')
+        }
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+群配置（多租户）
+每个群一份配置：webhook、城市、推送时间和消息分段。每日推送按所有群的配置统一规划，
+相同城市的天气和当天的老黄历只获取一次，再按各群的分段选择分别组合消息
+"""
+
+import json
+from collections import OrderedDict
+
+from scheduler import CronSchedule
+
+# 每日消息的分段（按消息中的顺序）
+DAILY_SECTIONS = ('encouragement', 'fortune', 'weather', 'lunch')
+
+
+class TenantProfile:
+    """一个群的推送配置
+
+    - webhooks：该群的机器人地址（一个或多个）
+    - city：天气和午餐推荐使用的城市
+    - schedule：推送时间（cron表达式字符串）
+    - sections：消息包含的分段，午餐推荐依赖天气，只选午餐时也会获取该城市的天气
+    - weekends：周六、周日是否推送（默认只在工作日推送，推送时间的cron表达式也需包含周末）
+    """
+
+    def __init__(self, name, webhooks, city, schedule, sections=DAILY_SECTIONS, weekends=False):
+        if not name:
+            raise ValueError("群配置缺少名称")
+        webhooks = [webhooks] if isinstance(webhooks, str) else list(webhooks or [])
+        unknown = [section for section in sections if section not in DAILY_SECTIONS]
+        if unknown or not sections:
+            raise ValueError(f"群 {name} 的消息分段无效: {unknown or '未选择任何分段'}")
+        self.name = name
+        self.webhooks = list(dict.fromkeys(url.strip() for url in webhooks if url and url.strip()))
+        self.city = city
+        self.schedule = schedule
+        self.sections = tuple(section for section in DAILY_SECTIONS if section in sections)
+        self.weekends = bool(weekends)
+
+    @property
+    def needs_weather(self):
+        return 'weather' in self.sections or 'lunch' in self.sections
+
+    def pushes_on(self, weekday):
+        """该群在星期 weekday（0为周一）是否推送"""
+        return weekday < 5 or self.weekends
+
+    def to_dict(self):
+        """配置摘要（webhook只保留数量，避免暴露密钥）"""
+        return {
+            'name': self.name,
+            'city': self.city,
+            'schedule': self.schedule,
+            'sections': list(self.sections),
+            'weekends': self.weekends,
+            'webhooks': len(self.webhooks)
+        }
+
+
+class TenantRegistry:
+    """所有群的配置，按配置顺序排列（第一个群为主群）"""
+
+    def __init__(self, profiles):
+        profiles = list(profiles)
+        if not profiles:
+            raise ValueError("至少需要配置一个群")
+        names = [profile.name for profile in profiles]
+        if len(names) != len(set(names)):
+            raise ValueError(f"群名称重复: {names}")
+        self._profiles = OrderedDict((profile.name, profile) for profile in profiles)
+
+    @classmethod
+    def from_config(cls, items, default_city, default_schedule):
+        """从配置列表创建，未指定的城市和推送时间使用默认值
+
+        配置无效（缺少webhook、分段或cron表达式错误、weekends 不是布尔值等）时抛出 ValueError
+        """
+        if not isinstance(items, list):
+            raise ValueError("群配置应为列表")
+        profiles = []
+        for item in items:
+            weekends = item.get('weekends', False)
+            if not isinstance(weekends, bool):
+                # 字符串 "false" 等按真值判断会被当作开启，只接受JSON布尔值
+                raise ValueError(f"群 {item.get('name')} 的 weekends 应为 true 或 false: {weekends!r}")
+            profile = TenantProfile(
+                item.get('name'),
+                item.get('webhooks') or item.get('webhook'),
+                item.get('city') or default_city,
+                item.get('schedule') or default_schedule,
+                item.get('sections') or DAILY_SECTIONS,
+                weekends
+            )
+            if not profile.webhooks:
+                raise ValueError(f"群 {profile.name} 未配置webhook")
+            CronSchedule(profile.schedule)
+            profiles.append(profile)
+        return cls(profiles)
+
+    @classmethod
+    def from_file(cls, path, default_city, default_schedule):
+        """从JSON文件读取群配置"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_config(json.load(f), default_city, default_schedule)
+
+    @property
+    def primary(self):
+        return next(iter(self._profiles.values()))
+
+    def get(self, name):
+        return self._profiles.get(name)
+
+    def __iter__(self):
+        return iter(self._profiles.values())
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def select(self, names=None):
+        """按名称选择群（None 表示全部），不存在的名称抛出 KeyError"""
+        if names is None:
+            return list(self)
+        missing = [name for name in names if name not in self._profiles]
+        if missing:
+            raise KeyError(f"群不存在: {', '.join(missing)}")
+        return [self._profiles[name] for name in names]
+
+    def webhooks(self):
+        """所有群的webhook（去重）"""
+        return list(dict.fromkeys(url for profile in self for url in profile.webhooks))
+
+    def cities(self):
+        """需要获取天气的城市（去重，按配置顺序）"""
+        return list(dict.fromkeys(profile.city for profile in self if profile.needs_weather))
+
+    def active_on(self, weekday):
+        """星期 weekday（0为周一）推送的群组成的配置，没有群推送时返回 None"""
+        profiles = [profile for profile in self if profile.pushes_on(weekday)]
+        return TenantRegistry(profiles) if profiles else None
+
+    def needs(self, section):
+        """是否有群需要该分段"""
+        return any(section in profile.sections for profile in self)
+
+    def by_schedule(self):
+        """按推送时间分组：{cron表达式: [群名称]}"""
+        groups = OrderedDict()
+        for profile in self:
+            groups.setdefault(profile.schedule, []).append(profile.name)
+        return groups
+
+    def to_dict(self):
+        return {
+            'tenants': [profile.to_dict() for profile in self],
+            'cities': self.cities(),
+            'schedules': self.by_schedule()
+        }
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+测试公共配置：本地替身HTTP服务器，模拟高德、天行、ARK等上游
+"""
+
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StandIn:
+    """本地替身服务器：按 (方法, 路径) 注册处理函数，记录收到的请求
+
+    处理函数接收 BaseHTTPRequestHandler，自行写入响应
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _dispatch(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self.body = self.rfile.read(length) if length else b''
+                with stand_in._lock:
+                    stand_in.requests.append((self.command, self.path, self.body))
+                handler = stand_in.routes.get((self.command, self.path.split('?', 1)[0]))
+                if handler is None:
+                    self.send_error(404)
+                    return
+                try:
+                    handler(self)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            do_GET = do_POST = do_DELETE = _dispatch
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def route(self, method, path, handler):
+        self.routes[(method, path)] = handler
+
+    def count(self, method, path):
+        with self._lock:
+            return sum(1 for m, p, _ in self.requests if m == method and p.split('?', 1)[0] == path)
+
+    def bodies(self, method, path):
+        with self._lock:
+            return [b for m, p, b in self.requests if m == method and p.split('?', 1)[0] == path]
+
+
+def respond(handler, status=200, body=b'', headers=None, content_type='application/json'):
+    """写入完整响应"""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    handler.send_response(status)
+    handler.send_header('Content-Type', content_type)
+    handler.send_header('Content-Length', str(len(body)))
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
+    handler.end_headers()
+    handler.wfile.write(body)
+    handler.wfile.flush()
+
+
+@pytest.fixture
+def stand_in():
+    server = StandIn()
+    server._thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+class FrozenClock:
+    """替换 wework_bot 中的 datetime，now() 返回可设置的北京时间"""
+
+    def __init__(self, moment):
+        import pytz
+        self.timezone = pytz.timezone('Asia/Shanghai')
+        self.set(moment)
+
+    def set(self, moment):
+        self.current = self.timezone.localize(moment)
+
+    def advance(self, **delta):
+        from datetime import timedelta
+        self.current += timedelta(**delta)
+
+    def monotonic(self):
+        """当前时间的时间戳，可作为 BotCache 的时钟"""
+        return self.current.timestamp()
+
+    def datetime_class(self):
+        from datetime import datetime
+        clock = self
+
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return clock.current.astimezone(tz) if tz else clock.current.replace(tzinfo=None)
+
+        return FrozenDatetime
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """wework_bot 的当前时间固定为 2026-10-12（周一）09:00"""
+    from datetime import datetime
+    import wework_bot
+    frozen = FrozenClock(datetime(2026, 10, 12, 9, 0))
+    monkeypatch.setattr(wework_bot, 'datetime', frozen.datetime_class())
+    return frozen
+
+
+@pytest.fixture
+def make_bot(monkeypatch, tmp_path, clock):
+    """创建与外部环境隔离的 WeWorkBot：不访问真实上游，发送任务和定时任务状态写入临时目录"""
+    import wework_bot
+    for name in ('WEBHOOK_URL', 'WEBHOOK_URLS', 'TENANTS_FILE', 'CACHE_DIR', 'ARK_API_KEY', 'WEATHER_API_KEY',
+                 'TIANAPI_KEY', 'ARK_MODELS'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('WEBHOOK_OUTBOX_DIR', str(tmp_path))
+    monkeypatch.setenv('SCHEDULER_STATE_DIR', str(tmp_path))
+    monkeypatch.setenv('SCHEDULER_ENABLED', 'false')
+    bots = []
+
+    def make(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        bot = wework_bot.WeWorkBot()
+        bots.append(bot)
+        return bot
+
+    yield make
+    for bot in bots:
+        with bot._refetch_lock:
+            for timer in bot._refetch_timers.values():
+                timer.cancel()
+        bot.outbox.stop()
+        bot.cache.stop()
+        bot.content_pool.shutdown()
+        bot.executor.shutdown(wait=False)
+        bot.http.close()
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""ARK客户端测试：流式输出、时间预算、重试和上下文缓存"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from ark_client import ArkClient
+from conftest import respond
+from ratelimit import TokenBucket
+from upstream import UpstreamClient
+
+
+def sse(handler, events, pause=0.0, hang=0.0):
+    """以分块传输写入SSE事件，每个事件之间等待 pause 秒，写完后再等待 hang 秒"""
+    handler.send_response(200)
+    handler.send_header('Content-Type', 'text/event-stream')
+    handler.send_header('Transfer-Encoding', 'chunked')
+    handler.end_headers()
+
+    def chunk(data):
+        data = data.encode('utf-8')
+        handler.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        handler.wfile.flush()
+
+    for event in events:
+        chunk(f"data: {event if isinstance(event, str) else json.dumps(event, ensure_ascii=False)}\n\n")
+        time.sleep(pause)
+    time.sleep(hang)
+    handler.wfile.write(b"0\r\n\r\n")
+    handler.wfile.flush()
+
+
+def delta(text):
+    return {'choices': [{'delta': {'content': text}}]}
+
+
+def completion(text):
+    return json.dumps({'choices': [{'message': {'content': text}}],
+                       'usage': {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}})
+
+
+@pytest.fixture
+def make_client(stand_in):
+    clients = []
+
+    def make(**options):
+        http = UpstreamClient(read_timeout=5)
+        options = {'rpm': 0, 'tpm': 0, 'retry_base_delay': 0.01, **options}
+        client = ArkClient(http, stand_in.url, 'test-key', 'test-model', **options)
+        clients.append(http)
+        return client
+
+    yield make
+    for http in clients:
+        http.close()
+
+
+def test_stream_collects_deltas_and_usage(stand_in, make_client):
+    usage = {'prompt_tokens': 8, 'completion_tokens': 4, 'total_tokens': 12}
+    stand_in.route('POST', '/chat/completions',
+                   lambda h: sse(h, [delta('周一'), delta('加油！'), {'choices': [], 'usage': usage}, '[DONE]']))
+    result = make_client().complete('写一句话')
+
+    assert result.content == '周一加油！'
+    assert result.streamed and not result.truncated
+    assert result.ttft_ms is not None
+    assert result.usage == usage
+    assert json.loads(stand_in.bodies('POST', '/chat/completions')[0])['stream'] is True
+
+
+@pytest.mark.parametrize('policy, expected', [
+    ('sentence', '又是周一。'),
+    ('partial', '又是周一。咖啡续命'),
+    ('fallback', None)
+])
+def test_stream_deadline_expires_mid_stream(stand_in, make_client, policy, expected):
+    """流式输出中途超出时间预算：按处理方式保留已生成内容，不等待剩余输出"""
+    stand_in.route('POST', '/chat/completions',
+                   lambda h: sse(h, [delta('又是周一。'), delta('咖啡续命')], hang=3))
+    started = time.monotonic()
+    result = make_client(deadline=0.5, on_deadline=policy).complete('写一句话')
+    elapsed = time.monotonic() - started
+
+    assert result.content == expected
+    assert result.truncated
+    assert elapsed < 1.5
+
+
+def test_retry_after_is_honoured(stand_in, make_client):
+    """429 按 Retry-After 等待后重试"""
+    calls = []
+
+    def handler(h):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            respond(h, 429, '{"error": "rate limited"}', headers={'Retry-After': '0.4'})
+        else:
+            sse(h, [delta('好的。'), '[DONE]'])
+
+    stand_in.route('POST', '/chat/completions', handler)
+    client = make_client(deadline=5)
+    result = client.complete('写一句话')
+
+    assert result.content == '好的。'
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.4
+    usage = client.stats()['models']['test-model']
+    assert usage['throttled'] == 1 and usage['retries'] == 1
+
+
+def test_retry_after_beyond_budget_gives_up(stand_in, make_client):
+    """Retry-After 超出剩余时间预算时不再重试，直接放弃"""
+    stand_in.route('POST', '/chat/completions',
+                   lambda h: respond(h, 503, '{"error": "busy"}', headers={'Retry-After': '10'}))
+    client = make_client(deadline=1)
+    started = time.monotonic()
+    result = client.complete('写一句话')
+
+    assert result.content is None
+    assert stand_in.count('POST', '/chat/completions') == 1
+    assert time.monotonic() - started < 0.5
+    assert client.stats()['models']['test-model']['gave_up'] == 1
+
+
+def test_retry_after_pauses_other_calls(stand_in, make_client):
+    """429 的 Retry-After 暂停该模型的请求令牌桶，期间其他调用同样等待"""
+    calls = []
+
+    def handler(h):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            respond(h, 429, '{"error": "rate limited"}', headers={'Retry-After': '0.5'})
+        else:
+            sse(h, [delta('好的。'), '[DONE]'])
+
+    stand_in.route('POST', '/chat/completions', handler)
+    client = make_client(deadline=5, rpm=600)
+    first = threading.Thread(target=client.complete, args=('写一句话',))
+    first.start()
+    while not calls:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    result = client.complete('再写一句')
+    first.join()
+
+    assert result.content == '好的。'
+    assert len(calls) == 3
+    assert all(later - calls[0] >= 0.5 for later in calls[1:])
+
+
+def test_token_bucket_pause_delays_acquire():
+    now = [0.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(10, 10, clock=lambda: now[0], sleep=sleep)
+    bucket.pause(2)
+
+    assert bucket.try_acquire() == 2
+    assert bucket.acquire()
+    assert sum(slept) == 2
+    assert bucket.stats()['paused_seconds'] == 0
+
+
+def test_backoff_is_jittered_and_capped(make_client):
+    """无 Retry-After 时为全抖动指数退避，有 Retry-After 时在其基础上加少量抖动"""
+    client = make_client(retry_base_delay=0.5, retry_max_delay=2)
+    for attempt, ceiling in [(0, 0.5), (1, 1.0), (2, 2.0), (5, 2.0)]:
+        delays = [client._backoff_delay(attempt) for _ in range(50)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+        assert len(set(delays)) > 1
+
+    delays = [client._backoff_delay(0, retry_after=3) for _ in range(50)]
+    assert all(3 <= delay <= 3.5 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_tokens_settled_by_actual_usage(stand_in, make_client):
+    """调用前按上限预扣token，完成后按实际用量多退少补；失败时全部退还"""
+    stand_in.route('POST', '/chat/completions', lambda h: respond(h, body=completion('好的。')))
+    client = make_client(stream=False, tpm=600)
+    result = client.complete('写一句话', max_tokens=200)
+    bucket = client._buckets_for('test-model')[1]
+
+    assert result.usage['total_tokens'] == 15
+    assert 585 <= bucket.stats()['available'] <= 590  # 预扣 204，结算后只扣实际的 15
+
+    stand_in.route('POST', '/chat/completions', lambda h: respond(h, 400, '{"error": "bad request"}'))
+    assert client.complete('写一句话', max_tokens=200).content is None
+    assert 585 <= bucket.stats()['available'] <= 592
+
+
+PREFIX = '你负责撰写每日推送。'
+
+
+def test_context_cache_reused_on_second_call(stand_in, make_client):
+    """前缀只在首次调用时上传，之后的调用引用同一个缓存ID"""
+    stand_in.route('POST', '/context/create', lambda h: respond(h, body='{"id": "ctx-1"}'))
+    stand_in.route('POST', '/context/chat/completions', lambda h: respond(h, body=completion('好的。')))
+    client = make_client(stream=False)
+
+    assert client.complete('周一', prefix=PREFIX).content == '好的。'
+    assert client.complete('周二', prefix=PREFIX).content == '好的。'
+
+    assert stand_in.count('POST', '/context/create') == 1
+    bodies = [json.loads(body) for body in stand_in.bodies('POST', '/context/chat/completions')]
+    assert [body['context_id'] for body in bodies] == ['ctx-1', 'ctx-1']
+    assert all(PREFIX not in json.dumps(body, ensure_ascii=False) for body in bodies)
+    assert client.stats()['context_cache']['reused'] == 1
+
+
+def test_expired_context_is_recreated(stand_in, make_client):
+    """服务端提前失效的缓存ID重新创建一次后继续使用"""
+    created = []
+
+    def create(h):
+        created.append(1)
+        respond(h, body=json.dumps({'id': f'ctx-{len(created)}'}))
+
+    def chat(h):
+        if json.loads(h.body)['context_id'] == 'ctx-1':
+            respond(h, 404, '{"error": {"message": "context not found"}}')
+        else:
+            respond(h, body=completion('好的。'))
+
+    stand_in.route('POST', '/context/create', create)
+    stand_in.route('POST', '/context/chat/completions', chat)
+    client = make_client(stream=False)
+
+    assert client.complete('周一', prefix=PREFIX).content == '好的。'
+    assert len(created) == 2
+    assert stand_in.count('POST', '/chat/completions') == 0
+    assert client.stats()['context_cache']['expired'] == 1
+
+
+def test_invalid_context_falls_back_to_full_prompt(stand_in, make_client):
+    """重新创建后缓存ID仍无效时，前缀作为 system 消息随请求发送"""
+    stand_in.route('POST', '/context/create', lambda h: respond(h, body='{"id": "ctx-bad"}'))
+    stand_in.route('POST', '/context/chat/completions',
+                   lambda h: respond(h, 400, '{"error": {"message": "invalid context_id"}}'))
+    stand_in.route('POST', '/chat/completions', lambda h: respond(h, body=completion('好的。')))
+    client = make_client(stream=False)
+
+    assert client.complete('周一', prefix=PREFIX).content == '好的。'
+    assert stand_in.count('POST', '/context/create') == 2
+    body = json.loads(stand_in.bodies('POST', '/chat/completions')[0])
+    assert body['messages'][0] == {'role': 'system', 'content': PREFIX}
+    assert 'context_id' not in body
+
+
+def test_context_create_failure_sends_full_prompt(stand_in, make_client):
+    """模型未开通上下文缓存时改为随请求发送前缀，且暂不再尝试创建"""
+    stand_in.route('POST', '/context/create', lambda h: respond(h, 403, '{"error": "not enabled"}'))
+    stand_in.route('POST', '/chat/completions', lambda h: respond(h, body=completion('好的。')))
+    client = make_client(stream=False)
+
+    assert client.complete('周一', prefix=PREFIX).content == '好的。'
+    assert client.complete('周二', prefix=PREFIX).content == '好的。'
+    assert stand_in.count('POST', '/context/create') == 1
+    assert stand_in.count('POST', '/chat/completions') == 2
+    assert client.stats()['context_cache']['unavailable_models'] == ['test-model']
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""缓存测试：陈旧数据后台刷新、降级数据、请求合并、容量淘汰和本地持久化"""
+
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from cache import BotCache, Degraded, DiskCacheStore, SingleFlight
+from conftest import FrozenClock
+
+
+def wait_for(condition, timeout=5):
+    """等待后台任务使条件成立"""
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_failed_revalidation_keeps_stale_entry(make_bot, clock):
+    """后台刷新失败时保留陈旧容忍期内的权威数据，只安排重新获取"""
+    bot = make_bot()
+    bot.cache._clock = clock.monotonic
+    responses = ['今日北京天气：晴', Degraded('今日天气：阳光明媚，适合上班摸鱼 ☀️')]
+    bot._fetch_weather_info = lambda city: responses.pop(0)
+
+    assert bot.get_weather_info('北京') == '今日北京天气：晴'
+    clock.advance(hours=1, minutes=10)
+    weather, freshness = bot.get_weather_info('北京', with_freshness=True)
+    assert wait_for(lambda: 'weather_北京' in bot._refetch_timers)
+
+    assert weather == '今日北京天气：晴'
+    assert freshness['state'] == 'stale'
+    data, state, _, degraded = bot.cache.lookup('weather_北京')
+    assert (data, state, degraded) == ('今日北京天气：晴', 'stale', False)
+    assert 'weather_北京' in bot._refetch_timers
+
+
+def test_almanac_fetched_once_per_day(make_bot, clock):
+    """老黄历记录当天一直有效，不会在12小时后再次回源"""
+    bot = make_bot()
+    bot.cache._clock = clock.monotonic
+    calls = []
+    bot._fetch_almanac_record = lambda: calls.append(1) or {'date': '2026-10-12'}
+
+    bot.get_almanac_record()
+    clock.advance(hours=14)  # 当天 23:00
+    record, freshness = bot.get_almanac_record(with_freshness=True)
+
+    assert record == {'date': '2026-10-12'}
+    assert freshness['state'] == 'fresh'
+    assert len(calls) == 1
+
+
+def test_lookup_serves_stale_until_max_stale():
+    """过期后在陈旧容忍期内以 stale 返回，超出后视为未命中并移除"""
+    clock = FrozenClock(datetime(2026, 10, 12, 9, 0))
+    cache = BotCache({'weather': timedelta(hours=1)}, stale_policy={'weather': timedelta(minutes=30)},
+                     clock=clock.monotonic)
+    cache.set('weather_北京', '晴', 'weather')
+
+    clock.advance(minutes=59)
+    assert cache.lookup('weather_北京')[:2] == ('晴', 'fresh')
+    clock.advance(minutes=30)
+    data, state, age, degraded = cache.lookup('weather_北京')
+    assert (data, state, age, degraded) == ('晴', 'stale', 89 * 60, False)
+    assert cache.get('weather_北京') is None
+    clock.advance(minutes=1)
+    assert cache.lookup('weather_北京') == (None, None, None, False)
+    assert len(cache) == 0
+
+
+def test_degraded_entries_have_no_stale_period():
+    clock = FrozenClock(datetime(2026, 10, 12, 9, 0))
+    cache = BotCache({'weather': timedelta(hours=1)}, stale_policy={'weather': timedelta(minutes=30)},
+                     clock=clock.monotonic)
+    cache.set('weather_北京', '晴', 'weather', ttl=60, degraded=True)
+
+    clock.advance(seconds=61)
+    assert cache.lookup('weather_北京') == (None, None, None, False)
+
+
+def test_stale_read_triggers_exactly_one_background_refresh(make_bot, clock):
+    """陈旧期内的并发读取都立即返回旧数据，只发起一次后台刷新"""
+    bot = make_bot()
+    bot.cache._clock = clock.monotonic
+    release = threading.Event()
+    calls = []
+
+    def fetch(city):
+        calls.append(city)
+        if len(calls) > 1:
+            release.wait(5)
+        return f"今日{city}天气：第{len(calls)}次"
+
+    bot._fetch_weather_info = fetch
+    bot.get_weather_info('北京')
+    clock.advance(hours=1, minutes=5)
+
+    results = [bot.get_weather_info('北京', with_freshness=True) for _ in range(5)]
+    assert wait_for(lambda: len(calls) == 2)
+    results += [bot.get_weather_info('北京', with_freshness=True) for _ in range(5)]
+    release.set()
+    assert wait_for(lambda: bot.cache.lookup('weather_北京')[1] == 'fresh')
+
+    assert all(weather == '今日北京天气：第1次' and freshness['state'] == 'stale' for weather, freshness in results)
+    assert len(calls) == 2
+    assert bot.cache_stats.snapshot()['weather']['stale'] == 10
+    assert bot.get_weather_info('北京', with_freshness=True) == ('今日北京天气：第2次', {
+        'state': 'fresh', 'age_seconds': 0.0, 'degraded': False})
+
+
+def test_read_past_max_stale_blocks_on_fetch(make_bot, clock):
+    """超出陈旧容忍期后不再返回旧数据，调用方等待回源"""
+    bot = make_bot()
+    bot.cache._clock = clock.monotonic
+    values = iter(['今日北京天气：晴', '今日北京天气：小雨'])
+    bot._fetch_weather_info = lambda city: next(values)
+    bot.get_weather_info('北京')
+    clock.advance(hours=1, minutes=31)
+
+    weather, freshness = bot.get_weather_info('北京', with_freshness=True)
+
+    assert weather == '今日北京天气：小雨'
+    assert freshness['state'] == 'miss'
+
+
+def test_single_flight_runs_one_load_for_concurrent_callers():
+    """同一个键的并发调用只执行一次加载，其余调用方共享结果"""
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return '今日北京天气：晴'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do('weather_北京', load))) for _ in range(8)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    assert wait_for(lambda: flight.in_flight('weather_北京'))
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert all(value == '今日北京天气：晴' for value, _ in results)
+    assert not flight.in_flight('weather_北京')
+
+
+def test_single_flight_shares_errors():
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def load():
+        release.wait(5)
+        raise RuntimeError('上游超时')
+
+    def call():
+        try:
+            flight.do('almanac', load)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 4
+    assert len({id(e) for e in errors}) == 1
+
+
+def make_cache(clock, **options):
+    return BotCache({'weather': timedelta(hours=1)}, stale_policy={'weather': timedelta(minutes=30)},
+                    clock=clock.monotonic, **options)
+
+
+def test_lru_eviction_keeps_recently_used_entries():
+    clock = FrozenClock(datetime(2026, 10, 12, 9, 0))
+    cache = make_cache(clock, max_entries=2)
+    cache.set('weather_北京', '晴', 'weather')
+    cache.set('weather_上海', '多云', 'weather')
+    cache.get('weather_北京')
+    cache.set('weather_广州', '小雨', 'weather')
+
+    assert 'weather_北京' in cache and 'weather_广州' in cache
+    assert 'weather_上海' not in cache
+    assert cache.stats()['evictions'] == 1
+
+
+def test_byte_limit_evicts_least_recently_used():
+    clock = FrozenClock(datetime(2026, 10, 12, 9, 0))
+    cache = make_cache(clock, max_bytes=30)
+    cache.set('a', 'x' * 10, 'weather')  # 序列化后12字节
+    cache.set('b', 'y' * 10, 'weather')
+    cache.set('c', 'z' * 10, 'weather')
+
+    assert 'a' not in cache
+    assert len(cache) == 2
+    assert cache.stats()['bytes'] == 24
+
+    cache.set('d', 'w' * 40, 'weather')  # 单个条目超出预算时不保留
+    assert len(cache) == 0 and cache.stats()['bytes'] == 0
+
+
+def test_sweep_removes_entries_past_max_stale():
+    clock = FrozenClock(datetime(2026, 10, 12, 9, 0))
+    cache = make_cache(clock)
+    cache.set('weather_北京', '晴', 'weather')
+    cache.set('weather_上海', '多云', 'weather', ttl=60, degraded=True)
+
+    clock.advance(minutes=2)
+    assert cache.sweep() == 1  # 降级条目没有陈旧期
+    clock.advance(hours=1, minutes=10)
+    assert cache.sweep() == 0  # 陈旧期内保留
+    clock.advance(minutes=20)
+    assert cache.sweep() == 1
+    assert len(cache) == 0
+    assert cache.stats()['expirations'] == 2
+
+
+def test_sweeper_thread_runs_periodically():
+    clock = FrozenClock(datetime(2026, 10, 12, 9, 0))
+    cache = make_cache(clock, sweep_interval=0.05)
+    cache.set('weather_北京', '晴', 'weather')
+    cache.start_sweeper()
+    try:
+        clock.advance(hours=2)
+        assert wait_for(lambda: len(cache) == 0, timeout=2)
+    finally:
+        cache.stop()
+
+
+def test_disk_store_warm_start(tmp_path):
+    """重启后从本地持久化层预热仍有效的条目，降级数据不落盘"""
+    cache = BotCache({'weather': timedelta(hours=1)}, store=DiskCacheStore(str(tmp_path)))
+    cache.set('weather_北京', '晴', 'weather')
+    cache.set('weather_上海', {'condition': '多云'}, 'weather')
+    cache.set('weather_广州', '小雨', 'weather', ttl=60, degraded=True)
+    cache.set('weather_深圳', '阴', 'weather', ttl=0.01)
+    time.sleep(0.05)
+    cache.stop()
+
+    restarted = BotCache({'weather': timedelta(hours=1)}, store=DiskCacheStore(str(tmp_path)))
+    try:
+        assert restarted.warm_from_store() == 2
+        assert restarted.get('weather_北京') == '晴'
+        assert restarted.get('weather_上海') == {'condition': '多云'}
+        assert restarted.get('weather_广州') is None
+        assert restarted.stats()['store_hits'] == 0
+    finally:
+        restarted.stop()
+
+
+def test_disk_store_writes_behind_in_batches(tmp_path):
+    """写入不等待落盘：数据库被其他进程锁住时写入立即返回，积压的写入合并为一个事务提交"""
+    store = DiskCacheStore(str(tmp_path))
+    batches = []
+    apply = store._apply
+    store._apply = lambda batch: batches.append(len(batch)) or apply(batch)
+
+    blocker = sqlite3.connect(store.path)
+    blocker.execute('BEGIN EXCLUSIVE')
+    try:
+        started = time.monotonic()
+        for i in range(10):
+            store.save(f"weather_{i}", f"第{i}条", 'weather', time.time() + 3600)
+        assert time.monotonic() - started < 0.5
+    finally:
+        time.sleep(0.1)
+        blocker.rollback()
+        blocker.close()
+    store.flush()
+    try:
+        assert sum(batches) == 10
+        assert len(batches) <= 2
+        assert store.load('weather_9')[0] == '第9条'
+    finally:
+        store.close()
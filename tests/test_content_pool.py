@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""大模型文案内容池测试"""
+
+import json
+import re
+
+import pytest
+
+from conftest import respond
+from content_pool import ContentPool
+
+
+@pytest.fixture
+def ark_stand_in(stand_in):
+    """ARK替身：按提示词中的星期生成不重复的文案"""
+    counter = []
+
+    def chat(h):
+        prompt = json.loads(h.body)['messages'][-1]['content']
+        weekday = re.search(r'周[一二三四五六日]', prompt)
+        counter.append(1)
+        text = f"{weekday.group(0) if weekday else '午餐'}池文案{len(counter)}"
+        respond(h, body=json.dumps({'choices': [{'message': {'content': text}}]}, ensure_ascii=False))
+
+    stand_in.route('POST', '/chat/completions', chat)
+    return stand_in
+
+
+@pytest.fixture
+def pool_bot(make_bot, ark_stand_in):
+    bot = make_bot(ARK_API_KEY='test-key', ARK_BASE_URL=ark_stand_in.url, ARK_STREAM='false',
+                   ARK_COMBINED_GENERATION='false', ARK_CONTEXT_CACHE='false', ARK_RPM='0', ARK_TPM='0')
+    assert bot.content_pool.wait([('encouragement', '周一', '')], timeout=5)
+    return bot
+
+
+def test_draw_after_date_change_comes_from_pool(pool_bot, clock):
+    """日期变化后首次取用先预热当天的分组，取用的是预生成文案而不是固定文案"""
+    assert pool_bot.get_work_encouragement('周一').startswith('周一池文案')
+
+    clock.advance(days=1)
+    content = pool_bot.get_work_encouragement('周二')
+
+    assert content.startswith('周二池文案')
+    assert pool_bot._content_pool_date == '2026-10-13'
+
+
+def test_prerender_warms_todays_pool(pool_bot, clock):
+    """预生成每日消息时预热当天的分组，快照中的鼓励话语来自内容池"""
+    clock.advance(days=2)
+    pool_bot.get_weather_info = lambda city=None: '今日天气：晴'
+    message = pool_bot.prerender_daily_message()
+
+    assert '周三池文案' in message
+    assert pool_bot._content_pool_date == '2026-10-14'
+
+
+def test_wait_returns_when_refill_gives_up():
+    """补充失败时等待立即结束，不会等满超时"""
+    pool = ContentPool(lambda key: None, size=2, max_failures=1)
+    try:
+        pool.warm([('encouragement', '周一', '')])
+        assert pool.wait([('encouragement', '周一', '')], timeout=5) is False
+    finally:
+        pool.shutdown()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""每日消息快照测试"""
+
+import json
+import time
+from datetime import datetime
+
+
+def test_snapshot_with_section_timeout_is_degraded(make_bot):
+    """有分段超时使用了备用内容的快照作为降级数据缓存，并安排后台重新生成"""
+    bot = make_bot()
+    bot.section_timeouts['weather'] = 0.2
+
+    def slow_weather(city=None):
+        time.sleep(1)
+        return '今日天气：多云'
+
+    bot.get_weather_info = slow_weather
+    snapshot, freshness = bot.get_daily_snapshot(with_freshness=True)
+
+    assert snapshot['timings']['weather']['status'] == 'timeout'
+    assert freshness['degraded']
+    key = f"daily_message_{snapshot['date']}"
+    assert bot.cache.is_degraded(key)
+    assert key in bot._refetch_timers
+
+    # 之后的读取也标记为降级，而不是当天的权威快照
+    _, freshness = bot.get_daily_snapshot(with_freshness=True)
+    assert freshness['degraded']
+
+
+def test_complete_snapshot_is_authoritative(make_bot):
+    bot = make_bot()
+    bot.get_weather_info = lambda city=None: '今日天气：晴'
+    snapshot, freshness = bot.get_daily_snapshot(with_freshness=True)
+
+    assert all(timing['status'] == 'ok' for name, timing in snapshot['timings'].items() if name != '_total')
+    assert not freshness['degraded']
+    assert bot.get_daily_snapshot(with_freshness=True)[1]['state'] == 'fresh'
+
+
+def test_prerender_replaces_degraded_snapshot(make_bot):
+    """预生成时已有的降级快照重新生成"""
+    bot = make_bot()
+    bot.section_timeouts['weather'] = 0.2
+    bot.get_weather_info = lambda city=None: time.sleep(1) or '今日天气：多云'
+    bot.get_daily_snapshot()
+
+    bot.get_weather_info = lambda city=None: '今日天气：晴'
+    message = bot.prerender_daily_message()
+
+    assert '今日天气：晴' in message
+    assert not bot.get_daily_snapshot(with_freshness=True)[1]['degraded']
+
+
+def test_weekend_snapshot_with_section_timeout_is_degraded(make_bot, clock, tmp_path):
+    """周末主群不推送时，推送群的分段超时同样使快照作为降级数据缓存"""
+    path = tmp_path / 'tenants.json'
+    path.write_text(json.dumps([
+        {'name': 'office', 'webhook': 'http://127.0.0.1:9/send?key=office', 'city': '上海'},
+        {'name': 'oncall', 'webhook': 'http://127.0.0.1:9/send?key=oncall', 'city': '北京',
+         'weekends': True, 'sections': ['weather', 'encouragement']}
+    ], ensure_ascii=False), encoding='utf-8')
+    bot = make_bot(TENANTS_FILE=str(path))
+    clock.set(datetime(2026, 10, 17, 9, 0))  # 周六
+    bot.section_timeouts['weather'] = 0.2
+    bot.get_weather_info = lambda city=None: time.sleep(1) or f"今日天气：{city}多云"
+    snapshot, freshness = bot.get_daily_snapshot(with_freshness=True)
+
+    assert snapshot['message'] is None
+    assert snapshot['messages']['oncall'] is not None
+    assert snapshot['timings']['weather:北京']['status'] == 'timeout'
+    assert freshness['degraded']
+    assert bot.cache.is_degraded('daily_message_2026-10-17')
+
+
+def test_degraded_snapshot_refetch_does_not_occupy_section_workers(make_bot):
+    """后台重新生成快照不占用分段线程池，线程池只有一个工作线程时也能生成完整快照"""
+    bot = make_bot(BOT_WORKERS='1', DEGRADED_CACHE_TTL='0.3')
+    bot.section_timeouts['weather'] = 0.2
+    bot.get_weather_info = lambda city=None: time.sleep(1) or '今日天气：多云'
+    bot.get_daily_snapshot()
+
+    bot.get_weather_info = lambda city=None: '今日天气：晴'
+    deadline = time.time() + 5
+    while bot.get_daily_snapshot(with_freshness=True)[1]['degraded'] and time.time() < deadline:
+        time.sleep(0.05)
+
+    snapshot, freshness = bot.get_daily_snapshot(with_freshness=True)
+    assert not freshness['degraded']
+    assert '今日天气：晴' in snapshot['message']
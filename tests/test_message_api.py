@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""消息API测试"""
+
+import json
+
+import pytest
+
+from conftest import respond
+
+
+@pytest.fixture
+def client(make_bot, monkeypatch):
+    import wework_bot
+    bot = make_bot(WEBHOOK_URL='http://127.0.0.1:9/cgi-bin/webhook/send?key=test')
+    monkeypatch.setattr(wework_bot, 'bot', bot)
+    return bot, wework_bot.app.test_client()
+
+
+@pytest.mark.parametrize('method, path', [
+    ('get', '/api/message/preview-daily?tenant=missing'),
+    ('post', '/api/message/send-daily?tenant=missing'),
+    ('post', '/api/message/broadcast?tenant=missing')
+])
+def test_unknown_tenant_is_404(client, method, path):
+    _, http = client
+    response = getattr(http, method)(path)
+
+    assert response.status_code == 404
+    assert response.get_json()['error'] == '群不存在: missing'
+
+
+def test_key_error_inside_message_building_is_500(client):
+    """消息生成过程中的 KeyError 不会被当作群不存在"""
+    bot, http = client
+
+    def broken(*args, **kwargs):
+        raise KeyError('weather')
+
+    bot.get_daily_messages = broken
+    response = http.get('/api/message/preview-daily?tenant=default')
+
+    assert response.status_code == 500
+    assert not response.get_json()['success']
+
+
+@pytest.fixture
+def tenant_client(make_bot, monkeypatch, stand_in, tmp_path):
+    """两个群的机器人都指向本地替身服务器"""
+    import wework_bot
+    stand_in.route('POST', '/send', lambda h: respond(h, body='{"errcode": 0, "errmsg": "ok"}'))
+    path = tmp_path / 'tenants.json'
+    path.write_text(json.dumps([
+        {'name': 'office', 'webhook': f"{stand_in.url}/send?key=office", 'city': '上海'},
+        {'name': 'oncall', 'webhook': f"{stand_in.url}/send?key=oncall", 'city': '北京'}
+    ], ensure_ascii=False), encoding='utf-8')
+    bot = make_bot(TENANTS_FILE=str(path))
+    bot.get_weather_info = lambda city=None: f"今日天气：{city}晴"
+    monkeypatch.setattr(wework_bot, 'bot', bot)
+    return bot, wework_bot.app.test_client()
+
+
+def test_broadcast_streams_one_result_per_tenant_then_summary(tenant_client, stand_in):
+    """广播响应为NDJSON流：queued、每个群一行 result、最后一行 summary"""
+    _, http = tenant_client
+    response = http.post('/api/message/broadcast')
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert [line['event'] for line in lines] == ['queued', 'result', 'result', 'summary']
+    assert lines[0]['targets'] == 2
+    assert sorted(line['tenant'] for line in lines[1:3]) == ['office', 'oncall']
+    assert all(line['state'] == 'delivered' for line in lines[1:3])
+    assert lines[-1]['success'] and lines[-1]['states'] == {'delivered': 2}
+    assert stand_in.count('POST', '/send') == 2
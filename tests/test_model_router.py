@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""模型路由测试：故障切换和健康排序"""
+
+import json
+
+import pytest
+
+from ark_client import ArkClient
+from conftest import respond
+from model_router import ModelRouter
+from upstream import UpstreamClient
+
+
+@pytest.fixture
+def router(stand_in):
+    """主模型返回 500，备用模型正常生成"""
+    def handler(h):
+        model = json.loads(h.body)['model']
+        if model == 'primary-model':
+            respond(h, 500, '{"error": "internal error"}')
+        else:
+            respond(h, body=json.dumps({'choices': [{'message': {'content': f"{model}：周一加油！"}}],
+                                        'usage': {'total_tokens': 12}}, ensure_ascii=False))
+
+    stand_in.route('POST', '/chat/completions', handler)
+    http = UpstreamClient(read_timeout=5)
+    client = ArkClient(http, stand_in.url, 'test-key', 'primary-model', stream=False, rpm=0, tpm=0,
+                       max_retries=0, context_cache=False)
+    yield ModelRouter(client, ['primary-model', 'secondary-model'], min_samples=1)
+    http.close()
+
+
+def test_primary_error_fails_over_to_secondary(router, stand_in):
+    result = router.complete('写一句话', content_type='encouragement')
+
+    assert result.content == 'secondary-model：周一加油！'
+    assert result.model == 'secondary-model'
+    assert [json.loads(body)['model'] for body in stand_in.bodies('POST', '/chat/completions')] == [
+        'primary-model', 'secondary-model']
+    models = router.stats()['models']
+    assert models['primary-model']['failures'] == 1
+    assert models['secondary-model']['selected'] == 1
+
+
+def test_unhealthy_primary_is_tried_last(router, stand_in):
+    """主模型错误率达到阈值后排到最后，之后的调用直接使用备用模型"""
+    router.complete('写一句话')
+
+    assert router.candidates() == ['secondary-model', 'primary-model']
+    assert not router.stats()['models']['primary-model']['healthy']
+    before = stand_in.count('POST', '/chat/completions')
+    assert router.complete('写一句话').model == 'secondary-model'
+    assert stand_in.count('POST', '/chat/completions') == before + 1
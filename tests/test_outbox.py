@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""webhook发送队列测试：多个实例共享同一个本地存储"""
+
+import threading
+import time
+
+import pytest
+
+from outbox import OutboxJob, OutboxStore, WebhookOutbox
+
+WEBHOOK = 'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=test'
+
+
+class Recorder:
+    """记录每个实例实际发送的消息，可让发送阻塞直到放行"""
+
+    def __init__(self):
+        self.sent = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+
+    def deliver_as(self, name):
+        def deliver(webhook, payload):
+            self.started.set()
+            self.release.wait(5)
+            with self._lock:
+                self.sent.append((name, payload['text']['content']))
+            return {'errcode': 0, 'errmsg': 'ok'}
+        return deliver
+
+    def contents(self):
+        with self._lock:
+            return sorted(content for _, content in self.sent)
+
+
+def payload(content):
+    return {'msgtype': 'text', 'text': {'content': content}}
+
+
+@pytest.fixture
+def outboxes(tmp_path):
+    created = []
+
+    def make(deliver, **options):
+        outbox = WebhookOutbox(deliver, rate_per_minute=600, store=OutboxStore(str(tmp_path)), **options)
+        created.append(outbox)
+        return outbox
+
+    yield make
+    for outbox in created:
+        outbox.stop()
+
+
+def wait_until(predicate, timeout=5):
+    expires_at = time.monotonic() + timeout
+    while time.monotonic() < expires_at:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_two_instances_replay_each_pending_job_once(tmp_path, outboxes):
+    """两个实例同时启动时，上次遗留的任务各只发送一次"""
+    store = OutboxStore(str(tmp_path))
+    now = time.time()
+    for index in range(20):
+        job = OutboxJob(WEBHOOK, payload(f"msg-{index:02d}"), now, job_id=f"job-{index}")
+        assert store.save(job, None, 0, now)
+
+    recorder = Recorder()
+    first = outboxes(recorder.deliver_as('first'), workers=2)
+    second = outboxes(recorder.deliver_as('second'), workers=2)
+    threads = [threading.Thread(target=outbox.start) for outbox in (first, second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert wait_until(lambda: len(recorder.contents()) >= 20)
+    time.sleep(0.2)
+    assert recorder.contents() == [f"msg-{index:02d}" for index in range(20)]
+    assert first.stats()['replayed'] + second.stats()['replayed'] == 20
+
+
+def test_job_being_sent_is_not_replayed_by_another_instance(outboxes):
+    """一个实例正在发送的任务不会被另一个实例重新发送"""
+    recorder = Recorder()
+    recorder.release.clear()
+    first = outboxes(recorder.deliver_as('first'))
+    first.start()
+    job = first.submit(WEBHOOK, payload('daily'), message_id='daily-2026-10-12')
+    assert recorder.started.wait(5)
+
+    second = outboxes(recorder.deliver_as('second'))
+    second.start()
+    assert second.stats()['replayed'] == 0
+    # 另一个实例按相同ID入队时视为重复
+    duplicate = second.submit(WEBHOOK, payload('daily'), message_id='daily-2026-10-12')
+    assert duplicate['duplicate']
+
+    recorder.release.set()
+    assert first.wait(job['job_id'], timeout=5)['state'] == OutboxJob.DELIVERED
+    # 另一个实例也能等到其他实例持有的任务送达
+    assert second.wait(job['job_id'], timeout=5)['state'] == OutboxJob.DELIVERED
+    time.sleep(0.2)
+    assert recorder.sent == [('first', 'daily')]
+
+
+def test_expired_lease_is_taken_over(tmp_path, outboxes):
+    """持有任务的实例退出后，租约过期的任务由存活的实例接管发送"""
+    store = OutboxStore(str(tmp_path))
+    now = time.time()
+    job = OutboxJob(WEBHOOK, payload('orphan'), now, job_id='orphan')
+    assert store.save(job, 'dead-instance', now + 0.3, now)
+
+    recorder = Recorder()
+    survivor = outboxes(recorder.deliver_as('survivor'), lease=0.3)
+    survivor.start()
+    time.sleep(0.1)
+    assert recorder.sent == []  # 租约未过期时不接管
+
+    assert wait_until(lambda: recorder.sent == [('survivor', 'orphan')])
+    assert store.load('orphan').state == OutboxJob.DELIVERED
+
+
+def test_store_upgrades_table_without_lease_columns(tmp_path):
+    """早期版本创建的表补充租约字段，原有的未完成任务可以被认领"""
+    import sqlite3
+    path = tmp_path / 'webhook_outbox.sqlite3'
+    conn = sqlite3.connect(str(path))
+    conn.execute('CREATE TABLE outbox_jobs (id TEXT PRIMARY KEY, webhook TEXT NOT NULL, payload TEXT NOT NULL,'
+                 ' state TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL,'
+                 ' next_attempt_at REAL NOT NULL, attempts TEXT NOT NULL, error TEXT)')
+    conn.execute("INSERT INTO outbox_jobs VALUES ('old', ?, '{}', 'queued', 1, 1, 1, '[]', NULL)", (WEBHOOK,))
+    conn.commit()
+    conn.close()
+
+    store = OutboxStore(str(tmp_path))
+    claimed = store.claim_pending('me', time.time() + 60, time.time())
+    assert [job.id for job in claimed] == ['old']
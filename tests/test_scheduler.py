@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""定时任务测试：cron表达式解析和重启后补发"""
+
+from datetime import datetime
+
+import pytest
+import pytz
+
+from scheduler import CronSchedule, DailyPushScheduler
+
+
+def test_ranges_and_lists():
+    schedule = CronSchedule('0,30 9-11 * * 1-5')
+
+    assert schedule.minutes == [0, 30]
+    assert schedule.hours == [9, 10, 11]
+    assert schedule.weekdays == {1, 2, 3, 4, 5}
+    # 周五最后一次之后是下周一
+    assert schedule.next_after(datetime(2026, 10, 16, 11, 30)) == datetime(2026, 10, 19, 9, 0)
+    assert schedule.previous_before(datetime(2026, 10, 18, 12, 0)) == datetime(2026, 10, 16, 11, 30)
+
+
+@pytest.mark.parametrize('expression, minutes', [
+    ('*/15 * * * *', [0, 15, 30, 45]),
+    ('0-30/10 * * * *', [0, 10, 20, 30]),
+    ('5/20 * * * *', [5, 25, 45])
+])
+def test_steps(expression, minutes):
+    assert CronSchedule(expression).minutes == minutes
+
+
+def test_day_or_weekday_matches_either():
+    """日和周同时指定时任一匹配即触发"""
+    schedule = CronSchedule('0 9 13 * 5')
+
+    assert schedule.next_after(datetime(2026, 10, 12, 10, 0)) == datetime(2026, 10, 13, 9, 0)  # 13日（周二）
+    assert schedule.next_after(datetime(2026, 10, 13, 10, 0)) == datetime(2026, 10, 16, 9, 0)  # 周五
+    assert CronSchedule('0 9 13 * *').next_after(datetime(2026, 10, 13, 10, 0)) == datetime(2026, 11, 13, 9, 0)
+
+
+def test_seven_means_sunday():
+    schedule = CronSchedule('0 9 * * 7')
+
+    assert schedule.weekdays == {0}
+    assert schedule.next_after(datetime(2026, 10, 12, 9, 0)) == datetime(2026, 10, 18, 9, 0)
+    assert CronSchedule('0 9 * * 0').next_after(datetime(2026, 10, 12, 9, 0)) == datetime(2026, 10, 18, 9, 0)
+
+
+@pytest.mark.parametrize('expression', ['0 10 * *', '0 24 * * *', '*/0 * * * *', '0 10 * * 8', '30-10 * * * *'])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+@pytest.fixture
+def make_scheduler(tmp_path):
+    """创建当前时间固定的定时任务，记录发送阶段的触发时间（每个定时任务使用独立的状态目录）"""
+    made = []
+
+    def make(now, last_fire_time=None, catchup_window=7200):
+        fired = []
+        state_dir = tmp_path / str(len(made))
+        state_dir.mkdir()
+        scheduler = DailyPushScheduler(
+            CronSchedule('0 10 * * 1-5'),
+            prepare=lambda fire_time: None,
+            deliver=lambda fire_time: fired.append(fire_time) or {'success': True},
+            timezone=pytz.timezone('Asia/Shanghai'),
+            catchup_window=catchup_window,
+            state_dir=str(state_dir)
+        )
+        made.append(scheduler)
+        scheduler._now = lambda: now
+        if last_fire_time is not None:
+            scheduler._update_state(last_fire_time=last_fire_time.isoformat())
+        return scheduler, fired
+    return make
+
+
+def test_catch_up_fires_missed_push(make_scheduler):
+    """重启时最近一次应触发的推送未执行且在补发窗口内，立即补发"""
+    scheduler, fired = make_scheduler(datetime(2026, 10, 12, 10, 30), last_fire_time=datetime(2026, 10, 9, 10, 0))
+    scheduler._catch_up()
+
+    assert fired == [datetime(2026, 10, 12, 10, 0)]
+    state = scheduler._load_state()
+    assert state['last_fire_time'] == '2026-10-12T10:00:00'
+    assert state['last_run']['catch_up'] is True
+
+    # 已补发的推送不再重复
+    scheduler._catch_up()
+    assert len(fired) == 1
+
+
+def test_catch_up_skips_push_beyond_window(make_scheduler):
+    scheduler, fired = make_scheduler(datetime(2026, 10, 12, 12, 30), last_fire_time=datetime(2026, 10, 9, 10, 0))
+    scheduler._catch_up()
+
+    assert fired == []
+
+
+def test_catch_up_skips_weekend_and_first_start(make_scheduler):
+    """周末没有应触发的推送，周五的推送已执行；首次启动没有历史记录时不补发"""
+    scheduler, fired = make_scheduler(datetime(2026, 10, 17, 10, 30), last_fire_time=datetime(2026, 10, 16, 10, 0))
+    scheduler._catch_up()
+    assert fired == []
+
+    scheduler, fired = make_scheduler(datetime(2026, 10, 12, 10, 30))
+    scheduler._catch_up()
+    assert fired == []
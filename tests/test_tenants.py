@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""多群配置测试"""
+
+import json
+from datetime import datetime
+
+import pytest
+
+from tenants import TenantRegistry
+
+TENANTS = [
+    {'name': 'office', 'webhook': 'http://127.0.0.1:9/send?key=office', 'city': '上海'},
+    {'name': 'oncall', 'webhook': 'http://127.0.0.1:9/send?key=oncall', 'city': '北京',
+     'schedule': '0 9 * * *', 'weekends': True, 'sections': ['weather', 'encouragement']}
+]
+
+
+def test_weekends_default_to_off():
+    registry = TenantRegistry.from_config(TENANTS, '上海', '0 10 * * 1-5')
+
+    assert [profile.weekends for profile in registry] == [False, True]
+    assert [profile.name for profile in registry.active_on(5)] == ['oncall']
+    assert [profile.name for profile in registry.active_on(0)] == ['office', 'oncall']
+    assert TenantRegistry.from_config(TENANTS[:1], '上海', '0 10 * * 1-5').active_on(6) is None
+
+
+@pytest.mark.parametrize('value', ['false', 'true', 1, 0, None])
+def test_weekends_must_be_boolean(value):
+    """weekends 只接受布尔值，字符串 "false" 不会被当作开启"""
+    items = [dict(TENANTS[0], weekends=value)]
+    with pytest.raises(ValueError, match='weekends'):
+        TenantRegistry.from_config(items, '上海', '0 10 * * 1-5')
+
+
+@pytest.fixture
+def tenant_bot(make_bot, tmp_path):
+    path = tmp_path / 'tenants.json'
+    path.write_text(json.dumps(TENANTS, ensure_ascii=False), encoding='utf-8')
+    bot = make_bot(TENANTS_FILE=str(path))
+    bot.get_weather_info = lambda city=None: f"今日天气：{city}晴"
+    return bot
+
+
+def test_weekend_push_only_for_opted_in_tenants(tenant_bot, clock):
+    """周末只生成选择了周末推送的群的消息，只获取这些群需要的分段"""
+    clock.set(datetime(2026, 10, 17, 9, 0))  # 周六
+    messages, timings = tenant_bot.build_daily_messages()
+
+    assert messages['office'] is None
+    assert '北京晴' in messages['oncall']
+    assert 'weather:北京' in timings
+    assert 'weather' not in timings and 'fortune' not in timings
+
+
+def test_weekday_push_for_all_tenants(tenant_bot):
+    messages, _ = tenant_bot.build_daily_messages()
+
+    assert '上海晴' in messages['office']
+    assert '北京晴' in messages['oncall']
+
+
+def test_tenants_sharing_a_webhook_each_get_their_message(make_bot, tmp_path):
+    """共用同一个机器人的两个群的每日消息ID不同，不会被当作重复消息"""
+    shared = 'http://127.0.0.1:9/send?key=shared'
+    path = tmp_path / 'tenants.json'
+    path.write_text(json.dumps([
+        {'name': 'team-a', 'webhook': shared, 'city': '上海'},
+        {'name': 'team-b', 'webhook': shared, 'city': '北京'}
+    ], ensure_ascii=False), encoding='utf-8')
+    bot = make_bot(TENANTS_FILE=str(path))
+    bot.outbox.stop()  # 只检查入队结果，不实际发送
+    bot.get_weather_info = lambda city=None: f"今日天气：{city}晴"
+    result = bot.send_daily_message(wait=False)
+
+    assert [job['tenant'] for job in result['jobs']] == ['team-a', 'team-b']
+    assert not any(job['duplicate'] for job in result['jobs'])
+    assert len({job['job_id'] for job in result['jobs']}) == 2
+    assert result['jobs'][0]['job_id'].startswith(f"{result['message_id']}:team-a@")
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""上游HTTP客户端测试"""
+
+import time
+
+import pytest
+import requests
+
+from conftest import respond
+from deadline import request_deadline
+from cache import Degraded
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamClient
+
+
+def slow_ok(delay):
+    def handler(h):
+        time.sleep(delay)
+        respond(h, body='{"status": "1"}')
+    return handler
+
+
+def test_budget_clamped_timeouts_do_not_open_breaker(stand_in):
+    """调用方时间预算不足导致的超时不计入熔断失败和耗时直方图"""
+    stand_in.route('GET', '/weather', slow_ok(0.5))
+    client = UpstreamClient(read_timeout=5, failure_threshold=3)
+    url = f"{stand_in.url}/weather"
+    try:
+        for _ in range(5):
+            with request_deadline(0.2):
+                with pytest.raises(requests.exceptions.Timeout):
+                    client.get(url)
+
+        assert client.breaker_for(url).state == CircuitBreaker.CLOSED
+        assert client.breaker_stats()[stand_in.url[7:]]['consecutive_failures'] == 0
+        assert client.histogram_for(client._endpoint_of(url)).count == 0
+        # 其他调用方不受影响
+        assert client.get(url).status_code == 200
+    finally:
+        client.close()
+
+
+def test_unclamped_timeouts_still_open_breaker(stand_in):
+    """超时不是由时间预算收紧导致时照常计入熔断失败"""
+    stand_in.route('GET', '/weather', slow_ok(0.5))
+    client = UpstreamClient(read_timeout=0.1, failure_threshold=3)
+    url = f"{stand_in.url}/weather"
+    try:
+        for _ in range(3):
+            with request_deadline(5):
+                with pytest.raises(requests.exceptions.Timeout):
+                    client.get(url)
+        assert client.breaker_for(url).state == CircuitBreaker.OPEN
+    finally:
+        client.close()
+
+
+def test_ignored_call_returns_half_open_probe():
+    """不计成败的探测请求归还半开名额，熔断器不会卡在半开状态"""
+    now = [0.0]
+    breaker = CircuitBreaker('amap', failure_threshold=1, recovery_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 11
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_ignored()
+    assert breaker.allow()
+
+
+def test_breaker_transitions_closed_open_half_open_closed(stand_in):
+    """连续失败后熔断，熔断期间请求不发出，恢复时间后放行探测请求，成功则恢复"""
+    status = [500]
+    stand_in.route('GET', '/weather', lambda h: respond(h, status=status[0], body='{}'))
+    client = UpstreamClient(failure_threshold=2, recovery_timeout=0.3)
+    url = f"{stand_in.url}/weather"
+    try:
+        for _ in range(2):
+            assert client.get(url).status_code == 500
+        breaker = client.breaker_for(url)
+        assert breaker.state == CircuitBreaker.OPEN
+
+        with pytest.raises(CircuitOpenError):
+            client.get(url)
+        assert stand_in.count('GET', '/weather') == 2
+
+        time.sleep(0.35)
+        status[0] = 200
+        assert client.get(url).status_code == 200
+        stats = breaker.stats()
+        assert stats['state'] == CircuitBreaker.CLOSED
+        assert stats['short_circuited'] == 1
+        assert stats['transitions'] == {'closed->open': 1, 'open->half_open': 1, 'half_open->closed': 1}
+    finally:
+        client.close()
+
+
+def test_failed_half_open_probe_reopens_breaker(stand_in):
+    stand_in.route('GET', '/weather', lambda h: respond(h, status=503, body='{}'))
+    client = UpstreamClient(failure_threshold=1, recovery_timeout=0.2)
+    url = f"{stand_in.url}/weather"
+    try:
+        client.get(url)
+        time.sleep(0.25)
+        assert client.get(url).status_code == 503
+        breaker = client.breaker_for(url)
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.stats()['transitions']['half_open->open'] == 1
+        with pytest.raises(CircuitOpenError):
+            client.get(url)
+    finally:
+        client.close()
+
+
+def test_open_breaker_short_circuits_to_fallback(make_bot):
+    """天气上游熔断时不发出请求，直接返回降级的备用天气"""
+    bot = make_bot(WEATHER_API_KEY='test-key')
+    breaker = bot.http.breaker_for('https://restapi.amap.com/v3/weather/weatherInfo')
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    started = time.monotonic()
+    result = bot._fetch_weather_info('北京')
+
+    assert isinstance(result, Degraded)
+    assert '天气' in result.data
+    assert breaker.stats()['short_circuited'] >= 1
+    assert time.monotonic() - started < 1
+
+
+def prime(client, url, samples, elapsed_ms):
+    """预置接口耗时样本，使对冲延迟（p95）可预期"""
+    histogram = client.histogram_for(client._endpoint_of(url))
+    for _ in range(samples):
+        histogram.record(elapsed_ms)
+
+
+def test_hedge_fires_after_delay_and_first_response_wins(stand_in):
+    """首个GET超过 p95 未返回时发出对冲请求，先返回的响应胜出"""
+    calls = []
+
+    def handler(h):
+        calls.append(time.monotonic())
+        # 第一个请求很慢，对冲请求立即返回
+        if len(calls) == 1:
+            time.sleep(1.0)
+            respond(h, body='{"from": "primary"}')
+        else:
+            respond(h, body='{"from": "hedge"}')
+
+    stand_in.route('GET', '/weather', handler)
+    client = UpstreamClient(read_timeout=5)
+    client.configure_host(stand_in.url, hedge=True, min_samples=5)
+    url = f"{stand_in.url}/weather"
+    prime(client, url, 10, 100)
+    try:
+        started = time.monotonic()
+        response = client.get(url)
+        elapsed = time.monotonic() - started
+
+        assert response.json() == {'from': 'hedge'}
+        assert stand_in.count('GET', '/weather') == 2
+        assert calls[1] - started >= 0.1  # 等待 p95（100ms）后才对冲
+        assert elapsed < 0.8
+        stats = client.latency_stats()[client._endpoint_of(url)]
+        assert stats['hedged'] == 1 and stats['hedge_wins'] == 1
+    finally:
+        client.close()
+
+
+def test_hedge_timeout_bounded_by_remaining_budget(stand_in):
+    """对冲请求晚于首个请求发出，其读取超时按剩余的请求时间预算收紧，不会超出预算"""
+    stand_in.route('GET', '/weather', slow_ok(2))
+    client = UpstreamClient(read_timeout=5)
+    client.configure_host(stand_in.url, hedge=True, min_samples=5)
+    url = f"{stand_in.url}/weather"
+    prime(client, url, 10, 300)
+    try:
+        started = time.monotonic()
+        with request_deadline(0.6):
+            with pytest.raises(requests.exceptions.Timeout):
+                client.get(url)
+        elapsed = time.monotonic() - started
+
+        assert stand_in.count('GET', '/weather') == 2
+        assert elapsed < 0.8
+    finally:
+        client.close()
+
+
+def test_no_hedge_when_primary_answers_in_time(stand_in):
+    """首个请求在 p95 内返回时不发对冲请求"""
+    stand_in.route('GET', '/weather', slow_ok(0))
+    client = UpstreamClient(read_timeout=5)
+    client.configure_host(stand_in.url, hedge=True, min_samples=5)
+    url = f"{stand_in.url}/weather"
+    prime(client, url, 10, 500)
+    try:
+        assert client.get(url).status_code == 200
+        assert stand_in.count('GET', '/weather') == 1
+    finally:
+        client.close()
+
+
+def test_no_hedge_for_non_get(stand_in):
+    """非GET请求即使超过 p95 也不对冲"""
+    stand_in.route('POST', '/weather', slow_ok(0.4))
+    client = UpstreamClient(read_timeout=5)
+    client.configure_host(stand_in.url, hedge=True, min_samples=5)
+    url = f"{stand_in.url}/weather"
+    prime(client, url, 10, 50)
+    try:
+        assert client.post(url, json={}).status_code == 200
+        assert stand_in.count('POST', '/weather') == 1
+        assert 'hedged' not in client.latency_stats()[client._endpoint_of(url)]
+    finally:
+        client.close()
+
+
+def test_adaptive_timeout_follows_recent_p99(stand_in):
+    """自适应超时取最近 p99 的倍数，并以配置的读取超时为上限"""
+    client = UpstreamClient(read_timeout=10)
+    client.configure_host(stand_in.url, adaptive_timeout=True, timeout_multiplier=3, min_samples=5,
+                          adaptive_min_timeout=0.1)
+    url = f"{stand_in.url}/weather"
+    endpoint = client._endpoint_of(url)
+    config = client.host_config(url)
+    assert client._adaptive_timeout(endpoint, config) is None
+    prime(client, url, 10, 100)
+    assert client._adaptive_timeout(endpoint, config) == pytest.approx(0.3)
+    prime(client, url, 256, 8000)
+    assert client._adaptive_timeout(endpoint, config) == 10
+
+    # 最近耗时 100ms 的接口，0.5s 未返回即按自适应超时（0.3s）放弃
+    stand_in.route('GET', '/forecast', slow_ok(0.5))
+    forecast = f"{stand_in.url}/forecast"
+    prime(client, forecast, 10, 100)
+    try:
+        with pytest.raises(requests.exceptions.Timeout):
+            client.get(forecast)
+    finally:
+        client.close()
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上游HTTP客户端
+按主机维护长连接池和熔断器，供高德、天行、ARK和企业微信等上游调用复用；
+按接口统计最近的耗时分布，用于自适应超时和对冲请求
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from deadline import DeadlineExceeded, bound_timeout, check_deadline, current_deadline
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """上游熔断中，请求未发出即被拒绝"""
+
+
+class CircuitBreaker:
+    """单个上游主机的熔断器
+
+    - closed：正常放行，连续失败达到阈值后转为 open
+    - open：直接拒绝请求，经过恢复时间后转为 half_open
+    - half_open：放行少量探测请求，成功则恢复 closed，失败则重新 open
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30, half_open_max_calls=1, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._half_open_calls = 0
+        self._short_circuited = 0
+        self._transitions = defaultdict(int)
+
+    def _transition(self, new_state):
+        """切换状态并记录转换次数（调用方需持有锁）"""
+        self._transitions[f"{self.state}->{new_state}"] += 1
+        log = logger.warning if new_state == self.OPEN else logger.info
+        log(f"熔断器 {self.name}: {self.state} -> {new_state}")
+        self.state = new_state
+        if new_state == self.OPEN:
+            self._opened_at = self._clock()
+        elif new_state == self.HALF_OPEN:
+            self._half_open_calls = 0
+
+    def allow(self):
+        """判断是否放行请求"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if self._clock() - self._opened_at < self.recovery_timeout:
+                    self._short_circuited += 1
+                    return False
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    self._short_circuited += 1
+                    return False
+                self._half_open_calls += 1
+            return True
+
+    def record_success(self):
+        """记录一次成功"""
+        with self._lock:
+            self._failures = 0
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_ignored(self):
+        """放行的请求不计成功也不计失败（如调用方时间预算不足导致超时），归还半开状态的探测名额"""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_failure(self):
+        """记录一次失败"""
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._transition(self.OPEN)
+
+    def stats(self):
+        """获取熔断器状态"""
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self._failures,
+                'short_circuited': self._short_circuited,
+                'transitions': dict(self._transitions)
+            }
+
+
+class LatencyHistogram:
+    """固定大小环形缓冲区中的最近耗时样本（毫秒）"""
+
+    def __init__(self, size=256):
+        self._samples = [0.0] * size
+        self._size = size
+        self._index = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms):
+        """记录一个样本，缓冲区满后覆盖最早的样本"""
+        with self._lock:
+            self._samples[self._index] = elapsed_ms
+            self._index = (self._index + 1) % self._size
+            self._count = min(self._count + 1, self._size)
+
+    @property
+    def count(self):
+        return self._count
+
+    def percentiles(self, *fractions):
+        """获取多个分位数（毫秒），没有样本时均为 None"""
+        with self._lock:
+            samples = sorted(self._samples[:self._count])
+        if not samples:
+            return tuple(None for _ in fractions)
+        return tuple(samples[min(len(samples) - 1, int(len(samples) * fraction))] for fraction in fractions)
+
+
+class UpstreamClient:
+    """按主机复用连接的HTTP客户端
+
+    每个上游主机拥有独立的 requests.Session 和连接池，
+    连接保持 keep-alive，避免每次请求重复 DNS/TCP/TLS 握手。
+    超时拆分为连接超时和读取超时两部分。
+    每个主机另有一个熔断器：网络异常和5xx响应计为失败，熔断期间直接抛出 CircuitOpenError。
+    在API请求中调用时，读取超时不超过请求剩余的时间预算，预算耗尽时抛出 DeadlineExceeded；
+    每次调用的耗时记入请求的耗时明细。
+
+    每个接口（主机+路径）的耗时记入环形缓冲区直方图（含超时样本，被时间预算收紧的超时除外），主机开启以下选项时使用：
+    - adaptive_timeout：调用方未指定超时时，读取超时取 p99 × timeout_multiplier，
+      不低于 adaptive_min_timeout、不高于配置的读取超时；样本少于 min_samples 时使用配置的读取超时
+    - hedge：GET请求超过 p95 仍未返回时再发一个相同请求，取先返回的结果，另一个在后台结束后丢弃
+    """
+
+    def __init__(self, connect_timeout=3, read_timeout=10, pool_maxsize=10,
+                 failure_threshold=5, recovery_timeout=30, latency_window=256, hedge_workers=8):
+        self.default_config = {
+            'connect_timeout': connect_timeout,
+            'read_timeout': read_timeout,
+            'pool_maxsize': pool_maxsize,
+            'failure_threshold': failure_threshold,
+            'recovery_timeout': recovery_timeout,
+            'adaptive_timeout': False,
+            'timeout_multiplier': 3,
+            'adaptive_min_timeout': 1.0,
+            'min_samples': 20,
+            'hedge': False,
+            'hedge_min_delay': 0.05
+        }
+        self.latency_window = latency_window
+        self.hedge_workers = hedge_workers
+        self._host_config = {}
+        self._sessions = {}
+        self._breakers = {}
+        self._histograms = {}  # 接口 -> LatencyHistogram
+        self._endpoint_counters = defaultdict(lambda: defaultdict(int))
+        self._hedge_executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _host_of(url):
+        """提取URL中的主机名（含端口）"""
+        return urlsplit(url).netloc.lower()
+
+    def configure_host(self, host_or_url, **config):
+        """配置指定上游主机的连接池大小和超时
+
+        支持的配置项：connect_timeout、read_timeout、pool_maxsize、failure_threshold、recovery_timeout、
+        adaptive_timeout、timeout_multiplier、adaptive_min_timeout、min_samples、hedge、hedge_min_delay
+        """
+        host = self._host_of(host_or_url) if '://' in host_or_url else host_or_url.lower()
+        if not host:
+            return
+        with self._lock:
+            merged = dict(self._host_config.get(host, self.default_config))
+            merged.update({k: v for k, v in config.items() if v is not None})
+            self._host_config[host] = merged
+            # 配置变更后重建该主机的会话和熔断器
+            session = self._sessions.pop(host, None)
+            self._breakers.pop(host, None)
+        if session is not None:
+            session.close()
+
+    def host_config(self, url):
+        """获取URL对应主机的配置"""
+        return self._host_config.get(self._host_of(url), self.default_config)
+
+    def _session_for(self, url):
+        """获取（必要时创建）URL对应主机的会话"""
+        host = self._host_of(url)
+        session = self._sessions.get(host)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                config = self._host_config.get(host, self.default_config)
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=config['pool_maxsize'],
+                    max_retries=0,  # 重试由调用方统一处理
+                    pool_block=False
+                )
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'Connection': 'keep-alive'})
+                self._sessions[host] = session
+                logger.info(f"创建上游连接池: {host} (pool_maxsize={config['pool_maxsize']})")
+        return session
+
+    def breaker_for(self, url):
+        """获取（必要时创建）URL对应主机的熔断器"""
+        host = self._host_of(url)
+        breaker = self._breakers.get(host)
+        if breaker is not None:
+            return breaker
+
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                config = self._host_config.get(host, self.default_config)
+                breaker = CircuitBreaker(
+                    host,
+                    failure_threshold=config['failure_threshold'],
+                    recovery_timeout=config['recovery_timeout']
+                )
+                self._breakers[host] = breaker
+        return breaker
+
+    def _resolve_timeout(self, url, timeout):
+        """解析超时设置，返回 (连接超时, 读取超时)
+
+        传入单个数值时视为读取超时，连接超时仍使用主机配置。
+        """
+        config = self.host_config(url)
+        if timeout is None:
+            return (config['connect_timeout'], config['read_timeout'])
+        if isinstance(timeout, (tuple, list)):
+            return tuple(timeout)
+        return (min(config['connect_timeout'], timeout), timeout)
+
+    @staticmethod
+    def _endpoint_of(url):
+        """提取URL中的接口（主机+路径，不含查询参数）"""
+        parts = urlsplit(url)
+        return f"{parts.netloc.lower()}{parts.path}"
+
+    def histogram_for(self, endpoint):
+        """获取（必要时创建）接口的耗时直方图"""
+        histogram = self._histograms.get(endpoint)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(endpoint, LatencyHistogram(self.latency_window))
+        return histogram
+
+    def _adaptive_timeout(self, endpoint, config):
+        """按最近 p99 计算读取超时，样本不足时返回 None（使用配置的读取超时）"""
+        histogram = self.histogram_for(endpoint)
+        if histogram.count < config['min_samples']:
+            return None
+        p99, = histogram.percentiles(0.99)
+        timeout = p99 / 1000 * config['timeout_multiplier']
+        return min(config['read_timeout'], max(config['adaptive_min_timeout'], timeout))
+
+    def _hedge_delay(self, endpoint, config):
+        """对冲请求的等待时间（最近 p95），样本不足时返回 None（不对冲）"""
+        histogram = self.histogram_for(endpoint)
+        if histogram.count < config['min_samples']:
+            return None
+        p95, = histogram.percentiles(0.95)
+        return max(config['hedge_min_delay'], p95 / 1000)
+
+    def _bound_timeout(self, url, timeout):
+        """按请求剩余时间预算收紧 (连接超时, 读取超时)，返回 ((连接超时, 读取超时), 是否被预算收紧)
+
+        预算耗尽时抛出 DeadlineExceeded
+        """
+        connect_timeout, read_timeout = self._resolve_timeout(url, timeout)
+        if current_deadline() is None:
+            return (connect_timeout, read_timeout), False
+        check_deadline(f"请求 {self._host_of(url)}")
+        bounded = bound_timeout(read_timeout)
+        return (min(connect_timeout, bounded), bounded), bounded < read_timeout
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """发送HTTP请求
+
+        上游熔断中时直接抛出 CircuitOpenError，调用方按网络异常处理并走降级逻辑。
+        读取超时被请求时间预算收紧后发生的超时是调用方预算不足，不代表上游异常：
+        不计入熔断失败，也不计入耗时直方图
+        """
+        endpoint = self._endpoint_of(url)
+        config = self.host_config(url)
+        if timeout is None and config['adaptive_timeout']:
+            timeout = self._adaptive_timeout(endpoint, config)
+        timeout, clamped = self._bound_timeout(url, timeout)
+        breaker = self.breaker_for(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"上游 {breaker.name} 熔断中，请求已跳过")
+
+        session = self._session_for(url)
+        deadline = current_deadline()
+        hedge_delay = None
+        if method == 'GET' and config['hedge'] and not kwargs.get('stream'):
+            hedge_delay = self._hedge_delay(endpoint, config)
+        started = time.monotonic()
+        try:
+            if hedge_delay is None:
+                response = self._attempt(session, method, url, endpoint, timeout, clamped, kwargs)
+            else:
+                response = self._hedged(session, method, url, endpoint, timeout, clamped, hedge_delay, kwargs)
+        except requests.exceptions.RequestException as e:
+            if clamped and isinstance(e, requests.exceptions.Timeout):
+                breaker.record_ignored()
+            else:
+                breaker.record_failure()
+            if deadline is not None:
+                deadline.record(f"{method} {breaker.name}", started, error=type(e).__name__)
+            raise
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if deadline is not None:
+            deadline.record(f"{method} {breaker.name}", started, status=response.status_code)
+        return response
+
+    def _attempt(self, session, method, url, endpoint, timeout, clamped, kwargs):
+        """发出一次请求并记录接口耗时
+
+        超时按实际等待时间记录；clamped 为 True（读取超时被请求时间预算收紧）时超时不记录样本
+        """
+        started = time.monotonic()
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.exceptions.Timeout:
+            if clamped:
+                raise
+            self.histogram_for(endpoint).record((time.monotonic() - started) * 1000)
+            with self._lock:
+                self._endpoint_counters[endpoint]['timeouts'] += 1
+            raise
+        if response.status_code < 500:
+            self.histogram_for(endpoint).record((time.monotonic() - started) * 1000)
+        return response
+
+    def _executor(self):
+        """获取（必要时创建）对冲请求线程池"""
+        if self._hedge_executor is None:
+            with self._lock:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(max_workers=self.hedge_workers,
+                                                              thread_name_prefix='upstream-hedge')
+        return self._hedge_executor
+
+    def _hedged(self, session, method, url, endpoint, timeout, clamped, delay, kwargs):
+        """对冲请求：首个请求超过 delay 秒未返回时再发一个，返回先成功的响应
+
+        对冲请求的超时按发出时剩余的请求时间预算重新收紧，预算已耗尽时不再对冲
+        """
+        executor = self._executor()
+
+        def submit(timeout, clamped):
+            return executor.submit(contextvars.copy_context().run, self._attempt, session, method, url, endpoint,
+                                   timeout, clamped, kwargs)
+
+        primary = submit(timeout, clamped)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        try:
+            hedge_timeout, hedge_clamped = self._bound_timeout(url, timeout)
+        except DeadlineExceeded:
+            return primary.result()
+        hedge = submit(hedge_timeout, clamped or hedge_clamped)
+        with self._lock:
+            self._endpoint_counters[endpoint]['hedged'] += 1
+        pending = {primary, hedge}
+        fallback, error = None, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.exceptions.RequestException as e:
+                    error = e
+                    continue
+                if response.status_code >= 500 and pending:
+                    fallback = response  # 另一个请求仍可能成功
+                    continue
+                for other in pending:
+                    other.add_done_callback(self._discard)
+                if fallback is not None and fallback is not response:
+                    fallback.close()
+                if future is hedge:
+                    with self._lock:
+                        self._endpoint_counters[endpoint]['hedge_wins'] += 1
+                return response
+        if fallback is not None:
+            return fallback
+        raise error
+
+    @staticmethod
+    def _discard(future):
+        """丢弃落后的对冲请求结果"""
+        if not future.cancelled() and future.exception() is None:
+            future.result().close()
+
+    def get(self, url, **kwargs):
+        """发送GET请求"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """发送POST请求"""
+        return self.request('POST', url, **kwargs)
+
+    def breaker_stats(self):
+        """获取各主机熔断器状态"""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {host: breaker.stats() for host, breaker in sorted(breakers.items())}
+
+    def stats(self):
+        """获取各主机连接池配置"""
+        hosts = set(self._host_config) | set(self._sessions)
+        return {
+            host: {
+                'connected': host in self._sessions,
+                **self._host_config.get(host, self.default_config)
+            }
+            for host in sorted(hosts)
+        }
+
+    def latency_stats(self):
+        """获取各接口最近的耗时分位数、当前自适应超时和对冲次数"""
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = {endpoint: dict(values) for endpoint, values in self._endpoint_counters.items()}
+        stats = {}
+        for endpoint, histogram in sorted(histograms.items()):
+            config = self._host_config.get(endpoint.split('/', 1)[0], self.default_config)
+            p50, p95, p99 = histogram.percentiles(0.5, 0.95, 0.99)
+            adaptive = self._adaptive_timeout(endpoint, config) if config['adaptive_timeout'] else None
+            stats[endpoint] = {
+                'samples': histogram.count,
+                'p50_ms': None if p50 is None else round(p50, 1),
+                'p95_ms': None if p95 is None else round(p95, 1),
+                'p99_ms': None if p99 is None else round(p99, 1),
+                'read_timeout': round(adaptive, 2) if adaptive is not None else config['read_timeout'],
+                'hedge': config['hedge'],
+                **counters.get(endpoint, {})
+            }
+        return stats
+
+    def close(self):
+        """关闭所有连接池"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            executor, self._hedge_executor = self._hedge_executor, None
+        for session in sessions:
+            session.close()
+        if executor is not None:
+            executor.shutdown(wait=False)
@@ -7,6 +7,7 @@
 
 import os
 import os
+import hashlib
 import json
 import random
 import time
@@ -16,6 +17,21 @@ from dotenv import load_dotenv
 import requests
 import pytz
 import logging
+import atexit
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from upstream import UpstreamClient
+from pipeline import Section, SectionPipeline
+from cache import BotCache, DiskCacheStore, SingleFlight, CacheStats, ViewMemo, Degraded
+from constellations import SIGN_IDS, normalize_sign_id, sign_name
+from scheduler import CronSchedule, DailyPushScheduler
+from content_pool import ContentPool
+from ark_client import ArkClient, GenerationStats, parse_json_sections
+from model_router import ModelRouter
+from deadline import DeadlineExceeded, bound_timeout, remaining_budget
+from outbox import OutboxStore, WebhookOutbox, webhook_id
+from tenants import TenantProfile, TenantRegistry
 
 # 加载环境变量
 load_dotenv()
@@ -29,11 +45,80 @@ app = Flask(__name__)
 # 配置Flask应用，避免斜杠重定向问题
 app.url_map.strict_slashes = False
 
+# 天气类别及用于生成午餐推荐提示词的描述
+WEATHER_CATEGORY_LABELS = {
+    'sunny': '晴天',
+    'rainy': '下雨天',
+    'cloudy': '阴天多云',
+    'windy': '大风天',
+    'other': '普通天气'
+}
+
+# 鼓励话语生成要求
+ENCOURAGEMENT_RULES = """要求：
+1. 必须使用第一人称来叙述
+2. 语调要有黑色幽默感，既丧又不失希望
+3. 体现社畜的真实心理状态和生存智慧
+4. 长度控制在2-3句话，要有画面感
+5. 可以适当自嘲，但要有积极的底色
+6. 结合当天是星期几的特殊感受（如周一的绝望、周五的期待等）
+7. 语言要接地气，有共鸣感
+8. 适当使用emoji，但不要过多
+9. 可以提及咖啡、地铁等社畜日常元素"""
+
+# 午餐推荐生成要求
+LUNCH_RULES = """要求：
+1. 语言要接地气，像真正的外卖达人在分享经验
+2. 推荐具体的外卖店铺类型或菜品类别
+3. 解释为什么这个外卖选择适合当前天气
+4. 可以提及配送时间、性价比、口味特点等实用信息
+5. 体现对外卖平台和商家的了解
+6. 包含一些外卖小贴士或避坑指南
+7. 长度控制在2-3句话，要实用有趣
+8. 语调要亲切自然，像朋友推荐
+9. 可以提及外卖平台活动、优惠券等实用信息
+10. 使用网络流行语，但要适度
+11. 要有外卖老用户的实战经验感
+12. 适当使用emoji，营造轻松氛围"""
+
+# 固定的提示词前缀（生成要求），通过ARK上下文缓存只上传一次，每次请求只发送变化的风格描述
+ENCOURAGEMENT_PROMPT_PREFIX = f"""你负责为企业微信群的每日推送撰写上班鼓励话语。
+
+{ENCOURAGEMENT_RULES}
+
+请直接输出鼓励话语，不要解释。"""
+
+LUNCH_PROMPT_PREFIX = f"""你负责为企业微信群的每日推送撰写午餐外卖推荐。
+
+{LUNCH_RULES}
+
+请直接输出推荐内容，不要解释。"""
+
+COMBINED_PROMPT_PREFIX = f"""你负责为企业微信群的每日推送同时生成两段内容：encouragement（上班鼓励话语）和 lunch（午餐外卖推荐）。
+
+encouragement 的{ENCOURAGEMENT_RULES}
+
+lunch 的{LUNCH_RULES}
+
+只输出一个JSON对象，格式为 {{"encouragement": "...", "lunch": "..."}}，不要输出其他任何文字。"""
+
+# 合并生成各字段的最大长度（字符）
+SECTION_LENGTH_LIMITS = {
+    'encouragement': 150,
+    'lunch': 200
+}
+
 class WeWorkBot:
     def __init__(self):
         self.webhook_url = os.getenv('WEBHOOK_URL')
         self.weather_api_key = os.getenv('WEATHER_API_KEY')  # 可选的天气API密钥
         self.city = os.getenv('CITY', '上海')  # 默认城市
+        # 群配置：TENANTS_FILE 中每个群有自己的webhook、城市、推送时间和消息分段，
+        # 未配置时 WEBHOOK_URL 和 WEBHOOK_URLS（逗号分隔）中的所有群机器人组成一个默认群
+        self.tenants = self._load_tenants()
+        # 广播目标：所有群的机器人，每日消息生成一次后发送到每个群
+        self.webhook_targets = self.tenants.webhooks()
+        self.webhook_url = self.webhook_url or (self.webhook_targets[0] if self.webhook_targets else None)
         self.ark_api_key = os.getenv('ARK_API_KEY')
         self.ark_base_url = os.getenv('ARK_BASE_URL', 'https://ark.cn-beijing.volces.com/api/v3')
         self.ark_model = os.getenv('ARK_MODEL', 'deepseek-v3-250324')
@@ -42,55 +127,403 @@ class WeWorkBot:
         self.max_retries = 3
         self.retry_delay = 1  # 秒
         
+        # 上游连接池配置（按主机复用长连接，超时拆分为连接/读取）
+        # 熔断配置：连续失败达到阈值后熔断，熔断期间直接走降级逻辑
+        self.http = UpstreamClient(
+            connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', '3')),
+            read_timeout=float(os.getenv('HTTP_READ_TIMEOUT', '10')),
+            failure_threshold=int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5')),
+            recovery_timeout=float(os.getenv('CIRCUIT_RECOVERY_TIMEOUT', '30'))
+        )
+        # 高德、天行按最近耗时分布自适应超时（p99的倍数），可选开启对冲请求（超过p95再发一个相同请求）
+        adaptive_timeout = os.getenv('UPSTREAM_ADAPTIVE_TIMEOUT', 'true').lower() == 'true'
+        timeout_multiplier = float(os.getenv('UPSTREAM_TIMEOUT_MULTIPLIER', '3'))
+        self.http.configure_host('restapi.amap.com', pool_maxsize=int(os.getenv('AMAP_POOL_SIZE', '10')),
+                                 adaptive_timeout=adaptive_timeout, timeout_multiplier=timeout_multiplier,
+                                 hedge=os.getenv('AMAP_HEDGE', 'false').lower() == 'true')
+        self.http.configure_host('apis.tianapi.com', pool_maxsize=int(os.getenv('TIANAPI_POOL_SIZE', '10')),
+                                 adaptive_timeout=adaptive_timeout, timeout_multiplier=timeout_multiplier,
+                                 hedge=os.getenv('TIANAPI_HEDGE', 'false').lower() == 'true')
+        self.http.configure_host(self.ark_base_url, pool_maxsize=int(os.getenv('ARK_POOL_SIZE', '4')), read_timeout=30)
+        # ARK客户端：默认流式输出，单次调用超出时间预算时按配置保留已生成内容或放弃
+        self.ark = ArkClient(
+            self.http, self.ark_base_url, self.ark_api_key, self.ark_model,
+            stream=os.getenv('ARK_STREAM', 'true').lower() == 'true',
+            deadline=float(os.getenv('ARK_DEADLINE_SECONDS', '20')),
+            on_deadline=os.getenv('ARK_DEADLINE_POLICY', 'sentence'),
+            # 并发与速率限制：避免预览等并发请求同时打满ARK，429/5xx按 Retry-After 或退避重试
+            max_concurrency=int(os.getenv('ARK_MAX_CONCURRENCY', '4')),
+            rpm=int(os.getenv('ARK_RPM', '60')),
+            tpm=int(os.getenv('ARK_TPM', '100000')),
+            max_retries=int(os.getenv('ARK_MAX_RETRIES', '3')),
+            # 上下文缓存：固定的生成要求注册一次，之后按缓存ID引用，降低输入token和首token耗时
+            context_cache=os.getenv('ARK_CONTEXT_CACHE', 'true').lower() == 'true',
+            context_ttl=int(os.getenv('ARK_CONTEXT_TTL', '3600'))
+        )
+        # 模型路由：ARK_MODELS 按优先级列出候选模型，按各内容类型的耗时目标选择最快的健康模型，失败时切换
+        self.ark_models = [m.strip() for m in os.getenv('ARK_MODELS', self.ark_model).split(',') if m.strip()]
+        self.ark_router = ModelRouter(
+            self.ark, self.ark_models,
+            latency_targets=self._parse_latency_targets(
+                os.getenv('ARK_LATENCY_TARGETS', 'encouragement:3000,lunch:4000,combined:6000')
+            ),
+            default_target_ms=float(os.getenv('ARK_LATENCY_TARGET_MS', '5000')),
+            cooldown=float(os.getenv('ARK_MODEL_COOLDOWN', '60'))
+        )
+        webhook_workers = int(os.getenv('WEBHOOK_WORKERS', '4'))
+        for webhook_host in dict.fromkeys(urlsplit(url).netloc for url in self.webhook_targets):
+            self.http.configure_host(webhook_host, pool_maxsize=int(os.getenv('WEBHOOK_POOL_SIZE', str(webhook_workers))))
+        # webhook发送队列：WEBHOOK_WORKERS 个后台线程并发向各群发送，每个机器人独立限流（默认每分钟20条），
+        # 限流和网络异常时退避重试；
+        # 任务落盘到 WEBHOOK_OUTBOX_DIR，重启后继续发送未完成的消息
+        self.outbox = WebhookOutbox(
+            self._deliver_webhook,
+            rate_per_minute=int(os.getenv('WEBHOOK_RATE_LIMIT', '20')),
+            max_attempts=int(os.getenv('WEBHOOK_MAX_ATTEMPTS', '5')),
+            retention=int(os.getenv('WEBHOOK_JOB_RETENTION', '86400')),
+            store=self._create_outbox_store(),
+            workers=webhook_workers
+        )
+        self.outbox.start()
+        atexit.register(self.outbox.stop)
+        # 同步发送（定时推送等）等待队列送达的最长时间（秒）
+        self.webhook_send_timeout = float(os.getenv('WEBHOOK_SEND_TIMEOUT', '300'))
+        
         # 缓存配置
-        self.cache = {}
         self.cache_duration = {
             'weather': timedelta(hours=1),  # 天气缓存1小时
-            'fortune': timedelta(hours=12)  # 老黄历缓存12小时
+            'fortune': timedelta(hours=12),  # 星座运势缓存12小时
+            'almanac': timedelta(days=1),  # 老黄历按日期缓存，每天只回源一次
+            'daily_message': timedelta(days=1)  # 每日消息快照按日期缓存
+        }
+        # 过期后仍可先返回旧数据、同时后台刷新的最长时间（超出后阻塞等待回源）
+        self.cache_max_stale = {
+            'weather': timedelta(minutes=int(os.getenv('WEATHER_MAX_STALE_MINUTES', '30'))),
+            'fortune': timedelta(hours=int(os.getenv('FORTUNE_MAX_STALE_HOURS', '12')))
+        }
+        # 降级数据（回源失败时的备用内容）只缓存很短时间，并在后台按指数退避重新获取
+        self.degraded_ttl = float(os.getenv('DEGRADED_CACHE_TTL', '60'))
+        self.degraded_max_backoff = float(os.getenv('DEGRADED_MAX_BACKOFF', '900'))
+        self.degraded_max_retries = int(os.getenv('DEGRADED_MAX_RETRIES', '8'))
+        self._refetch_timers = {}  # 已安排的降级数据重新获取任务
+        self._refetch_lock = threading.Lock()
+        max_bytes = os.getenv('CACHE_MAX_BYTES')
+        self.cache = BotCache(
+            self.cache_duration,
+            max_entries=int(os.getenv('CACHE_MAX_ENTRIES', '1024')),
+            max_bytes=int(max_bytes) if max_bytes else None,
+            sweep_interval=int(os.getenv('CACHE_SWEEP_INTERVAL', '300')),
+            store=self._create_cache_store(),
+            stale_policy=self.cache_max_stale
+        )
+        self.cache.warm_from_store()
+        self.cache.start_sweeper()
+        atexit.register(self.cache.stop)
+        self.single_flight = SingleFlight()  # 同一缓存键的并发未命中只回源一次
+        self.cache_stats = CacheStats()
+        self.views = ViewMemo()  # 由标准记录派生的视图（文本播报、API视图）
+        
+        # 并发执行配置（有界线程池，供每日消息各分段并发使用）
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('BOT_WORKERS', '8')),
+            thread_name_prefix='wework-bot'
+        )
+        self.pipeline = SectionPipeline(self.executor)
+        # 星座批量获取使用独立的有界线程池，限制对天行API的并发数
+        self.constellation_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('CONSTELLATION_CONCURRENCY', '4')),
+            thread_name_prefix='constellation'
+        )
+        self._constellation_lock = threading.Lock()
+        self._prewarmed_date = None
+        self._constellation_futures = {}  # 进行中的星座获取任务
+        self.section_timeouts = {
+            'weather': 8,  # 天气分段时间预算（秒）
+            'fortune': 8,  # 运势分段时间预算（秒）
+            'encouragement': 20,  # 鼓励话语分段时间预算（秒）
+            'lunch': 20  # 午餐推荐分段时间预算（秒）
         }
+        # 随机种子：备用文案等随机选择按 (种子, 日期, 用途) 确定，多个worker生成的内容一致
+        self.rng_seed = os.getenv('DAILY_MESSAGE_SEED', '')
+        # 大模型文案内容池：后台预生成鼓励话语和午餐推荐，请求时直接取用
+        self.content_pool = ContentPool(
+            self._generate_pool_content,
+            size=int(os.getenv('CONTENT_POOL_SIZE', '5')),
+            low_water=int(os.getenv('CONTENT_POOL_LOW_WATER', '2')),
+            ttl=int(os.getenv('CONTENT_POOL_TTL_HOURS', '24')) * 3600,
+            workers=int(os.getenv('CONTENT_POOL_WORKERS', '2'))
+        )
+        atexit.register(self.content_pool.shutdown)
+        # 内容池按星期分组：日期变化后重新预热今天的分组，取用时池为空则等待补充（不超过此秒数和剩余时间预算）
+        self.content_pool_warm_wait = float(os.getenv('CONTENT_POOL_WARM_WAIT_SECONDS', '10'))
+        self._content_pool_date = None  # 最近一次预热的日期
+        # 合并生成：一次调用同时生成鼓励话语和午餐推荐（JSON输出），减少一半大模型往返
+        self.ark_combined = os.getenv('ARK_COMBINED_GENERATION', 'true').lower() == 'true'
+        self.generation_stats = GenerationStats({'combined': ('encouragement', 'lunch')})
+        if self.ark_api_key:
+            self._warm_content_pool()
+        # 每个推送时间一个定时任务，self.scheduler 为主群的定时任务
+        self.schedulers = self._create_schedulers()
+        self.scheduler = self.schedulers.get(self.tenants.primary.schedule)
         
         if not self.webhook_url:
             logger.warning("WEBHOOK_URL 未配置")
+        elif len(self.webhook_targets) > 1:
+            logger.info(f"每日消息将广播到 {len(self.webhook_targets)} 个群机器人")
         if not self.ark_api_key:
             logger.warning("ARK API Key 未配置，将使用固定文案")
     
-    def _is_cache_valid(self, cache_key):
-        """检查缓存是否有效"""
-        if cache_key not in self.cache:
-            return False
-        
-        cache_data = self.cache[cache_key]
-        cache_time = cache_data.get('timestamp')
-        cache_type = cache_data.get('type')
+    @staticmethod
+    def _parse_webhook_targets(primary, extra):
+        """合并 WEBHOOK_URL 和逗号分隔的 WEBHOOK_URLS，去重并保持配置顺序"""
+        urls = [primary] + [url.strip() for url in extra.split(',')]
+        return list(dict.fromkeys(url for url in urls if url))
+    
+    def _load_tenants(self):
+        """加载群配置（TENANTS_FILE，JSON列表），未配置或无效时使用默认群
         
-        if not cache_time or cache_type not in self.cache_duration:
-            return False
+        默认群由 WEBHOOK_URL/WEBHOOK_URLS、CITY 和 CRON_SCHEDULE 组成，包含全部消息分段
+        """
+        default_schedule = os.getenv('CRON_SCHEDULE', '0 10 * * 1-5')
+        tenants_file = os.getenv('TENANTS_FILE')
+        if tenants_file:
+            try:
+                tenants = TenantRegistry.from_file(tenants_file, self.city, default_schedule)
+                logger.info(f"已加载 {len(tenants)} 个群配置，涉及城市: {', '.join(tenants.cities()) or '无'}")
+                return tenants
+            except (OSError, ValueError, AttributeError) as e:
+                logger.error(f"群配置 {tenants_file} 无效，使用默认群: {str(e)}")
+        webhooks = self._parse_webhook_targets(self.webhook_url, os.getenv('WEBHOOK_URLS', ''))
+        return TenantRegistry([TenantProfile('default', webhooks, self.city, default_schedule)])
+    
+    @staticmethod
+    def _parse_latency_targets(text):
+        """解析 内容类型:毫秒 逗号分隔的耗时目标配置"""
+        targets = {}
+        for item in text.split(','):
+            name, _, value = item.partition(':')
+            try:
+                targets[name.strip()] = float(value)
+            except ValueError:
+                logger.warning(f"ARK耗时目标配置无效，已忽略: {item}")
+        return targets
+    
+    def _create_cache_store(self):
+        """创建本地持久化缓存层（配置 CACHE_DIR 时启用）"""
+        cache_dir = os.getenv('CACHE_DIR')
+        if not cache_dir:
+            return None
+        try:
+            store = DiskCacheStore(cache_dir)
+            logger.info(f"已启用本地持久化缓存: {store.path}")
+            return store
+        except Exception as e:
+            logger.error(f"本地持久化缓存初始化失败，仅使用内存缓存: {str(e)}")
+            return None
+    
+    def _create_outbox_store(self):
+        """创建发送任务本地存储（WEBHOOK_OUTBOX_DIR 为空时只保存在内存中）"""
+        outbox_dir = os.getenv('WEBHOOK_OUTBOX_DIR', 'data')
+        if not outbox_dir:
+            return None
+        try:
+            store = OutboxStore(outbox_dir)
+            logger.info(f"已启用发送任务本地存储: {store.path}")
+            return store
+        except Exception as e:
+            logger.error(f"发送任务本地存储初始化失败，进程退出时未发送的消息将丢失: {str(e)}")
+            return None
+    
+    def _create_schedulers(self):
+        """按推送时间创建每日推送定时任务（SCHEDULER_ENABLED=true 时启动），返回 {cron表达式: 定时任务}
         
-        return datetime.now() - cache_time < self.cache_duration[cache_type]
+        每个定时任务只发送该推送时间的群；预生成的快照包含所有群的消息，先触发的任务生成后其他任务直接使用。
+        与 CRON_SCHEDULE 相同的定时任务沿用原有的状态文件
+        """
+        default_schedule = os.getenv('CRON_SCHEDULE', '0 10 * * 1-5')
+        schedulers = {}
+        for expression, names in self.tenants.by_schedule().items():
+            try:
+                schedulers[expression] = self._create_scheduler(expression, names, default_schedule)
+            except ValueError as e:
+                logger.error(f"推送时间 {expression} 配置无效，{', '.join(names)} 的定时任务不可用: {str(e)}")
+        return schedulers
+    
+    def _create_scheduler(self, expression, names, default_schedule):
+        """创建发送指定群的定时任务"""
+        scheduler = DailyPushScheduler(
+            CronSchedule(expression),
+            prepare=lambda fire_time: self.prerender_daily_message(),
+            deliver=lambda fire_time: self.send_daily_message(tenants=names),
+            timezone=pytz.timezone('Asia/Shanghai'),
+            lead_time=int(os.getenv('SCHEDULER_PRERENDER_MINUTES', '10')) * 60,
+            catchup_window=int(os.getenv('SCHEDULER_CATCHUP_MINUTES', '120')) * 60,
+            state_dir=os.getenv('SCHEDULER_STATE_DIR', 'data'),
+            name=None if expression == default_schedule else hashlib.sha1(expression.encode('utf-8')).hexdigest()[:8]
+        )
+        if os.getenv('SCHEDULER_ENABLED', 'false').lower() == 'true':
+            scheduler.start()
+            atexit.register(scheduler.stop)
+        return scheduler
+    
+    def _today(self):
+        """获取当前日期（北京时间）"""
+        return datetime.now(pytz.timezone('Asia/Shanghai')).strftime('%Y-%m-%d')
+    
+    def _seeded_rng(self, *purpose):
+        """获取按日期和用途确定的随机数发生器，同一天同一用途的随机选择可复现"""
+        return random.Random(':'.join(str(part) for part in (self.rng_seed, self._today()) + purpose))
+    
+    def _is_cache_valid(self, cache_key):
+        """检查缓存是否有效"""
+        return self.cache.is_valid(cache_key)
     
     def _set_cache(self, cache_key, data, cache_type):
         """设置缓存"""
-        self.cache[cache_key] = {
-            'data': data,
-            'timestamp': datetime.now(),
-            'type': cache_type
-        }
+        self.cache.set(cache_key, data, cache_type)
     
     def _get_cache(self, cache_key):
         """获取缓存数据"""
-        if self._is_cache_valid(cache_key):
-            return self.cache[cache_key]['data']
-        return None
+        return self.cache.get(cache_key)
+    
+    def _get_or_fetch(self, cache_key, cache_type, fetch, family, allow_stale=False):
+        """读取缓存，未命中时回源并写入缓存"""
+        data, _ = self._lookup(cache_key, cache_type, fetch, family, allow_stale)
+        return data
+    
+    def _lookup(self, cache_key, cache_type, fetch, family, allow_stale=False):
+        """读取缓存并返回新鲜度，未命中时回源并写入缓存
+        
+        同一缓存键的并发未命中会合并为一次回源，其余调用方等待并共享结果（异常同样共享）。
+        allow_stale 为 True 时，过期但仍在陈旧容忍期（cache_max_stale）内的数据直接返回，
+        同时在后台发起一次刷新；超出容忍期后调用方阻塞等待回源。
+        family 为统计用的键族名称，如 weather、almanac。
+        
+        fetch 回源失败时可返回 Degraded 包装的备用数据，见 _store_result。
+        
+        返回 (数据, 新鲜度)，新鲜度包含 state（fresh/stale/miss/coalesced）、age_seconds
+        和 degraded（是否为降级数据）
+        """
+        cached_data, state, age, degraded = self.cache.lookup(cache_key)
+        if state == 'fresh':
+            self.cache_stats.record(family, 'hits')
+            logger.info(f"使用缓存数据: {cache_key}")
+            return cached_data, {'state': 'fresh', 'age_seconds': round(age, 1), 'degraded': degraded}
+        
+        def load():
+            # 双重检查：等待锁期间可能已有其他调用方写入缓存
+            cached = self._get_cache(cache_key)
+            if cached is not None:
+                return cached
+            return self._store_result(cache_key, cache_type, fetch(), fetch, family)
+        
+        if state == 'stale' and allow_stale:
+            self.cache_stats.record(family, 'stale')
+            self._revalidate_in_background(cache_key, load, family)
+            logger.info(f"使用陈旧缓存数据并后台刷新: {cache_key}")
+            return cached_data, {'state': 'stale', 'age_seconds': round(age, 1), 'degraded': degraded}
+        
+        try:
+            data, shared = self.single_flight.do(cache_key, load)
+        except Exception:
+            self.cache_stats.record(family, 'errors')
+            raise
+        self.cache_stats.record(family, 'coalesced' if shared else 'misses')
+        return data, {'state': 'coalesced' if shared else 'miss', 'age_seconds': 0.0,
+                      'degraded': self.cache.is_degraded(cache_key)}
+    
+    def _store_result(self, cache_key, cache_type, result, fetch, family, attempt=0):
+        """写入回源结果并返回数据
+        
+        权威数据按缓存类型的有效期写入；降级数据（Degraded）按退避时长写入短有效期缓存，
+        并安排后台重新获取。降级条目在下次重新获取完成前一直有效，期间的请求直接使用降级数据，
+        不会每个请求都去冲击故障中的上游。
+        缓存中还有陈旧容忍期内的权威数据时（后台刷新失败），保留并继续使用它，只安排重新获取。
+        """
+        if not isinstance(result, Degraded):
+            self._set_cache(cache_key, result, cache_type)
+            return result
+        
+        delay = min(self.degraded_ttl * (2 ** attempt), self.degraded_max_backoff)
+        cached_data, state, _, degraded = self.cache.lookup(cache_key)
+        if state is not None and not degraded:
+            self.cache_stats.record(family, 'degraded')
+            logger.warning(f"回源失败，继续使用陈旧缓存数据: {cache_key}")
+            self._schedule_refetch(cache_key, cache_type, fetch, family, attempt, delay)
+            return cached_data
+        
+        self.cache.set(cache_key, result.data, cache_type, ttl=delay, degraded=True)
+        self.cache_stats.record(family, 'degraded')
+        logger.warning(f"回源失败，降级数据缓存 {delay:g} 秒: {cache_key}")
+        self._schedule_refetch(cache_key, cache_type, fetch, family, attempt, delay)
+        return result.data
+    
+    def _schedule_refetch(self, cache_key, cache_type, fetch, family, attempt, delay):
+        """安排降级数据的后台重新获取，同一缓存键同时只有一个待执行任务"""
+        if attempt >= self.degraded_max_retries:
+            logger.warning(f"降级数据重新获取已达上限 {self.degraded_max_retries} 次，过期后按需回源: {cache_key}")
+            return
+        
+        def refetch():
+            with self._refetch_lock:
+                self._refetch_timers.pop(cache_key, None)
+            # 期间已有其他途径写入了权威数据
+            if self.cache.is_valid(cache_key) and not self.cache.is_degraded(cache_key):
+                return
+            
+            def load():
+                return self._store_result(cache_key, cache_type, fetch(), fetch, family, attempt + 1)
+            
+            try:
+                self.single_flight.do(cache_key, load)
+                if self.cache.is_valid(cache_key) and not self.cache.is_degraded(cache_key):
+                    logger.info(f"降级数据已恢复为权威数据: {cache_key}")
+            except Exception as e:
+                self.cache_stats.record(family, 'errors')
+                logger.error(f"重新获取降级数据失败 {cache_key}: {str(e)}")
+        
+        with self._refetch_lock:
+            if cache_key in self._refetch_timers:
+                return
+            # 在降级条目过期前发起，重新获取期间请求仍命中降级数据；
+            # 直接在定时器线程中执行，每日消息快照的重新生成会把分段提交到 self.executor，不能占用其工作线程
+            timer = threading.Timer(delay * 0.8, refetch)
+            timer.daemon = True
+            self._refetch_timers[cache_key] = timer
+        timer.start()
+    
+    def _revalidate_in_background(self, cache_key, load, family):
+        """后台刷新缓存，同一缓存键同时只有一个刷新任务"""
+        if self.single_flight.in_flight(cache_key):
+            return
+        
+        def refresh():
+            try:
+                self.single_flight.do(cache_key, load)
+            except Exception as e:
+                self.cache_stats.record(family, 'errors')
+                logger.error(f"后台刷新缓存失败 {cache_key}: {str(e)}")
+        
+        self.executor.submit(refresh)
     
     def _retry_request(self, func, *args, **kwargs):
-        """带重试机制的请求方法"""
+        """带重试机制的请求方法
+        
+        在API请求中调用时，重试等待超出剩余时间预算则不再重试
+        """
         last_exception = None
         
         for attempt in range(self.max_retries):
             try:
                 return func(*args, **kwargs)
+            except DeadlineExceeded:
+                raise
             except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
                 last_exception = e
+                remaining = remaining_budget()
+                if remaining is not None and remaining <= self.retry_delay * (attempt + 1):
+                    logger.warning(f"请求失败，剩余时间预算不足，不再重试: {e}")
+                    break
                 if attempt < self.max_retries - 1:
                     logger.warning(f"请求失败，第{attempt + 1}次重试: {e}")
                     time.sleep(self.retry_delay * (attempt + 1))  # 指数退避
@@ -103,66 +536,27 @@ class WeWorkBot:
         # 如果所有重试都失败，抛出最后一个异常
         raise last_exception
     
-    def call_ark_api(self, prompt, max_tokens=200, temperature=0.9, top_p=0.95):
-        """调用 Volces Engine ARK API"""
-        if not self.ark_api_key or not self.ark_base_url:
-            return None
-            
-        try:
-            headers = {
-                'Authorization': f'Bearer {self.ark_api_key}',
-                'Content-Type': 'application/json'
-            }
-            
-            data = {
-                'model': self.ark_model,
-                'messages': [
-                    {
-                        'role': 'user',
-                        'content': prompt
-                    }
-                ],
-                'max_tokens': max_tokens,
-                'temperature': temperature,
-                'top_p': top_p
-            }
-            
-            response = requests.post(
-                f'{self.ark_base_url}/chat/completions',
-                headers=headers,
-                json=data,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if 'choices' in result and len(result['choices']) > 0:
-                    return result['choices'][0]['message']['content'].strip()
-            else:
-                logger.error(f"ARK API 调用失败: {response.status_code} - {response.text}")
-                
-        except Exception as e:
-            logger.error(f"ARK API 调用异常: {str(e)}")
-            
-        return None
-    
-    def get_weather_info(self):
-        """获取天气信息（带缓存）"""
-        cache_key = f"weather_{self.city}"
+    def get_weather_info(self, city=None, with_freshness=False):
+        """获取天气信息（带缓存，过期后先返回旧数据并后台刷新）
         
-        # 检查缓存
-        cached_weather = self._get_cache(cache_key)
-        if cached_weather:
-            logger.info("使用缓存的天气数据")
-            return cached_weather
+        city 默认为配置的城市；with_freshness 为 True 时返回 (天气信息, 新鲜度)
+        """
+        city = city or self.city
+        cache_key = f"weather_{city}"
+        weather_info, freshness = self._lookup(cache_key, 'weather', lambda: self._fetch_weather_info(city),
+                                               family='weather', allow_stale=True)
+        return (weather_info, freshness) if with_freshness else weather_info
+    
+    def _fetch_weather_info(self, city):
+        """回源获取天气信息
         
+        上游获取失败时返回 Degraded 包装的备用数据，以短有效期缓存
+        """
         try:
             # 优先使用高德天气API
             if self.weather_api_key:
-                weather_data = self.get_amap_weather()
+                weather_data = self.get_amap_weather(city)
                 if weather_data:
-                    # 缓存天气数据
-                    self._set_cache(cache_key, weather_data, 'weather')
                     return weather_data
             
             # 降级到模拟数据
@@ -174,27 +568,23 @@ class WeWorkBot:
                 {'condition': '大风', 'temp': '15°C', 'desc': '风起云涌'}
             ]
             
-            weather = random.choice(weather_conditions)
-            weather_data = f"今日{self.city}天气：{weather['condition']} {weather['temp']}，{weather['desc']}"
-            
-            # 缓存模拟数据
-            self._set_cache(cache_key, weather_data, 'weather')
-            return weather_data
+            weather = self._seeded_rng('weather', city).choice(weather_conditions)
+            weather_data = f"今日{city}天气：{weather['condition']} {weather['temp']}，{weather['desc']}"
+            # 已配置天气API但获取失败时，模拟数据只是临时降级
+            return Degraded(weather_data) if self.weather_api_key else weather_data
             
         except Exception as e:
             logger.error(f"获取天气信息失败: {str(e)}")
-            fallback_data = "今日天气：阳光明媚，适合上班摸鱼 ☀️"
-            self._set_cache(cache_key, fallback_data, 'weather')
-            return fallback_data
+            return Degraded("今日天气：阳光明媚，适合上班摸鱼 ☀️")
     
-    def get_amap_weather(self):
+    def get_amap_weather(self, city=None):
         """使用高德API获取天气信息（包含当前温度、最高最低温度）"""
         try:
             # 先获取实况天气（当前温度）
-            current_weather = self.get_amap_current_weather()
+            current_weather = self.get_amap_current_weather(city)
             
             # 再获取预报天气（最高最低温度）
-            forecast_weather = self.get_amap_forecast_weather()
+            forecast_weather = self.get_amap_forecast_weather(city)
             
             if current_weather and forecast_weather:
                 return f"{current_weather}，{forecast_weather}"
@@ -209,24 +599,25 @@ class WeWorkBot:
             logger.error(f"获取高德天气数据失败: {str(e)}")
             return None
     
-    def get_amap_current_weather(self):
+    def get_amap_current_weather(self, city=None):
         """获取高德实况天气"""
+        city = city or self.city
         try:
             url = "https://restapi.amap.com/v3/weather/weatherInfo"
             params = {
                 'key': self.weather_api_key,
-                'city': self.city,
+                'city': city,
                 'extensions': 'base'  # 实况天气
             }
             
-            response = self._retry_request(requests.get, url, params=params, timeout=10)
+            response = self._retry_request(self.http.get, url, params=params)
             response.raise_for_status()
             
             data = response.json()
             
             if data.get('status') == '1' and data.get('lives'):
                 live_data = data['lives'][0]
-                city_name = live_data.get('city', self.city)
+                city_name = live_data.get('city', city)
                 weather = live_data.get('weather', '未知')
                 temperature = live_data.get('temperature', '未知')
                 winddirection = live_data.get('winddirection', '')
@@ -265,17 +656,18 @@ class WeWorkBot:
             logger.error(f"解析高德天气数据失败: {str(e)}")
             return None
     
-    def get_amap_forecast_weather(self):
+    def get_amap_forecast_weather(self, city=None):
         """获取高德预报天气（最高最低温度）"""
+        city = city or self.city
         try:
             url = "https://restapi.amap.com/v3/weather/weatherInfo"
             params = {
                 'key': self.weather_api_key,
-                'city': self.city,
+                'city': city,
                 'extensions': 'all'  # 预报天气
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self.http.get(url, params=params)
             response.raise_for_status()
             
             data = response.json()
@@ -310,17 +702,50 @@ class WeWorkBot:
             logger.error(f"解析高德预报天气数据失败: {str(e)}")
             return None
     
-    def get_today_fortune_structured(self):
-        """获取今日运势（老黄历）结构化数据"""
+    def get_almanac_record(self, with_freshness=False):
+        """获取今日老黄历标准记录（带缓存，过期后先返回旧数据并后台刷新）
+        
+        每个日期只回源一次，文本播报和各API视图均由该记录派生
+        """
         today = datetime.now().strftime('%Y-%m-%d')
-        cache_key = f"fortune_structured_{today}"
+        cache_key = f"almanac_{today}"
+        record, freshness = self._lookup(cache_key, 'almanac', self._fetch_almanac_record,
+                                         family='almanac', allow_stale=True)
+        return (record, freshness) if with_freshness else record
+    
+    def get_almanac_view(self, view, with_freshness=False):
+        """获取今日老黄历的派生视图（按日期记忆化）
         
-        # 检查缓存
-        cached_fortune = self._get_cache(cache_key)
-        if cached_fortune:
-            logger.info("使用缓存的结构化运势数据")
-            return cached_fortune
+        view 可选：structured、text、almanac、simple
+        with_freshness 为 True 时返回 (视图, 新鲜度)
+        """
+        renderers = {
+            'structured': lambda record: record,
+            'text': self._render_almanac_text,
+            'almanac': self._render_almanac_detail,
+            'simple': self._render_almanac_simple
+        }
+        if view not in renderers:
+            raise ValueError(f"不支持的老黄历视图: {view}")
         
+        record, freshness = self.get_almanac_record(with_freshness=True)
+        today = datetime.now().strftime('%Y-%m-%d')
+        rendered = self.views.get(('almanac', view, today), record, renderers[view])
+        return (rendered, freshness) if with_freshness else rendered
+    
+    def get_today_fortune_structured(self):
+        """获取今日运势（老黄历）结构化数据"""
+        return self.get_almanac_view('structured')
+    
+    def get_today_fortune(self):
+        """获取今日运势（老黄历）带缓存"""
+        return self.get_almanac_view('text')
+    
+    def _fetch_almanac_record(self):
+        """回源获取老黄历记录（每天只调用一次天行老黄历API）
+        
+        上游获取失败时返回 Degraded 包装的备用数据，以短有效期缓存
+        """
         try:
             # 天行数据老黄历API
             api_url = "https://apis.tianapi.com/lunar/index"
@@ -329,12 +754,10 @@ class WeWorkBot:
             # 必须有API密钥才能调用
             if not tianapi_key:
                 logger.warning("TIANAPI_KEY未配置，使用备用运势")
-                fortune_data = self._get_fallback_fortune_structured()
-                self._set_cache(cache_key, fortune_data, 'fortune')
-                return fortune_data
+                return self._get_fallback_fortune_structured()
             
             params = {'key': tianapi_key}
-            response = self._retry_request(requests.get, api_url, params=params, timeout=10)
+            response = self._retry_request(self.http.get, api_url, params=params)
             
             if response.status_code == 200:
                 data = response.json()
@@ -343,15 +766,11 @@ class WeWorkBot:
                 if data.get('code') != 200:
                     error_msg = data.get('msg', '未知错误')
                     logger.error(f"天行API错误 (code: {data.get('code')}): {error_msg}")
-                    fortune_data = self._get_fallback_fortune_structured()
-                    self._set_cache(cache_key, fortune_data, 'fortune')
-                    return fortune_data
+                    return Degraded(self._get_fallback_fortune_structured())
                 
                 if 'result' not in data:
                     logger.error("天行API返回数据格式错误：缺少result字段")
-                    fortune_data = self._get_fallback_fortune_structured()
-                    self._set_cache(cache_key, fortune_data, 'fortune')
-                    return fortune_data
+                    return Degraded(self._get_fallback_fortune_structured())
                 
                 result = data['result']
                 
@@ -393,153 +812,66 @@ class WeWorkBot:
                 
                 logger.info("成功获取今日结构化运势信息")
                 
-                # 缓存运势数据
-                self._set_cache(cache_key, fortune_data, 'fortune')
                 return fortune_data
                 
             else:
                 logger.error(f"老黄历API请求失败: HTTP {response.status_code}")
-                fortune_data = self._get_fallback_fortune_structured()
-                self._set_cache(cache_key, fortune_data, 'fortune')
-                return fortune_data
+                return Degraded(self._get_fallback_fortune_structured())
                 
         except requests.exceptions.Timeout:
             logger.error("老黄历API请求超时")
-            fortune_data = self._get_fallback_fortune_structured()
-            self._set_cache(cache_key, fortune_data, 'fortune')
-            return fortune_data
+            return Degraded(self._get_fallback_fortune_structured())
         except requests.exceptions.RequestException as e:
             logger.error(f"老黄历API网络请求失败: {str(e)}")
-            fortune_data = self._get_fallback_fortune_structured()
-            self._set_cache(cache_key, fortune_data, 'fortune')
-            return fortune_data
+            return Degraded(self._get_fallback_fortune_structured())
         except Exception as e:
             logger.error(f"获取今日运势失败: {str(e)}")
-            fortune_data = self._get_fallback_fortune_structured()
-            self._set_cache(cache_key, fortune_data, 'fortune')
-            return fortune_data
+            return Degraded(self._get_fallback_fortune_structured())
 
-    def get_today_fortune(self):
-        """获取今日运势（老黄历）带缓存"""
-        today = datetime.now().strftime('%Y-%m-%d')
-        cache_key = f"fortune_{today}"
+    def _render_almanac_text(self, record):
+        """将老黄历记录渲染为播报文本（只显示农历日期和宜忌）"""
+        date_info = record.get('date_info', {})
+        fortune_info = record.get('fortune_info', {})
         
-        # 检查缓存
-        cached_fortune = self._get_cache(cache_key)
-        if cached_fortune:
-            logger.info("使用缓存的运势数据")
-            return cached_fortune
+        fortune_lines = []
         
-        try:
-            # 天行数据老黄历API
-            api_url = "https://apis.tianapi.com/lunar/index"
-            tianapi_key = os.getenv('TIANAPI_KEY')
-            
-            # 必须有API密钥才能调用
-            if not tianapi_key:
-                logger.warning("TIANAPI_KEY未配置，使用备用运势")
-                fortune_data = self._get_fallback_fortune()
-                self._set_cache(cache_key, fortune_data, 'fortune')
-                return fortune_data
-            
-            params = {'key': tianapi_key}
-            response = self._retry_request(requests.get, api_url, params=params, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                # 检查API返回的错误码
-                if data.get('code') != 200:
-                    error_msg = data.get('msg', '未知错误')
-                    logger.error(f"天行API错误 (code: {data.get('code')}): {error_msg}")
-                    fortune_data = self._get_fallback_fortune()
-                    self._set_cache(cache_key, fortune_data, 'fortune')
-                    return fortune_data
-                
-                if 'result' not in data:
-                    logger.error("天行API返回数据格式错误：缺少result字段")
-                    fortune_data = self._get_fallback_fortune()
-                    self._set_cache(cache_key, fortune_data, 'fortune')
-                    return fortune_data
-                
-                result = data['result']
-                
-                # 提取所有老黄历信息
-                gregorian_date = result.get('gregoriandate', '')
-                lunar_date = result.get('lunardate', '')
-                lunar_day = result.get('lunarday', '')
-                lunar_festival = result.get('lunar_festival', '')
-                festival = result.get('festival', '')
-                fitness = result.get('fitness', '无特别宜事')
-                taboo = result.get('taboo', '无特别忌事')
-                shenwei = result.get('shenwei', '')
-                taishen = result.get('taishen', '')
-                chongsha = result.get('chongsha', '')
-                suisha = result.get('suisha', '')
-                wuxingjiazi = result.get('wuxingjiazi', '')
-                wuxingnayear = result.get('wuxingnayear', '')
-                wuxingnamonth = result.get('wuxingnamonth', '')
-                xingsu = result.get('xingsu', '')
-                pengzu = result.get('pengzu', '')
-                jianshen = result.get('jianshen', '')
-                tiangandizhiyear = result.get('tiangandizhiyear', '')
-                tiangandizhimonth = result.get('tiangandizhimonth', '')
-                tiangandizhiday = result.get('tiangandizhiday', '')
-                lmonthname = result.get('lmonthname', '')
-                shengxiao = result.get('shengxiao', '')
-                lubarmonth = result.get('lubarmonth', '')
-                jieqi = result.get('jieqi', '')
-                
-                # 格式化运势信息（只显示农历日期和宜忌）
-                fortune_lines = []
-                
-                # 处理农历日期格式，转换为传统格式
-                if lunar_date and lunar_day:
-                    # 将YYYY-MM-DD格式转换为传统农历格式
-                    lunar_formatted = self._format_lunar_date(lunar_date, lunar_day)
-                    fortune_lines.append(f"🌝 农历：{lunar_formatted}")
-                else:
-                    fortune_lines.append("🌝 农历：信息获取中...")
-                
-                fortune_lines.append(f"✅ 宜：{fitness}")
-                fortune_lines.append(f"❌ 忌：{taboo}")
-                
-                # 简化冲煞信息，用大白话表述
-                if chongsha:
-                    simplified_chongsha = self._simplify_chongsha(chongsha)
-                    if simplified_chongsha:
-                        fortune_lines.append(f"⚡ 今日提醒：{simplified_chongsha}")
-                
-                # 彭祖百忌太晦涩，直接省略不显示
-                
-                fortune_text = "\n".join(fortune_lines)
-                logger.info("成功获取今日运势信息")
-                
-                # 缓存运势数据
-                self._set_cache(cache_key, fortune_text, 'fortune')
-                return fortune_text
-                
-            else:
-                logger.error(f"老黄历API请求失败: HTTP {response.status_code}")
-                fortune_data = self._get_fallback_fortune()
-                self._set_cache(cache_key, fortune_data, 'fortune')
-                return fortune_data
-                
-        except requests.exceptions.Timeout:
-            logger.error("老黄历API请求超时")
-            fortune_data = self._get_fallback_fortune()
-            self._set_cache(cache_key, fortune_data, 'fortune')
-            return fortune_data
-        except requests.exceptions.RequestException as e:
-            logger.error(f"老黄历API网络请求失败: {str(e)}")
-            fortune_data = self._get_fallback_fortune()
-            self._set_cache(cache_key, fortune_data, 'fortune')
-            return fortune_data
-        except Exception as e:
-            logger.error(f"获取今日运势失败: {str(e)}")
-            fortune_data = self._get_fallback_fortune()
-            self._set_cache(cache_key, fortune_data, 'fortune')
-            return fortune_data
+        # 处理农历日期格式，转换为传统格式
+        if date_info.get('lunar_date') and date_info.get('lunar_day'):
+            fortune_lines.append(f"🌝 农历：{date_info.get('lunar_formatted')}")
+        else:
+            fortune_lines.append("🌝 农历：信息获取中...")
+        
+        fortune_lines.append(f"✅ 宜：{fortune_info.get('fitness', '无特别宜事')}")
+        fortune_lines.append(f"❌ 忌：{fortune_info.get('taboo', '无特别忌事')}")
+        
+        # 简化冲煞信息，用大白话表述
+        chongsha = fortune_info.get('chongsha')
+        if chongsha:
+            simplified_chongsha = self._simplify_chongsha(chongsha)
+            if simplified_chongsha:
+                fortune_lines.append(f"⚡ 今日提醒：{simplified_chongsha}")
+        
+        # 彭祖百忌太晦涩，直接省略不显示
+        
+        return "\n".join(fortune_lines)
+    
+    def _render_almanac_detail(self, record):
+        """详细黄历视图（包含宜忌、冲煞等）"""
+        return {
+            'date_info': record.get('date_info', {}),
+            'fortune_info': record.get('fortune_info', {}),
+            'wuxing_info': record.get('wuxing_info', {}),
+            'festival_info': record.get('festival_info', {})
+        }
+    
+    def _render_almanac_simple(self, record):
+        """简化黄历视图（仅宜忌）"""
+        return {
+            'lunar_date': record.get('date_info', {}).get('lunar_formatted', ''),
+            'fitness': record.get('fortune_info', {}).get('fitness', ''),
+            'taboo': record.get('fortune_info', {}).get('taboo', ''),
+            'festival': record.get('festival_info', {}).get('festival', '')
+        }
     
     def _format_lunar_date(self, lunar_date, lunar_day):
         """格式化农历日期为传统格式"""
@@ -608,6 +940,7 @@ class WeWorkBot:
     def _get_fallback_fortune_structured(self):
         """获取备用结构化运势信息"""
         today = datetime.now().strftime('%Y-%m-%d')
+        rng = self._seeded_rng('fortune')
         fallback_data = {
             'date_info': {
                 'gregorian_date': today,
@@ -626,8 +959,8 @@ class WeWorkBot:
                 'jieqi': ''
             },
             'fortune_info': {
-                'fitness': random.choice(['摸鱼、划水、发呆', '午休、喝茶、聊天', '保持低调、适度摸鱼', '网上冲浪、刷手机', '装忙、假装思考']),
-                'taboo': random.choice(['加班、开会、写报告', '认真工作、主动汇报', '表现积极、承担责任', '提升自己、努力奋斗', '真的很忙、真的在想']),
+                'fitness': rng.choice(['摸鱼、划水、发呆', '午休、喝茶、聊天', '保持低调、适度摸鱼', '网上冲浪、刷手机', '装忙、假装思考']),
+                'taboo': rng.choice(['加班、开会、写报告', '认真工作、主动汇报', '表现积极、承担责任', '提升自己、努力奋斗', '真的很忙、真的在想']),
                 'shenwei': '',
                 'taishen': '',
                 'chongsha': '',
@@ -644,8 +977,9 @@ class WeWorkBot:
         }
         return fallback_data
 
-    def _get_fallback_fortune(self):
+    def _get_fallback_fortune(self, rng=None):
         """获取备用运势信息"""
+        rng = rng or random
         fallback_fortunes = [
             "📅 农历信息获取中...\n✅ 宜：摸鱼、划水、发呆\n❌ 忌：加班、开会、写报告",
             "📅 今日黄历\n✅ 宜：午休、喝茶、聊天\n❌ 忌：认真工作、主动汇报",
@@ -653,19 +987,93 @@ class WeWorkBot:
             "📅 运势播报\n✅ 宜：网上冲浪、刷手机\n❌ 忌：提升自己、努力奋斗",
             "📅 今日宜忌\n✅ 宜：装忙、假装思考\n❌ 忌：真的很忙、真的在想"
         ]
-        return random.choice(fallback_fortunes)
+        return rng.choice(fallback_fortunes)
+    
+    def get_constellation_record(self, sign):
+        """获取星座今日标准记录（带缓存）
+        
+        sign 支持中英文名称，统一为标准星座ID作为缓存键，
+        每个星座每天只回源一次，文本和结构化输出均由该记录派生
+        """
+        sign_id = normalize_sign_id(sign)
+        if not sign_id:
+            raise ValueError(f"不支持的星座: {sign}")
+        today = datetime.now().strftime('%Y-%m-%d')
+        cache_key = f"constellation_{sign_id}_{today}"
+        return self._get_or_fetch(cache_key, 'fortune', lambda: self._fetch_constellation_record(sign_id, today), family='constellation')
     
     def get_constellation_fortune_structured(self, sign):
         """获取星座运势结构化数据（带缓存）"""
+        return self.get_constellation_record(sign)
+    
+    def get_constellation_fortune(self, sign):
+        """获取星座运势（带缓存）"""
+        record = self.get_constellation_record(sign)
+        return self.views.get(('constellation', 'text', record['sign_id'], record['date']), record, self._render_constellation_text)
+    
+    def fetch_constellations(self, signs, timeout=None):
+        """并发获取多个星座记录
+        
+        并发数受星座线程池限制，同一星座的进行中请求会被合并复用。
+        超过 timeout 秒仍未完成的星座先返回为未完成，后台继续获取并写入缓存。
+        返回 (结果 {星座ID: 记录}, 错误 {星座ID: 错误信息}, 未完成星座ID列表)
+        """
+        sign_ids = list(dict.fromkeys(normalize_sign_id(sign) or sign for sign in signs))
+        futures = {sign_id: self._submit_constellation(sign_id) for sign_id in sign_ids}
+        wait(list(futures.values()), timeout=bound_timeout(timeout))
+        
+        results, errors, pending = {}, {}, []
+        for sign_id, future in futures.items():
+            if not future.done():
+                pending.append(sign_id)
+            elif future.exception() is not None:
+                errors[sign_id] = str(future.exception())
+            else:
+                results[sign_id] = future.result()
+        
+        if pending:
+            logger.warning(f"批量获取星座超时，{len(pending)} 个星座转为后台获取: {pending}")
+        return results, errors, pending
+    
+    def prewarm_constellations(self):
+        """后台预热当天全部星座记录，每天只触发一次
+        
+        返回是否触发了新的预热
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        with self._constellation_lock:
+            if self._prewarmed_date == today:
+                return False
+            self._prewarmed_date = today
+        
+        logger.info(f"开始后台预热 {today} 全部星座运势")
+        for sign_id in SIGN_IDS:
+            self._submit_constellation(sign_id)
+        return True
+    
+    def _submit_constellation(self, sign_id):
+        """提交星座获取任务，已缓存时直接返回结果，同一星座进行中的任务直接复用"""
+        future = Future()
         today = datetime.now().strftime('%Y-%m-%d')
-        cache_key = f"constellation_structured_{sign}_{today}"
+        cached = self._get_cache(f"constellation_{sign_id}_{today}")
+        if cached is not None:
+            future.set_result(cached)
+            return future
         
-        # 检查缓存
-        cached_constellation = self._get_cache(cache_key)
-        if cached_constellation:
-            logger.info(f"使用缓存的{sign}星座结构化运势数据")
-            return cached_constellation
+        key = (sign_id, today)
+        with self._constellation_lock:
+            future = self._constellation_futures.get(key)
+            if future is None:
+                future = self.constellation_executor.submit(self.get_constellation_record, sign_id)
+                self._constellation_futures[key] = future
+                future.add_done_callback(lambda _: self._constellation_futures.pop(key, None))
+        return future
+    
+    def _fetch_constellation_record(self, sign_id, today):
+        """回源获取星座每日记录（每个星座每天只调用一次天行星座API）
         
+        上游获取失败时返回 Degraded 包装的备用数据，以短有效期缓存
+        """
         try:
             # 天行数据星座运势API
             api_url = "https://apis.tianapi.com/star/index"
@@ -674,34 +1082,16 @@ class WeWorkBot:
             # 必须有API密钥才能调用
             if not tianapi_key:
                 logger.warning("TIANAPI_KEY未配置，使用备用星座运势")
-                constellation_data = self._get_fallback_constellation_structured(sign)
-                self._set_cache(cache_key, constellation_data, 'fortune')
-                return constellation_data
+                return self._get_fallback_constellation_structured(sign_id, today)
             
-            # 星座名称映射
-            constellation_map = {
-                'aries': '白羊座',
-                'taurus': '金牛座', 
-                'gemini': '双子座',
-                'cancer': '巨蟹座',
-                'leo': '狮子座',
-                'virgo': '处女座',
-                'libra': '天秤座',
-                'scorpio': '天蝎座',
-                'sagittarius': '射手座',
-                'capricorn': '摩羯座',
-                'aquarius': '水瓶座',
-                'pisces': '双鱼座'
-            }
-            
-            chinese_sign = constellation_map.get(sign, sign)
+            chinese_sign = sign_name(sign_id)
             
             params = {
                 'key': tianapi_key,
-                'astro': sign  # 使用英文星座名称
+                'astro': sign_id  # 使用英文星座名称
             }
             
-            response = self._retry_request(requests.get, api_url, params=params, timeout=10)
+            response = self._retry_request(self.http.get, api_url, params=params)
             
             if response.status_code == 200:
                 data = response.json()
@@ -710,15 +1100,11 @@ class WeWorkBot:
                 if data.get('code') != 200:
                     error_msg = data.get('msg', '未知错误')
                     logger.error(f"天行星座API错误 (code: {data.get('code')}): {error_msg}")
-                    constellation_data = self._get_fallback_constellation_structured(sign)
-                    self._set_cache(cache_key, constellation_data, 'fortune')
-                    return constellation_data
+                    return Degraded(self._get_fallback_constellation_structured(sign_id, today))
                 
                 if 'result' not in data or 'list' not in data['result']:
                     logger.error("天行星座API返回数据格式错误：缺少result.list字段")
-                    constellation_data = self._get_fallback_constellation_structured(sign)
-                    self._set_cache(cache_key, constellation_data, 'fortune')
-                    return constellation_data
+                    return Degraded(self._get_fallback_constellation_structured(sign_id, today))
                 
                 result_list = data['result']['list']
                 
@@ -753,6 +1139,7 @@ class WeWorkBot:
                 
                 # 构建结构化数据
                 constellation_data = {
+                    'sign_id': sign_id,
                     'sign': chinese_sign,
                     'date': today,
                     'summary': constellation_info.get('summary', ''),
@@ -774,184 +1161,55 @@ class WeWorkBot:
                 
                 logger.info(f"成功获取{chinese_sign}结构化运势信息")
                 
-                # 缓存星座运势数据
-                self._set_cache(cache_key, constellation_data, 'fortune')
                 return constellation_data
                 
             else:
                 logger.error(f"星座运势API请求失败: HTTP {response.status_code}")
-                constellation_data = self._get_fallback_constellation_structured(sign)
-                self._set_cache(cache_key, constellation_data, 'fortune')
-                return constellation_data
+                return Degraded(self._get_fallback_constellation_structured(sign_id, today))
                 
         except requests.exceptions.Timeout:
             logger.error("星座运势API请求超时")
-            constellation_data = self._get_fallback_constellation_structured(sign)
-            self._set_cache(cache_key, constellation_data, 'fortune')
-            return constellation_data
+            return Degraded(self._get_fallback_constellation_structured(sign_id, today))
         except requests.exceptions.RequestException as e:
             logger.error(f"星座运势API网络请求失败: {str(e)}")
-            constellation_data = self._get_fallback_constellation_structured(sign)
-            self._set_cache(cache_key, constellation_data, 'fortune')
-            return constellation_data
+            return Degraded(self._get_fallback_constellation_structured(sign_id, today))
         except Exception as e:
             logger.error(f"获取星座运势失败: {str(e)}")
-            constellation_data = self._get_fallback_constellation_structured(sign)
-            self._set_cache(cache_key, constellation_data, 'fortune')
-            return constellation_data
+            return Degraded(self._get_fallback_constellation_structured(sign_id, today))
 
-    def get_constellation_fortune(self, sign):
-        """获取星座运势（带缓存）"""
-        today = datetime.now().strftime('%Y-%m-%d')
-        cache_key = f"constellation_{sign}_{today}"
+    def _render_constellation_text(self, record):
+        """将星座记录渲染为播报文本"""
+        indices = record.get('indices', {})
+        lucky_info = record.get('lucky_info', {})
         
-        # 检查缓存
-        cached_constellation = self._get_cache(cache_key)
-        if cached_constellation:
-            logger.info(f"使用缓存的{sign}星座运势数据")
-            return cached_constellation
+        fortune_lines = []
+        fortune_lines.append(f"⭐ {record.get('sign')}今日运势")
+        fortune_lines.append(f"📅 日期：{record.get('date')}")
         
-        try:
-            # 天行数据星座运势API
-            api_url = "https://apis.tianapi.com/star/index"
-            tianapi_key = os.getenv('TIANAPI_KEY')
-            
-            # 必须有API密钥才能调用
-            if not tianapi_key:
-                logger.warning("TIANAPI_KEY未配置，使用备用星座运势")
-                constellation_data = self._get_fallback_constellation(sign)
-                self._set_cache(cache_key, constellation_data, 'fortune')
-                return constellation_data
-            
-            # 星座名称映射
-            constellation_map = {
-                'aries': '白羊座',
-                'taurus': '金牛座', 
-                'gemini': '双子座',
-                'cancer': '巨蟹座',
-                'leo': '狮子座',
-                'virgo': '处女座',
-                'libra': '天秤座',
-                'scorpio': '天蝎座',
-                'sagittarius': '射手座',
-                'capricorn': '摩羯座',
-                'aquarius': '水瓶座',
-                'pisces': '双鱼座'
-            }
-            
-            chinese_sign = constellation_map.get(sign, sign)
-            
-            params = {
-                'key': tianapi_key,
-                'astro': sign  # 使用英文星座名称
-            }
-            
-            response = self._retry_request(requests.get, api_url, params=params, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                # 检查API返回的错误码
-                if data.get('code') != 200:
-                    error_msg = data.get('msg', '未知错误')
-                    logger.error(f"天行星座API错误 (code: {data.get('code')}): {error_msg}")
-                    constellation_data = self._get_fallback_constellation(sign)
-                    self._set_cache(cache_key, constellation_data, 'fortune')
-                    return constellation_data
-                
-                if 'result' not in data or 'list' not in data['result']:
-                    logger.error("天行星座API返回数据格式错误：缺少result.list字段")
-                    constellation_data = self._get_fallback_constellation(sign)
-                    self._set_cache(cache_key, constellation_data, 'fortune')
-                    return constellation_data
-                
-                result_list = data['result']['list']
-                
-                # 解析星座运势信息
-                constellation_info = {}
-                for item in result_list:
-                    item_type = item.get('type', '')
-                    content = item.get('content', '')
-                    
-                    if item_type == '综合指数':
-                        constellation_info['comprehensive'] = content
-                    elif item_type == '爱情指数':
-                        constellation_info['love_index'] = content
-                    elif item_type == '工作指数':
-                        constellation_info['work_index'] = content
-                    elif item_type == '财运指数':
-                        constellation_info['money_index'] = content
-                    elif item_type == '健康指数':
-                        constellation_info['health_index'] = content
-                    elif item_type == '幸运颜色':
-                        constellation_info['lucky_color'] = content
-                    elif item_type == '幸运数字':
-                        constellation_info['lucky_number'] = content
-                    elif item_type == '贵人星座':
-                        constellation_info['noble_sign'] = content
-                    elif item_type == '今日概述':
-                        constellation_info['summary'] = content
-                
-                # 格式化星座运势信息
-                fortune_lines = []
-                fortune_lines.append(f"⭐ {chinese_sign}今日运势")
-                fortune_lines.append(f"📅 日期：{today}")
-                
-                if constellation_info.get('summary'):
-                    fortune_lines.append(f"📝 今日概述：{constellation_info['summary']}")
-                
-                if constellation_info.get('comprehensive'):
-                    fortune_lines.append(f"🌟 综合指数：{constellation_info['comprehensive']}")
-                
-                if constellation_info.get('love_index'):
-                    fortune_lines.append(f"💕 爱情指数：{constellation_info['love_index']}")
-                
-                if constellation_info.get('work_index'):
-                    fortune_lines.append(f"💼 工作指数：{constellation_info['work_index']}")
-                
-                if constellation_info.get('money_index'):
-                    fortune_lines.append(f"💰 财运指数：{constellation_info['money_index']}")
-                
-                if constellation_info.get('health_index'):
-                    fortune_lines.append(f"🏥 健康指数：{constellation_info['health_index']}")
-                
-                if constellation_info.get('lucky_color'):
-                    fortune_lines.append(f"🎨 幸运颜色：{constellation_info['lucky_color']}")
-                
-                if constellation_info.get('lucky_number'):
-                    fortune_lines.append(f"🔢 幸运数字：{constellation_info['lucky_number']}")
-                
-                if constellation_info.get('noble_sign'):
-                    fortune_lines.append(f"🤝 贵人星座：{constellation_info['noble_sign']}")
-                
-                constellation_text = "\n".join(fortune_lines)
-                logger.info(f"成功获取{chinese_sign}运势信息")
-                
-                # 缓存星座运势数据
-                self._set_cache(cache_key, constellation_text, 'fortune')
-                return constellation_text
-                
-            else:
-                logger.error(f"星座运势API请求失败: HTTP {response.status_code}")
-                constellation_data = self._get_fallback_constellation(sign)
-                self._set_cache(cache_key, constellation_data, 'fortune')
-                return constellation_data
-                
-        except requests.exceptions.Timeout:
-            logger.error("星座运势API请求超时")
-            constellation_data = self._get_fallback_constellation(sign)
-            self._set_cache(cache_key, constellation_data, 'fortune')
-            return constellation_data
-        except requests.exceptions.RequestException as e:
-            logger.error(f"星座运势API网络请求失败: {str(e)}")
-            constellation_data = self._get_fallback_constellation(sign)
-            self._set_cache(cache_key, constellation_data, 'fortune')
-            return constellation_data
-        except Exception as e:
-            logger.error(f"获取星座运势失败: {str(e)}")
-            constellation_data = self._get_fallback_constellation(sign)
-            self._set_cache(cache_key, constellation_data, 'fortune')
-            return constellation_data
+        if record.get('summary'):
+            fortune_lines.append(f"📝 今日概述：{record['summary']}")
+        
+        index_labels = [
+            ('comprehensive', '🌟 综合指数'),
+            ('love', '💕 爱情指数'),
+            ('work', '💼 工作指数'),
+            ('money', '💰 财运指数'),
+            ('health', '🏥 健康指数')
+        ]
+        for key, label in index_labels:
+            if indices.get(key):
+                fortune_lines.append(f"{label}：{indices[key]}%")
+        
+        if lucky_info.get('color'):
+            fortune_lines.append(f"🎨 幸运颜色：{lucky_info['color']}")
+        
+        if lucky_info.get('number'):
+            fortune_lines.append(f"🔢 幸运数字：{lucky_info['number']}")
+        
+        if lucky_info.get('noble_sign'):
+            fortune_lines.append(f"🤝 贵人星座：{lucky_info['noble_sign']}")
+        
+        return "\n".join(fortune_lines)
     
     def _extract_number(self, text):
         """从文本中提取数字"""
@@ -964,27 +1222,13 @@ class WeWorkBot:
             return int(numbers[0])
         return 0
 
-    def _get_fallback_constellation_structured(self, sign):
+    def _get_fallback_constellation_structured(self, sign_id, today=None):
         """获取备用星座运势结构化信息"""
-        constellation_names = {
-            'aries': '白羊座',
-            'taurus': '金牛座', 
-            'gemini': '双子座',
-            'cancer': '巨蟹座',
-            'leo': '狮子座',
-            'virgo': '处女座',
-            'libra': '天秤座',
-            'scorpio': '天蝎座',
-            'sagittarius': '射手座',
-            'capricorn': '摩羯座',
-            'aquarius': '水瓶座',
-            'pisces': '双鱼座'
-        }
-        
-        chinese_name = constellation_names.get(sign, sign)
-        today = datetime.now().strftime('%Y-%m-%d')
+        chinese_name = sign_name(sign_id)
+        today = today or datetime.now().strftime('%Y-%m-%d')
+        rng = self._seeded_rng('constellation', sign_id)
         
-        # 随机生成备用数据
+        # 随机生成备用数据（同一星座同一天结果一致）
         summaries = [
             '运势平稳，适合保持低调',
             '今天心情不错，做事比较顺利',
@@ -1004,94 +1248,69 @@ class WeWorkBot:
         ]
         
         fallback_data = {
+            'sign_id': sign_id,
             'sign': chinese_name,
             'date': today,
-            'summary': random.choice(summaries),
+            'summary': rng.choice(summaries),
             'indices': {
-                'comprehensive': random.randint(60, 90),
-                'love': random.randint(50, 95),
-                'work': random.randint(55, 88),
-                'money': random.randint(45, 85),
-                'health': random.randint(60, 92)
+                'comprehensive': rng.randint(60, 90),
+                'love': rng.randint(50, 95),
+                'work': rng.randint(55, 88),
+                'money': rng.randint(45, 85),
+                'health': rng.randint(60, 92)
             },
             'lucky_info': {
-                'color': random.choice(colors),
-                'number': random.choice(numbers),
-                'time': random.choice(times),
-                'noble_sign': random.choice(noble_signs)
+                'color': rng.choice(colors),
+                'number': rng.choice(numbers),
+                'time': rng.choice(times),
+                'noble_sign': rng.choice(noble_signs)
             },
-            'advice': random.choice(advices)
+            'advice': rng.choice(advices)
         }
         
         return fallback_data
 
-    def _get_fallback_constellation(self, sign):
-        """获取备用星座运势信息"""
-        constellation_names = {
-            'aries': '白羊座',
-            'taurus': '金牛座', 
-            'gemini': '双子座',
-            'cancer': '巨蟹座',
-            'leo': '狮子座',
-            'virgo': '处女座',
-            'libra': '天秤座',
-            'scorpio': '天蝎座',
-            'sagittarius': '射手座',
-            'capricorn': '摩羯座',
-            'aquarius': '水瓶座',
-            'pisces': '双鱼座'
-        }
+    def get_work_encouragement(self, current_weekday, rng=None):
+        """根据工作日获取哄用户上班的鼓励话语
         
-        chinese_name = constellation_names.get(sign, sign)
-        
-        fallback_fortunes = [
-            f"⭐ {chinese_name}今日运势\n📝 今日概述：运势平稳，适合保持低调\n💕 爱情运势：桃花运一般，单身的朋友继续等待\n💼 事业运势：工作顺利，但不宜冒进\n💰 财运：财运平平，适合理财\n🎨 幸运颜色：蓝色\n🔢 幸运数字：7",
-            f"⭐ {chinese_name}今日运势\n📝 今日概述：今天心情不错，做事比较顺利\n💕 爱情运势：有机会遇到心仪的人\n💼 事业运势：工作效率高，容易获得认可\n💰 财运：有小财进账的可能\n🎨 幸运颜色：红色\n🔢 幸运数字：3",
-            f"⭐ {chinese_name}今日运势\n📝 今日概述：需要多注意细节，避免出错\n💕 爱情运势：感情稳定，适合深入交流\n💼 事业运势：工作中可能遇到小挑战\n💰 财运：支出较多，注意控制消费\n🎨 幸运颜色：绿色\n🔢 幸运数字：5",
-            f"⭐ {chinese_name}今日运势\n📝 今日概述：整体运势不错，心情愉悦\n💕 爱情运势：适合表达情感，增进感情\n💼 事业运势：有新的机会出现\n💰 财运：投资运佳，可适当尝试\n🎨 幸运颜色：黄色\n🔢 幸运数字：8"
-        ]
-        
-        return random.choice(fallback_fortunes)
-
-    def get_work_encouragement(self, current_weekday):
-        """根据工作日生成哄用户上班的鼓励话语"""
-        # 优先使用大模型生成
+        优先从内容池取用大模型预生成的文案，池为空时使用固定文案。
+        rng 为可选的随机数发生器，用于选择备用文案
+        """
+        rng = rng or random
         if self.ark_api_key:
-            # 社畜黑色幽默风格的鼓励话语
-            encouragement_styles = [
-                f"请以一个资深社畜的第一人称视角，为{current_weekday}写一句带有黑色幽默的自嘲式上班鼓励语",
-                f"请模仿一个已经麻木但依然坚强的打工人，为{current_weekday}生成一句苦中作乐的上班感悟",
-                f"请以一个在职场摸爬滚打多年的老社畜口吻，为{current_weekday}写一句既丧又燃的工作箴言",
-                f"请模仿一个对工作又爱又恨的社畜，为{current_weekday}生成一句充满矛盾情感的上班独白",
-                f"请以一个习惯了996但依然保持幽默感的打工人身份，为{current_weekday}写一句自我安慰式的工作感言",
-                f"请模仿一个在格子间里求生存的社畜，为{current_weekday}生成一句带有生存智慧的上班心得",
-                f"请以一个经历过无数加班夜晚的老员工视角，为{current_weekday}写一句既现实又温暖的工作感悟",
-                f"请模仿一个在职场浮沉中找到平衡的社畜，为{current_weekday}生成一句充满人生哲理的上班语录",
-                f"请以一个对现状无奈但依然努力的打工人口吻，为{current_weekday}写一句自嘲中带着坚韧的工作宣言",
-                f"请模仿一个在都市生活压力下依然保持乐观的社畜，为{current_weekday}生成一句苦涩中带甜的上班感言"
-            ]
-            
-            style = random.choice(encouragement_styles)
-            prompt = f"""{style}。
-            
-要求：
-1. 必须使用第一人称来叙述
-2. 语调要有黑色幽默感，既丧又不失希望
-3. 体现社畜的真实心理状态和生存智慧
-4. 长度控制在2-3句话，要有画面感
-5. 可以适当自嘲，但要有积极的底色
-6. 结合{current_weekday}的特殊感受（如周一的绝望、周五的期待等）
-7. 语言要接地气，有共鸣感
-8. 适当使用emoji，但不要过多
-9. 可以提及咖啡、地铁等社畜日常元素
-
-请直接输出鼓励话语，不要解释。"""
-            
-            ai_encouragement = self.call_ark_api(prompt, max_tokens=100, temperature=0.95, top_p=0.9)
-            if ai_encouragement:
-                return ai_encouragement
+            content = self._draw_pool_content(('encouragement', current_weekday, ''))
+            if content:
+                return content
         
         # 降级到固定文案
+        return self._get_fallback_encouragement(current_weekday, rng)
+    
+    def _encouragement_style(self, current_weekday):
+        """随机选择鼓励话语的提示词风格"""
+        # 社畜黑色幽默风格的鼓励话语
+        encouragement_styles = [
+            f"请以一个资深社畜的第一人称视角，为{current_weekday}写一句带有黑色幽默的自嘲式上班鼓励语",
+            f"请模仿一个已经麻木但依然坚强的打工人，为{current_weekday}生成一句苦中作乐的上班感悟",
+            f"请以一个在职场摸爬滚打多年的老社畜口吻，为{current_weekday}写一句既丧又燃的工作箴言",
+            f"请模仿一个对工作又爱又恨的社畜，为{current_weekday}生成一句充满矛盾情感的上班独白",
+            f"请以一个习惯了996但依然保持幽默感的打工人身份，为{current_weekday}写一句自我安慰式的工作感言",
+            f"请模仿一个在格子间里求生存的社畜，为{current_weekday}生成一句带有生存智慧的上班心得",
+            f"请以一个经历过无数加班夜晚的老员工视角，为{current_weekday}写一句既现实又温暖的工作感悟",
+            f"请模仿一个在职场浮沉中找到平衡的社畜，为{current_weekday}生成一句充满人生哲理的上班语录",
+            f"请以一个对现状无奈但依然努力的打工人口吻，为{current_weekday}写一句自嘲中带着坚韧的工作宣言",
+            f"请模仿一个在都市生活压力下依然保持乐观的社畜，为{current_weekday}生成一句苦涩中带甜的上班感言"
+        ]
+        return random.choice(encouragement_styles)
+    
+    def _generate_encouragement(self, current_weekday):
+        """调用大模型生成一条鼓励话语（供内容池后台填充）"""
+        prompt = f"{self._encouragement_style(current_weekday)}。"
+        return self._timed_ark_call('encouragement', prompt, max_tokens=100, temperature=0.95, top_p=0.9,
+                                    prefix=ENCOURAGEMENT_PROMPT_PREFIX)
+    
+    def _get_fallback_encouragement(self, current_weekday, rng=None):
+        """获取备用上班鼓励话语"""
+        rng = rng or random
         encouragements = {
             '周一': [
                 "新的一周开始啦！虽然有点困，但是想想周末的美好，今天也要元气满满哦~ 💪",
@@ -1124,130 +1343,306 @@ class WeWorkBot:
             "今天也要加油哦！每一天都是新的开始~ ✨"
         ])
         
-        return random.choice(weekday_encouragements)
+        return rng.choice(weekday_encouragements)
     
-    def get_lunch_recommendation(self, weather_info):
-        """根据天气推荐午餐"""
-        # 优先使用大模型生成
+    def get_lunch_recommendation(self, weather_info, rng=None):
+        """根据天气推荐午餐
+        
+        优先从内容池取用按天气类别预生成的推荐，池为空时使用固定文案。
+        rng 为可选的随机数发生器，用于选择备用文案
+        """
+        rng = rng or random
         if self.ark_api_key:
-            # 外卖达人推荐风格
-            recommendation_styles = [
-                f"请以资深外卖达人的丰富经验，根据天气'{weather_info}'推荐一款适合的外卖",
-                f"请模仿外卖评测专家的专业眼光，结合天气'{weather_info}'推荐一份性价比超高的外卖",
-                f"请以外卖老司机的身份，根据天气'{weather_info}'推荐一款口碑爆棚的外卖",
-                f"请模仿美食博主的推荐风格，结合天气'{weather_info}'推荐一份网红外卖",
-                f"请以外卖平台金牌用户的角度，根据天气'{weather_info}'推荐一款必点外卖",
-                f"请模仿外卖探店达人的口吻，结合天气'{weather_info}'推荐一份隐藏好店的外卖",
-                f"请以外卖重度用户的经验，根据天气'{weather_info}'推荐一款治愈系外卖",
-                f"请模仿外卖种草机的风格，结合天气'{weather_info}'推荐一份让人欲罢不能的外卖",
-                f"请以外卖品鉴师的专业态度，根据天气'{weather_info}'推荐一款品质上乘的外卖",
-                f"请模仿外卖攻略达人的推荐方式，结合天气'{weather_info}'推荐一份超值外卖套餐",
-                f"请以外卖美食家的品味，根据天气'{weather_info}'推荐一款精选外卖",
-                f"请模仿外卖测评师的客观视角，结合天气'{weather_info}'推荐一份值得回购的外卖"
-            ]
-            
-            style = random.choice(recommendation_styles)
-            prompt = f"""{style}。
-            
-要求：
-1. 语言要接地气，像真正的外卖达人在分享经验
-2. 推荐具体的外卖店铺类型或菜品类别
-3. 解释为什么这个外卖选择适合当前天气
-4. 可以提及配送时间、性价比、口味特点等实用信息
-5. 体现对外卖平台和商家的了解
-6. 包含一些外卖小贴士或避坑指南
-7. 长度控制在2-3句话，要实用有趣
-8. 语调要亲切自然，像朋友推荐
-9. 可以提及外卖平台活动、优惠券等实用信息
-10. 使用网络流行语，但要适度
-11. 要有外卖老用户的实战经验感
-12. 适当使用emoji，营造轻松氛围
-
-请直接输出推荐内容，不要解释。"""
-            
-            ai_recommendation = self.call_ark_api(prompt, max_tokens=150, temperature=0.95, top_p=0.9)
-            if ai_recommendation:
-                return ai_recommendation
+            content = self._draw_pool_content(('lunch', '', self._weather_category(weather_info)))
+            if content:
+                return content
         
         # 降级到固定外卖推荐文案
+        return self._get_fallback_lunch(weather_info, rng)
+    
+    def _lunch_style(self, weather_category):
+        """随机选择午餐推荐的提示词风格"""
+        weather_info = WEATHER_CATEGORY_LABELS.get(weather_category, '普通天气')
+        # 外卖达人推荐风格
+        recommendation_styles = [
+            f"请以资深外卖达人的丰富经验，根据天气'{weather_info}'推荐一款适合的外卖",
+            f"请模仿外卖评测专家的专业眼光，结合天气'{weather_info}'推荐一份性价比超高的外卖",
+            f"请以外卖老司机的身份，根据天气'{weather_info}'推荐一款口碑爆棚的外卖",
+            f"请模仿美食博主的推荐风格，结合天气'{weather_info}'推荐一份网红外卖",
+            f"请以外卖平台金牌用户的角度，根据天气'{weather_info}'推荐一款必点外卖",
+            f"请模仿外卖探店达人的口吻，结合天气'{weather_info}'推荐一份隐藏好店的外卖",
+            f"请以外卖重度用户的经验，根据天气'{weather_info}'推荐一款治愈系外卖",
+            f"请模仿外卖种草机的风格，结合天气'{weather_info}'推荐一份让人欲罢不能的外卖",
+            f"请以外卖品鉴师的专业态度，根据天气'{weather_info}'推荐一款品质上乘的外卖",
+            f"请模仿外卖攻略达人的推荐方式，结合天气'{weather_info}'推荐一份超值外卖套餐",
+            f"请以外卖美食家的品味，根据天气'{weather_info}'推荐一款精选外卖",
+            f"请模仿外卖测评师的客观视角，结合天气'{weather_info}'推荐一份值得回购的外卖"
+        ]
+        return random.choice(recommendation_styles)
+    
+    def _generate_lunch(self, weather_category):
+        """调用大模型按天气类别生成一条午餐推荐（供内容池后台填充）"""
+        prompt = f"{self._lunch_style(weather_category)}。"
+        return self._timed_ark_call('lunch', prompt, max_tokens=150, temperature=0.95, top_p=0.9,
+                                    prefix=LUNCH_PROMPT_PREFIX)
+    
+    def _generate_combined(self, current_weekday, weather_category):
+        """一次大模型调用同时生成鼓励话语和午餐推荐
+        
+        要求模型输出JSON对象，严格解析并校验长度，不合格的字段为 None。
+        返回 {'encouragement': 文本或 None, 'lunch': 文本或 None}
+        """
+        prompt = f"""- encouragement：{self._encouragement_style(current_weekday)}
+- lunch：{self._lunch_style(weather_category)}"""
+        
+        # 截断的JSON无法解析，超出时间预算时直接放弃
+        content = self._timed_ark_call('combined', prompt, max_tokens=300, temperature=0.95, top_p=0.9,
+                                       on_deadline='fallback', prefix=COMBINED_PROMPT_PREFIX)
+        return parse_json_sections(content, SECTION_LENGTH_LIMITS)
+    
+    def _weather_category(self, weather_info):
+        """将天气描述归类为 sunny/rainy/cloudy/windy/other"""
+        weather_info = weather_info or ''
         if '晴' in weather_info or '阳光' in weather_info:
-            recommendations = [
+            return 'sunny'
+        if '雨' in weather_info:
+            return 'rainy'
+        if '阴' in weather_info or '云' in weather_info:
+            return 'cloudy'
+        if '风' in weather_info:
+            return 'windy'
+        return 'other'
+    
+    def _generate_pool_content(self, key):
+        """内容池生成函数，key 为 (内容类型, 星期, 天气类别)
+        
+        合并生成模式下一次调用同时生成鼓励话语和午餐推荐：
+        请求的分组直接返回，另一段放入对应分组（星期取今天，天气类别取当前城市天气）。
+        请求的字段解析失败时单独重新生成该字段。
+        """
+        content_type, weekday, weather_category = key
+        if self.ark_combined:
+            weekday = weekday or self._current_weekday()
+            weather_category = weather_category or self._current_weather_category()
+            sections = self._generate_combined(weekday, weather_category)
+            pool_keys = {
+                'encouragement': ('encouragement', weekday, ''),
+                'lunch': ('lunch', '', weather_category)
+            }
+            for field, text in sections.items():
+                if field != content_type and text:
+                    self.content_pool.offer(pool_keys[field], text)
+            if sections.get(content_type):
+                return sections[content_type]
+        
+        if content_type == 'encouragement':
+            return self._generate_encouragement(weekday)
+        if content_type == 'lunch':
+            return self._generate_lunch(weather_category)
+        return None
+    
+    def _current_weekday(self):
+        """获取今天的星期名称（北京时间）"""
+        weekdays = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+        return weekdays[datetime.now(pytz.timezone('Asia/Shanghai')).weekday()]
+    
+    def _current_weather_category(self):
+        """获取当前城市已缓存天气的类别，无缓存时为 other"""
+        return self._weather_category(self._get_cache(f"weather_{self.city}"))
+    
+    def _timed_ark_call(self, mode, prompt, **kwargs):
+        """经模型路由调用大模型，并按生成模式记录首token耗时、总耗时和token用量"""
+        result = self.ark_router.complete(prompt, content_type=mode, **kwargs)
+        self.generation_stats.record(mode, result.elapsed_ms, result.usage, success=bool(result.content),
+                                     ttft_ms=result.ttft_ms, truncated=result.truncated)
+        return result.content
+    
+    def _warm_content_pool(self):
+        """后台预热今天的鼓励话语和各天气类别的午餐推荐（启动、日期变化和预生成时调用）"""
+        self._content_pool_date = self._today()
+        keys = [('encouragement', self._current_weekday(), '')]
+        keys += [('lunch', '', category) for category in WEATHER_CATEGORY_LABELS]
+        self.content_pool.warm(keys)
+    
+    def _draw_pool_content(self, key):
+        """从内容池取用一条文案
+        
+        日期变化后先预热今天的分组；分组为空且正在补充时等待补充出第一条，
+        最多等待 content_pool_warm_wait 秒（不超过请求剩余的时间预算）
+        """
+        if self._content_pool_date != self._today():
+            self._warm_content_pool()
+        if not self.content_pool.available(key):
+            self.content_pool.wait([key], timeout=bound_timeout(self.content_pool_warm_wait))
+        return self.content_pool.draw(key)
+    
+    def _get_fallback_lunch(self, weather_info, rng=None):
+        """获取备用午餐推荐"""
+        rng = rng or random
+        fallback_lunches = {
+            'sunny': [
                 "晴天外卖推荐：轻食沙拉、日式便当，记得点杯冰饮 🍱❄️",
                 "阳光明媚适合点烤肉外卖，配个气泡水超爽！ 🍖🥤",
                 "好天气点个网红寿司外卖，颜值味道都在线 🍣✨"
-            ]
-        elif '雨' in weather_info:
-            recommendations = [
+            ],
+            'rainy': [
                 "下雨天外卖首选：麻辣烫、小火锅，暖胃又暖心 🍜☔",
                 "雨天点个粥店外卖，热腾腾的很治愈 🍲💕",
                 "下雨天就要川菜外卖，辣到出汗忘记阴冷 🌶️🔥"
-            ]
-        elif '阴' in weather_info or '云' in weather_info:
-            recommendations = [
+            ],
+            'cloudy': [
                 "阴天外卖推荐：中式快餐，红烧肉盖饭yyds 🥘",
                 "多云天气点个炒饭外卖，简单满足 🍚😋",
                 "阴天来份温和系外卖：蒸蛋羹、小馄饨很舒服 🥟💛"
-            ]
-        elif '风' in weather_info:
-            recommendations = [
+            ],
+            'windy': [
                 "大风天外卖要选饱腹系：汉堡、炸鸡，管饱管爽 🍔💪",
                 "风大点个包子店外卖，热乎乎的最暖胃 🥟🌪️",
                 "刮风天来份重口味外卖：麻辣香锅、水煮鱼片 🐟🌶️"
-            ]
-        else:
-            recommendations = [
+            ],
+            'other': [
                 "今天外卖盲盒：闭眼点个评分高的，惊喜等你 🍱🎲",
                 "不知道点啥外卖？看看昨天收藏夹里的店 🤷📱",
                 "外卖推荐：跟着热销榜走，踩雷概率小 📈✨"
             ]
+        }
+        recommendations = fallback_lunches[self._weather_category(weather_info)]
         
-        return random.choice(recommendations)
+        return rng.choice(recommendations)
+    
+    def _city_section(self, name, city):
+        """按城市区分的分段名称：默认城市为 weather/lunch，其他城市为 weather:城市"""
+        return name if city == self.city else f"{name}:{city}"
+    
+    def _daily_sections(self, current_weekday, tenants=None):
+        """每日消息的分段定义（仅午餐推荐依赖天气）
+        
+        按群配置规划：每个需要天气的城市一组天气和午餐推荐分段，老黄历和鼓励话语只在有群需要时生成一次。
+        各分段的随机选择使用按日期和分段名确定的随机数发生器，备用内容可复现
+        """
+        tenants = tenants or self.tenants
+        timeouts = self.section_timeouts
+        
+        def rng(name):
+            return self._seeded_rng('daily', name)
+        
+        sections = []
+        if tenants.needs('fortune'):
+            sections.append(Section('fortune', lambda deps: self.get_today_fortune(),
+                                    timeout=timeouts['fortune'],
+                                    fallback=lambda deps: self._get_fallback_fortune(rng('fortune'))))
+        if tenants.needs('encouragement'):
+            sections.append(Section('encouragement',
+                                    lambda deps: self.get_work_encouragement(current_weekday, rng('encouragement')),
+                                    timeout=timeouts['encouragement'],
+                                    fallback=lambda deps: self._get_fallback_encouragement(current_weekday,
+                                                                                             rng('encouragement'))))
+        for city in tenants.cities():
+            weather, lunch = self._city_section('weather', city), self._city_section('lunch', city)
+            sections += [
+                Section(weather, lambda deps, city=city: self.get_weather_info(city),
+                        timeout=timeouts['weather'],
+                        fallback=lambda deps: "今日天气：阳光明媚，适合上班摸鱼 ☀️"),
+                Section(lunch, lambda deps, weather=weather, lunch=lunch: self.get_lunch_recommendation(deps[weather],
+                                                                                                      rng(lunch)),
+                        depends_on=[weather],
+                        timeout=timeouts['lunch'],
+                        fallback=lambda deps, weather=weather, lunch=lunch: self._get_fallback_lunch(deps.get(weather),
+                                                                                                   rng(lunch)))
+            ]
+        return sections
     
-    def generate_daily_message(self):
-        """生成每日推送消息"""
+    def _render_daily_message(self, tenant, sections):
+        """按群选择的分段组合每日消息"""
+        parts = []
+        if 'encouragement' in tenant.sections:
+            parts.append(f"💼 {sections['encouragement']}")
+        if 'fortune' in tenant.sections:
+            parts.append(f"""🔮 今日运势（<a href="{os.getenv('FORTUNE_LINK_URL', 'http://localhost:5000')}">查看详情</a>）
+{sections['fortune']}""")
+        if 'weather' in tenant.sections:
+            parts.append(f"🌤️ {sections[self._city_section('weather', tenant.city)]}")
+        if 'lunch' in tenant.sections:
+            parts.append(f"🍽️ 午餐推荐：{sections[self._city_section('lunch', tenant.city)]}")
+        parts.append("祝大家今天也要开心摸鱼哦~ 🐟✨")
+        return '\n\n'.join(parts)
+    
+    def build_daily_messages(self):
+        """生成所有群的每日推送消息及各分段耗时明细
+        
+        各城市的天气、老黄历和鼓励话语并发获取且只获取一次，再按群组合消息。
+        返回 ({群名称: 消息内容}, 耗时明细)，当天不推送的群（默认周末不推送，见 TenantProfile.weekends）消息内容为 None
+        """
         try:
             # 获取当前时间
             now = datetime.now(pytz.timezone('Asia/Shanghai'))
-            date_str = now.strftime('%Y年%m月%d日')
             
             # 获取当前星期
             weekdays = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
             current_weekday = weekdays[now.weekday()]
             
-            # 检查是否为工作日（周一到周五）
-            if now.weekday() >= 5:  # 周六(5)和周日(6)
-                return None  # 非工作日不推送
-            
-            # 获取天气信息
-            weather_info = self.get_weather_info()
-            
-            # 获取今日运势
-            today_fortune = self.get_today_fortune()
+            # 按各群的配置筛选今天推送的群（默认只在工作日推送）
+            active = self.tenants.active_on(now.weekday())
+            if active is None:
+                return {tenant.name: None for tenant in self.tenants}, {}  # 今天没有群推送
             
-            # 获取午餐推荐
-            lunch_recommendation = self.get_lunch_recommendation(weather_info)
+            # 并发获取天气、运势、鼓励话语，午餐推荐等待对应城市的天气完成后执行（只获取今天推送的群需要的分段）
+            sections, timings = self.pipeline.run(self._daily_sections(current_weekday, active))
             
+            # 按群组合消息
+            messages = {tenant.name: self._render_daily_message(tenant, sections) if tenant.pushes_on(now.weekday())
+                        else None for tenant in self.tenants}
             
-            # 根据工作日生成哄用户上班的话语
-            work_encouragement = self.get_work_encouragement(current_weekday)
-            
-            # 组合消息
-            message = f"""💼 {work_encouragement}
-
-🔮 今日运势（<a href="{os.getenv('FORTUNE_LINK_URL', 'http://localhost:5000')}">查看详情</a>）
-{today_fortune}
-
-🌤️ {weather_info}
-
-🍽️ 午餐推荐：{lunch_recommendation}
-
-祝大家今天也要开心摸鱼哦~ 🐟✨"""
-            
-            return message
+            logger.info(f"每日消息生成完成（{len(messages)}个群），总耗时 {timings['_total']['elapsed_ms']}ms")
+            return messages, timings
             
         except Exception as e:
             logger.error(f"生成每日消息失败: {str(e)}")
-            return "今日播报生成失败，但不影响大家继续摸鱼！ 🐟"
+            return {tenant.name: "今日播报生成失败，但不影响大家继续摸鱼！ 🐟" for tenant in self.tenants}, {}
+    
+    def get_daily_snapshot(self, with_freshness=False):
+        """获取今日每日消息快照，不存在时生成
+        
+        快照按日期缓存（启用 CACHE_DIR 时多个worker共享），预览和发送读取同一份内容，
+        并发请求只生成一次。快照包含 date、messages（各群的消息）、message（主群的消息，非工作日为 None）、
+        timings、generated_at。
+        with_freshness 为 True 时返回 (快照, 新鲜度)
+        """
+        today = self._today()
+        snapshot, freshness = self._lookup(f"daily_message_{today}", 'daily_message',
+                                           lambda: self._render_daily_snapshot(today), family='daily_message')
+        return (snapshot, freshness) if with_freshness else snapshot
+    
+    def _render_daily_snapshot(self, today):
+        """生成每日消息快照
+        
+        整体生成失败，或有分段超时/出错而使用了备用内容时，作为降级数据短时间缓存并在后台重新生成，
+        避免备用内容作为当天的权威快照被预览和推送
+        """
+        messages, timings = self.build_daily_messages()
+        message = messages[self.tenants.primary.name]
+        snapshot = {
+            'date': today,
+            'message': message,
+            'messages': messages,
+            'timings': timings,
+            'generated_at': datetime.now(pytz.timezone('Asia/Shanghai')).isoformat()
+        }
+        if any(text is not None for text in messages.values()) and (not timings or any(
+                timing.get('status') != 'ok' for name, timing in timings.items() if name != '_total')):
+            return Degraded(snapshot)
+        return snapshot
+    
+    def invalidate_daily_snapshot(self, date=None):
+        """删除指定日期（默认今天）的每日消息快照"""
+        date = date or self._today()
+        self.cache.delete(f"daily_message_{date}")
+        logger.info(f"已删除每日消息快照: {date}")
+    
+    def regenerate_daily_snapshot(self):
+        """重新生成今日每日消息快照"""
+        self.invalidate_daily_snapshot()
+        return self.get_daily_snapshot()
     
     def _sanitize_message(self, message):
         """清理和验证消息内容"""
@@ -1272,52 +1667,131 @@ class WeWorkBot:
         
         return message
     
-    def send_message(self, content):
-        """发送消息到企业微信群"""
+    def _deliver_webhook(self, webhook_url, data):
+        """向企业微信webhook发送一次（由发送队列调用），返回响应JSON
+        
+        网络异常和5xx响应抛出 requests 异常，由发送队列退避重试
+        """
+        response = self.http.post(webhook_url, json=data)
+        if response.status_code >= 500:
+            response.raise_for_status()
+        if response.status_code != 200:
+            return {'errcode': response.status_code, 'errmsg': f"HTTP {response.status_code}"}
+        return response.json()
+    
+    def enqueue_message(self, content, message_id=None):
+        """消息加入发送队列，立即返回任务状态（job_id、state等）；未配置webhook时返回 None
+        
+        指定 message_id 时按ID去重：同一ID已在发送或已送达时不再重复发送
+        """
         if not self.webhook_url:
             logger.error("Webhook URL 未配置")
-            return False
+            return None
         
         # 清理和验证消息
-        sanitized_content = self._sanitize_message(content)
-            
-        try:
-            data = {
-                "msgtype": "text",
-                "text": {
-                    "content": sanitized_content
-                }
+        data = {
+            "msgtype": "text",
+            "text": {
+                "content": self._sanitize_message(content)
             }
-            
-            response = self._retry_request(requests.post, self.webhook_url, json=data, timeout=10)
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('errcode') == 0:
-                    logger.info("消息发送成功")
-                    return True
-                else:
-                    logger.error(f"消息发送失败: {result}")
-            else:
-                logger.error(f"HTTP请求失败: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"发送消息异常: {str(e)}")
-            
-        return False
+        }
+        return self.outbox.submit(self.webhook_url, data, message_id=message_id)
+    
+    def broadcast_message(self, content, message_id=None, targets=None):
+        """同一条消息加入所有广播目标（默认 webhook_targets）的发送队列，返回各目标的任务状态列表
+        
+        消息只清理一次；各目标独立限流和重试。指定 message_id 时每个目标的消息ID为 message_id@目标标识
+        """
+        targets = self.webhook_targets if targets is None else targets
+        if not targets:
+            logger.error("Webhook URL 未配置")
+            return []
+        
+        data = {
+            "msgtype": "text",
+            "text": {
+                "content": self._sanitize_message(content)
+            }
+        }
+        return [
+            self.outbox.submit(url, data, message_id=f"{message_id}@{webhook_id(url)}" if message_id else None)
+            for url in targets
+        ]
     
-    def send_daily_message(self):
-        """发送每日消息"""
+    def prerender_daily_message(self):
+        """预生成今日每日消息快照，发送时直接使用，避免推送时再等待ARK和天气等上游
+        
+        已有快照（如已预览过）时保留，保证发送内容与预览一致；已有快照为降级数据时重新生成。
+        生成前预热今天的内容池分组
+        """
+        if self.ark_api_key:
+            self._warm_content_pool()
+        snapshot, freshness = self.get_daily_snapshot(with_freshness=True)
+        if freshness['degraded']:
+            logger.info("今日快照为降级数据，预生成时重新生成")
+            snapshot = self.regenerate_daily_snapshot()
+        logger.info(f"每日消息预生成完成: {snapshot['date']}")
+        return snapshot['message']
+    
+    def get_daily_messages(self, tenants=None, with_freshness=False):
+        """获取今日快照中指定群（默认全部）的消息 {群名称: 消息内容}
+        
+        快照中缺少某个群（如当天修改了群配置）时重新生成快照。with_freshness 为 True 时另返回快照和新鲜度
+        """
+        profiles = self.tenants.select(tenants)
+        snapshot, freshness = self.get_daily_snapshot(with_freshness=True)
+        messages = snapshot.get('messages') or {self.tenants.primary.name: snapshot['message']}
+        if any(profile.name not in messages for profile in profiles):
+            logger.warning("今日快照缺少部分群的消息，重新生成")
+            self.invalidate_daily_snapshot()
+            snapshot, freshness = self.get_daily_snapshot(with_freshness=True)
+            messages = snapshot['messages']
+        messages = {profile.name: messages[profile.name] for profile in profiles}
+        return (messages, snapshot, freshness) if with_freshness else messages
+    
+    def send_daily_message(self, wait=True, message_id=None, tenants=None):
+        """发送每日消息（读取今日快照，已预生成时只需发送）
+        
+        所有群的消息在快照中一次生成（相同城市的天气和老黄历只获取一次），再发送到各群的机器人，
+        各群并发发送、独立限流和重试。tenants 为群名称列表（默认全部群）。
+        消息ID默认为 daily-日期：同一天重复触发（定时任务补发、外部cron重跑）只发送一次，
+        需要再次发送时指定其他 message_id。各群的消息ID为 消息ID:群名称，共用同一个机器人的多个群各自发送。
+        返回发送结果字典：success、skipped（非工作日跳过）、prerendered（是否使用已生成的快照）、
+        timings（各分段耗时）、message_id、jobs（各群机器人的任务状态，附 tenant 群名称）；wait 为 True 时等待全部送达，
+        success 表示所有群都已送达，为 False 时只加入发送队列，success 表示入队成功
+        """
         logger.info("开始发送每日消息")
-        message = self.generate_daily_message()
-        if message is None:
+        messages, snapshot, freshness = self.get_daily_messages(tenants, with_freshness=True)
+        timings = snapshot['timings']
+        prerendered = freshness['state'] == 'fresh'
+        if all(message is None for message in messages.values()):
             logger.info("今天是周末，跳过消息推送")
-            return
-        success = self.send_message(message)
-        if success:
-            logger.info("每日消息发送成功")
+            return {'success': True, 'skipped': True, 'prerendered': prerendered, 'timings': timings}
+        
+        message_id = message_id or f"daily-{snapshot['date']}"
+        jobs = []
+        for profile in self.tenants.select(list(messages)):
+            if messages[profile.name] is None or not profile.webhooks:
+                continue
+            jobs += [dict(job, tenant=profile.name)
+                     for job in self.broadcast_message(messages[profile.name], f"{message_id}:{profile.name}",
+                                                       targets=profile.webhooks)]
+        if not jobs:
+            logger.error("Webhook URL 未配置")
+        result = {'success': bool(jobs), 'skipped': False, 'prerendered': prerendered, 'timings': timings,
+                  'message_id': message_id, 'jobs': jobs}
+        if not wait or not jobs:
+            return result
+        
+        tenant_of = {job['job_id']: job['tenant'] for job in jobs}
+        jobs = [dict(job, tenant=tenant_of[job['job_id']])
+                for job in self.outbox.as_completed(list(tenant_of), timeout=self.webhook_send_timeout)]
+        delivered = sum(1 for job in jobs if job['state'] == 'delivered')
+        if delivered == len(jobs):
+            logger.info(f"每日消息发送成功（{delivered}个群机器人）")
         else:
-            logger.error("每日消息发送失败")
+            logger.error(f"每日消息发送失败: {len(jobs) - delivered}/{len(jobs)} 个群机器人未送达")
+        return dict(result, success=delivered == len(jobs), jobs=jobs)
 
 
 # 创建机器人实例